@@ -25,6 +25,9 @@ from tank import Hook
 
 class ContextAdditionalEntities(Hook):
 
+    # the entity types don't change so the result can be cached by the core API
+    cacheable_methods = {"execute": None}
+
     def execute(self, **kwargs):
         """
         The default implementation does not do anything.
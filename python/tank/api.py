@@ -13,7 +13,6 @@ Classes for the main Sgtk API.
 
 """
 import os
-import glob
 import threading
 
 from tank_vendor import yaml
@@ -21,9 +20,13 @@ from tank_vendor import yaml
 from . import folder
 from . import context
 from .util import shotgun
+from .util import parallel_glob
+from .util.lru_cache import LRUCache
+from .hook import HookResultsCache
 from .errors import TankError
 from .path_cache import PathCache
-from .template import read_templates
+from .sequence_scanner import SequenceScanner
+from .template import read_templates, TemplateIndex, TemplatePath
 from .platform import constants as platform_constants
 from . import pipelineconfig
 from . import pipelineconfig_utils
@@ -55,6 +58,13 @@ class Tank(object):
             self.templates = read_templates(self.__pipeline_config)
         except TankError, e:
             raise TankError("Could not read templates configuration: %s" % e)
+        self.__template_index = TemplateIndex(self.templates)
+
+        # contexts resolved from paths, see context.from_path
+        self.__context_cache = LRUCache(platform_constants.CONTEXT_FROM_PATH_CACHE_SIZE)
+
+        # results of the core hooks which can be cached, see _execute_cacheable_core_hook
+        self.__hook_results = HookResultsCache()
 
         # execute a tank_init hook for developers to use.
         self.execute_core_hook(platform_constants.TANK_INIT_HOOK_NAME)
@@ -86,10 +96,42 @@ class Tank(object):
         will be backwards compatible.        
         """
         try:
-            self.templates = read_templates(self.__pipeline_config)
+            templates = read_templates(self.__pipeline_config)
         except TankError, e:
             raise TankError("Templates could not be reloaded: %s" % e)
 
+        # the previous templates may still be referenced elsewhere so make sure
+        # they don't hold on to fields found with the old definitions:
+        for template in self.templates.values():
+            template.clear_cache()
+        self.templates = templates
+        self.__template_index = TemplateIndex(self.templates)
+
+    def _get_template_index(self):
+        """
+        Returns the index used to quickly look up templates from paths. The index is
+        rebuilt if the templates dictionary has been modified since it was created.
+
+        Internal Use Only - We provide no guarantees that this method
+        will be backwards compatible.
+
+        :returns: TemplateIndex instance
+        """
+        if not self.__template_index.is_up_to_date(self.templates):
+            self.__template_index = TemplateIndex(self.templates)
+        return self.__template_index
+
+    def _get_context_cache(self):
+        """
+        Returns the cache of the contexts resolved from paths by this instance.
+
+        Internal Use Only - We provide no guarantees that this method
+        will be backwards compatible.
+
+        :returns: LRUCache instance
+        """
+        return self.__context_cache
+
     def execute_core_hook(self, hook_name, **kwargs):
         """
         Executes a core level hook, passing it any keyword arguments supplied.
@@ -101,7 +143,7 @@ class Tank(object):
         :param **kwargs:  Additional named parameters will be passed to the hook.
         :returns:         Return value of the hook.
         """
-        return self.pipeline_configuration.execute_core_hook_internal(hook_name, parent=self, **kwargs)
+        return self._execute_cacheable_core_hook(hook_name, None, kwargs)
 
     # compatibility alias - previously the name of this *internal method* was named execute_hook.
     # in order to try to avoid breaking client code that uses these *internal methods*, let's
@@ -121,10 +163,42 @@ class Tank(object):
         :param **kwargs:    Additional named parameters will be passed to the hook.
         :returns:           Return value of the hook.
         """
-        return self.pipeline_configuration.execute_core_hook_method_internal(hook_name, 
-                                                                             method_name, 
-                                                                             parent=self, 
-                                                                             **kwargs)
+        return self._execute_cacheable_core_hook(hook_name, method_name, kwargs)
+
+    def _execute_cacheable_core_hook(self, hook_name, method_name, kwargs):
+        """
+        Executes a core hook, reusing a previous result of the hook for the same
+        arguments if the hook has been declared cacheable, see 
+        PipelineConfiguration.get_core_hook_cache_ttl.
+
+        :param hook_name:   Name of hook to execute.
+        :param method_name: Name of method to execute or None for an old style hook.
+        :param kwargs:      Dictionary of named parameters to pass to the hook.
+        :returns:           Return value of the hook.
+        """
+        pc = self.pipeline_configuration
+        (cacheable, ttl) = pc.get_core_hook_cache_ttl(hook_name, method_name)
+
+        key = None
+        if cacheable:
+            key = (hook_name, method_name, tuple(sorted(kwargs.iteritems())))
+            try:
+                (found, result) = self.__hook_results.get(key)
+            except TypeError:
+                # the arguments can't be used as a key
+                key = None
+            else:
+                if found:
+                    return result
+
+        if method_name is None:
+            result = pc.execute_core_hook_internal(hook_name, parent=self, **kwargs)
+        else:
+            result = pc.execute_core_hook_method_internal(hook_name, method_name, parent=self, **kwargs)
+
+        if key is not None:
+            self.__hook_results.set(key, result, ttl)
+        return result
 
     ################################################################################################
     # properties
@@ -273,7 +347,8 @@ class Tank(object):
         :rtype: Template instance or None
         """
         matched_templates = []
-        for key, template in self.templates.items():
+        # only validate the templates that could potentially match the path
+        for template in self._get_template_index().get_candidates(path):
             if template.validate(path):
                 matched_templates.append(template)
 
@@ -287,12 +362,71 @@ class Tank(object):
             matched_fields = []
             for template in matched_templates:
                 matched_fields.append(template.get_fields(path))
-
-            msg = "%d templates are matching the path '%s'.\n" % (len(matched_templates), path)
-            msg += "The overlapping templates are:\n"
-            for fields, template in zip(matched_fields, matched_templates):
-                msg += "%s\n%s\n" % (template, fields)
-            raise TankError(msg)
+            raise TankError(self.__get_ambiguous_templates_msg(path, matched_templates, matched_fields))
+
+    def templates_from_paths(self, paths):
+        """Finds the templates that match a list of input paths.
+
+        This is equivalent to calling template_from_path() for each path but is
+        a lot more efficient when classifying large numbers of paths, for example
+        all the files returned by paths_from_template(). Paths sharing the same
+        parent directory are processed together so that the work needed to find
+        the templates for a directory is only done once.
+
+        :param paths: paths against which to match templates.
+        :type  paths: list of string representations of paths
+
+        :returns: Dictionary keyed by path containing a tuple with the template
+                  matching the path and the fields extracted from the path, or None
+                  if no template matches the path.
+        :rtype: Dictionary
+        """
+        # group the paths by the templates that could potentially match them:
+        candidates = self._get_template_index().get_candidates_batch(paths)
+        paths_by_template = {}
+        template_order = []
+        for path, templates in candidates.iteritems():
+            for template in templates:
+                if template not in paths_by_template:
+                    paths_by_template[template] = []
+                    template_order.append(template)
+                paths_by_template[template].append(path)
+
+        # and validate all paths for each template in one go:
+        matches = dict((path, []) for path in candidates)
+        for template in template_order:
+            fields_by_path = template.get_fields_batch(paths_by_template[template])
+            for path, fields in fields_by_path.iteritems():
+                if fields is not None:
+                    matches[path].append((template, fields))
+
+        results = {}
+        for path, matched in matches.iteritems():
+            if len(matched) == 0:
+                results[path] = None
+            elif len(matched) == 1:
+                results[path] = matched[0]
+            else:
+                # ambiguity!
+                matched_templates = [template for template, _ in matched]
+                matched_fields = [fields for _, fields in matched]
+                raise TankError(self.__get_ambiguous_templates_msg(path, matched_templates, matched_fields))
+        return results
+
+    def __get_ambiguous_templates_msg(self, path, matched_templates, matched_fields):
+        """
+        Builds the error message reported when more than one template matches a path.
+
+        :param path: Path matched by the templates
+        :param matched_templates: List of templates matching the path
+        :param matched_fields: List of fields found in the path by each template
+        :returns: Error message
+        """
+        msg = "%d templates are matching the path '%s'.\n" % (len(matched_templates), path)
+        msg += "The overlapping templates are:\n"
+        for fields, template in zip(matched_fields, matched_templates):
+            msg += "%s\n%s\n" % (template, fields)
+        return msg
 
     def paths_from_template(self, template, fields, skip_keys=None, skip_missing_optional_keys=False):
         """
@@ -325,6 +459,64 @@ class Tank(object):
         :returns: Matching file paths
         :rtype: List of strings.
         """
+        return list(self.iter_paths_from_template(template, 
+                                                  fields, 
+                                                  skip_keys=skip_keys, 
+                                                  skip_missing_optional_keys=skip_missing_optional_keys))
+
+    def iter_paths_from_template(self, template, fields, skip_keys=None, skip_missing_optional_keys=False, 
+                                 limit=None):
+        """
+        Finds paths that match a template using field values passed.
+
+        This is the same as paths_from_template except that the paths are yielded as
+        soon as they are found on disk rather than being returned once the search
+        is complete. This makes it possible to start processing the paths while the
+        search continues, or to stop the search early.
+
+        :param template: Template against whom to match.
+        :type  template: Tank.Template instance.
+        :param fields: Fields and values to use.
+        :type  fields: Dictionary.
+        :param skip_keys: Keys whose values should be ignored from the fields parameter.
+        :type  skip_keys: List of key names.
+        :param skip_missing_optional_keys: Specify if optional keys should be skipped if they 
+                                        aren't found in the fields collection
+        :type skip_missing_optional_keys: Boolean
+        :param limit: Optional maximum number of paths to return. The search stops
+                      as soon as this number of paths has been found.
+        :type limit: Integer
+
+        :returns: Iterator yielding matching file paths, in no particular order.
+        """
+        if limit is not None and limit <= 0:
+            return
+
+        found_files = self.__iter_template_glob_matches(template, fields, skip_keys, skip_missing_optional_keys)
+
+        # Find all files which are valid for the template. Note that if the caller stops 
+        # iterating, the search is stopped when found_files is released.
+        num_found = 0
+        for found_file in found_files:
+            if template.validate(found_file):
+                yield found_file
+                num_found += 1
+                if num_found == limit:
+                    break
+
+
+    def __iter_template_glob_matches(self, template, fields, skip_keys, skip_missing_optional_keys):
+        """
+        Searches the file system for the paths matching the glob patterns built from a 
+        template and fields. The paths found are not validated against the template.
+
+        :param template: Template against whom to match.
+        :param fields: Fields and values to use.
+        :param skip_keys: Keys whose values should be ignored from the fields parameter.
+        :param skip_missing_optional_keys: Specify if optional keys should be skipped if they 
+                                           aren't found in the fields collection
+        :returns: Iterator yielding the paths found.
+        """
         skip_keys = skip_keys or []
         if isinstance(skip_keys, basestring):
             skip_keys = [skip_keys]
@@ -340,8 +532,7 @@ class Tank(object):
             local_fields[key] = "*"
             
         # iterate for each set of keys in the template:
-        found_files = set()
-        globs_searched = set()
+        globs_searched = []
         for keys in template._keys:
             # create fields and skip keys with those that 
             # are relevant for this key set:
@@ -371,13 +562,14 @@ class Tank(object):
                 # it's possible that multiple key sets return the same search
                 # string depending on the fields and skip-keys passed in
                 continue
-            globs_searched.add(glob_str)
-            
-            # Find all files which are valid for this key set
-            found_files.update([found_file for found_file in glob.iglob(glob_str) if template.validate(found_file)])
-                    
-        return list(found_files) 
+            globs_searched.append(glob_str)
 
+        # Search for all the globs at once so that the directories they have in common
+        # are only listed once, skipping directories which can't contain valid paths
+        accept = template._validate_path_component if isinstance(template, TemplatePath) else None
+        return parallel_glob.iglob(globs_searched, 
+                                   accept=accept, 
+                                   max_workers=platform_constants.PATHS_FROM_TEMPLATE_MAX_WORKERS)
 
     def abstract_paths_from_template(self, template, fields):
         """Returns an abstract path based on a template.
@@ -399,6 +591,28 @@ class Tank(object):
         :returns: A list of paths whose abstract keys use their abstract(default) value unless
                   a value is specified for them in the fields parameter.
         """
+        return list(self.iter_abstract_paths_from_template(template, fields))
+
+    def iter_abstract_paths_from_template(self, template, fields, limit=None):
+        """
+        Finds abstract paths based on a template.
+
+        This is the same as abstract_paths_from_template except that the abstract paths
+        are yielded as soon as the first path they represent is found on disk rather 
+        than being returned once the search is complete. Only the abstract paths are 
+        kept in memory, not the paths of every frame found.
+
+        :param template: Template with which to search.
+        :param fields: Mapping of keys to values with which to assemble the abstract path.
+        :param limit: Optional maximum number of abstract paths to return. The search 
+                      stops as soon as this number of paths has been found.
+
+        :returns: Iterator yielding paths whose abstract keys use their abstract(default) 
+                  value unless a value is specified for them in the fields parameter.
+        """
+        if limit is not None and limit <= 0:
+            return
+
         search_template = template
 
         # the logic is as follows:
@@ -427,43 +641,39 @@ class Tank(object):
         if skip_leaf_level:
             search_template = template.parent
 
-        # now carry out a regular search based on the template
-        found_files = self.paths_from_template(search_template, fields)
-
-        st_abstract_key_names = [k.name for k in search_template.keys.values() if k.is_abstract]
-
-        # now collapse down the search matches for any abstract fields,
-        # and add the leaf level if necessary
-        abstract_paths = set()
-        for found_file in found_files:
-
-            cur_fields = search_template.get_fields(found_file)
+        # now carry out a regular search based on the template and collapse down 
+        # the search matches for any abstract fields, and add the leaf level if necessary.
+        # Frames of image sequences are grouped together so only one frame per sequence
+        # needs to be parsed.
+        scanner = SequenceScanner(template, fields, search_template)
+        num_found = 0
+        for found_file in self.__iter_template_glob_matches(search_template, fields, None, False):
+            abstract_path = scanner.add_path(found_file)
+            if abstract_path:
+                yield abstract_path
+                num_found += 1
+                if num_found == limit:
+                    break
 
-            # pass 1 - go through the fields for this file and
-            # zero out the abstract fields - this way, apply
-            # fields will pick up defaults for those fields
-            #
-            # if the system found matches for eye=left and eye=right,
-            # by deleting all eye values they will be replaced by %V
-            # as the template is applied.
-            #
-            for abstract_key_name in st_abstract_key_names:
-                del cur_fields[abstract_key_name]
+    def sequences_from_template(self, template, fields):
+        """
+        Finds image sequences on disk based on a template.
 
-            # pass 2 - if we ignored the leaf level, add those fields back
-            # note that there is no risk that we add abstract fields at this point
-            # since the fields dictionary should only ever contain "real" values.
-            # also, we may have deleted actual fields in the pass above and now we
-            # want to put them back again.
-            for f in fields:
-                if f not in cur_fields:
-                    cur_fields[f] = fields[f]
+        This is similar to abstract_paths_from_template except that the files are always
+        searched for on disk and that the frames found for each abstract path are returned
+        as well. Files sharing the same directory and the same text around the frame number
+        are grouped together so that only one file per sequence needs to be parsed.
 
-            # now we have all the fields we need to compose the full template
-            abstract_path = template.apply_fields(cur_fields)
-            abstract_paths.add(abstract_path)
+        :param template: Template with which to search.
+        :param fields: Mapping of keys to values with which to assemble the abstract path.
 
-        return list(abstract_paths)
+        :returns: List of ImageSequence instances, each containing an abstract path and 
+                  the frames found for it, with the first, last and missing frames.
+        """
+        scanner = SequenceScanner(template, fields)
+        for found_file in self.__iter_template_glob_matches(template, fields, None, False):
+            scanner.add_path(found_file)
+        return scanner.get_sequences()
 
 
     def paths_from_entity(self, entity_type, entity_id):
@@ -535,6 +745,21 @@ class Tank(object):
         """
         return context.from_entity(self, entity_type, entity_id)
 
+    def contexts_from_entities(self, entity_type, entity_ids):
+        """
+        Derives contexts from several Shotgun entities of the same type. This is 
+        equivalent to calling context_from_entity for each entity but much faster 
+        as Shotgun and the path cache are queried for all the entities at once.
+
+        :param entity_type: The name of the entity type.
+        :type  entity_type: String.
+        :param entity_ids: Shotgun ids of the entities upon which to base the contexts.
+        :type  entity_ids: List of integers.
+
+        :returns: Dictionary of form {entity id: Context object}
+        """
+        return context.from_entities(self, entity_type, entity_ids)
+
     def context_from_entity_dictionary(self, entity_dictionary):
         """
         Derives a context from a shotgun entity dictionary.  This will try to use any 
@@ -16,17 +16,28 @@ Management of the current context, e.g. the current shotgun entity/step/task.
 import os
 import pickle
 import copy
+import weakref
+import threading
 
 from tank_vendor import yaml
 from tank_vendor import shotgun_authentication as sg_auth
+from tank_vendor import shotgun_api3
 
 from .util import login
 from .util import shotgun_entity
 from .util import shotgun
 from .errors import TankError
+from .platform import constants
 from .path_cache import PathCache
 from .template import TemplatePath
 
+json = shotgun_api3.shotgun.json
+
+# process wide Tank instances reused when deserializing contexts, keyed
+# by pipeline configuration path and serialized user
+g_tank_instances = {}
+g_tank_instances_lock = threading.Lock()
+
 
 class Context(object):
     """
@@ -58,6 +69,8 @@ class Context(object):
         self.__user = user
         self.__additional_entities = additional_entities or []
         self._entity_fields_cache = {}
+        # data looked up in the path cache by as_template_fields, see _get_path_cache_lookups
+        self._path_cache_lookups = None
 
     def __repr__(self):
         # multi line repr
@@ -209,6 +222,7 @@ class Context(object):
         
         # except:
         # ctx_copy._entity_fields_cache
+        # ctx_copy._path_cache_lookups
         
         return ctx_copy
 
@@ -441,36 +455,17 @@ class Context(object):
 
         # Try to populate fields using paths caches for entity
         if isinstance(template, TemplatePath):
-
-            # first, sanity check that we actually have a path cache entry
-            # this relates to ticket 22541 where it is possible to create 
-            # a context object purely from Shotgun without having it in the path cache
-            # (using tk.context_from_entity(Task, 1234) for example)
-            #
-            # Such a context can result in erronous lookups in the later commands
-            # since these make the assumption that the path cache contains the information
-            # that is being saught after.
-            # 
-            # therefore, if the context object contains an entity object and this entity is
-            # not represented in the path cache, raise an exception.
-            if self.entity and len(self.entity_locations) == 0:
-                # context has an entity associated but no path cache entries
-                raise TankError("Cannot resolve template data for context '%s' - this context "
-                                "does not have any associated folders created on disk yet and "
-                                "therefore no template data can be extracted. Please run the folder "
-                                "creation for %s and try again!" % (self, self.shotgun_url))
-
-            # first look at which ENTITY paths are associated with this context object
-            # and use these to extract the right fields for this template
-            fields = self._fields_from_entity_paths(template)
-
-            # filter the list of fields to just those that don't have a 'None' value.
-            # Note: A 'None' value for a field indicates an ambiguity and was set in the 
-            # _fields_from_entity_paths method (!)
-            non_none_fields = dict([(key, value) for key, value in fields.iteritems() if value is not None])
-
-            # Determine additional field values by walking down the template tree
-            fields.update(self._fields_from_template_tree(template, non_none_fields, entities))
+            path_cache = PathCache(self.__tk)
+            try:
+                lookups = self._get_path_cache_lookups(path_cache)
+                (cached_template, cached_fields) = lookups["template_fields"].get(template.name, (None, None))
+                if cached_template is template:
+                    fields = dict(cached_fields)
+                else:
+                    fields = self._fields_from_path_cache(template, entities, path_cache, lookups)
+                    lookups["template_fields"][template.name] = (template, dict(fields))
+            finally:
+                path_cache.close()
 
         # get values for shotgun query keys in template
         fields.update(self._fields_from_shotgun(template, entities))
@@ -507,13 +502,99 @@ class Context(object):
     ################################################################################################
     # private methods
 
+    def _get_path_cache_lookups(self, path_cache):
+        """
+        Returns the data looked up in the path cache by as_template_fields, which is kept
+        for as long as the path cache doesn't change. This is the paths of the entities and
+        the fields found for each template.
+
+        :param path_cache:  PathCache instance
+        :returns:           Dictionary with keys "paths", a dictionary of form {(entity type, 
+                            entity id): list of paths}, and "template_fields", a dictionary 
+                            of form {template name: (template, fields)}.
+        """
+        marker = path_cache.get_sync_marker()
+        if self._path_cache_lookups is not None and marker is not None:
+            (marker_ref, lookups) = self._path_cache_lookups
+            if marker_ref() is marker:
+                return lookups
+
+        lookups = {"paths": {}, "template_fields": {}}
+        if marker is not None:
+            # the marker is only weakly referenced so that outdated data doesn't hold on to it
+            self._path_cache_lookups = (weakref.ref(marker), lookups)
+        return lookups
+
+    def _get_entity_paths(self, entity, path_cache, lookups):
+        """
+        Returns the primary paths of an entity, looking them up in the path cache once.
+
+        :param entity:      Shotgun entity dictionary
+        :param path_cache:  PathCache instance
+        :param lookups:     Data returned by _get_path_cache_lookups
+        :returns:           List of paths
+        """
+        key = (entity["type"], entity["id"])
+        if key not in lookups["paths"]:
+            lookups["paths"][key] = path_cache.get_paths(entity["type"], entity["id"], primary_only=True)
+        return lookups["paths"][key]
+
+    def _fields_from_path_cache(self, template, entities, path_cache, lookups):
+        """
+        Determines a template's key values from the paths of the context entities.
+
+        :param template:    The template path to find fields for
+        :param entities:    A dictionary of {entity_type:entity_dict} that contains all the entities 
+                            belonging to this context.
+        :param path_cache:  PathCache instance
+        :param lookups:     Data returned by _get_path_cache_lookups
+        :returns:           A dictionary of field name, value pairs for any fields found for the template
+        """
+        entity_locations = []
+        if self.entity:
+            entity_locations = self._get_entity_paths(self.entity, path_cache, lookups)
+
+        # first, sanity check that we actually have a path cache entry
+        # this relates to ticket 22541 where it is possible to create 
+        # a context object purely from Shotgun without having it in the path cache
+        # (using tk.context_from_entity(Task, 1234) for example)
+        #
+        # Such a context can result in erronous lookups in the later commands
+        # since these make the assumption that the path cache contains the information
+        # that is being saught after.
+        # 
+        # therefore, if the context object contains an entity object and this entity is
+        # not represented in the path cache, raise an exception.
+        if self.entity and len(entity_locations) == 0:
+            # context has an entity associated but no path cache entries
+            raise TankError("Cannot resolve template data for context '%s' - this context "
+                            "does not have any associated folders created on disk yet and "
+                            "therefore no template data can be extracted. Please run the folder "
+                            "creation for %s and try again!" % (self, self.shotgun_url))
+
+        # first look at which ENTITY paths are associated with this context object
+        # and use these to extract the right fields for this template
+        fields = self._fields_from_entity_paths(template, entity_locations)
+
+        # filter the list of fields to just those that don't have a 'None' value.
+        # Note: A 'None' value for a field indicates an ambiguity and was set in the 
+        # _fields_from_entity_paths method (!)
+        non_none_fields = dict([(key, value) for key, value in fields.iteritems() if value is not None])
+
+        # Determine additional field values by walking down the template tree
+        fields.update(self._fields_from_template_tree(template, non_none_fields, entities, path_cache, lookups))
+
+        return fields
+
     def _fields_from_shotgun(self, template, entities):
         """
         Query Shotgun server for keys used by this template whose values come directly
-        from Shotgun fields.
+        from Shotgun fields. The values of all the keys linked to the same entity are
+        fetched with a single query and cached for the next calls.
         """
-        fields = {}
-        # for any sg query field
+        # find the shotgun fields which need fetching for each entity
+        sg_keys = []
+        missing_keys = {}
         for key in template.keys.values():
             
             # check each key to see if it has shotgun query information that we should resolve
@@ -527,77 +608,81 @@ class Context(object):
                                     "shotgun entity of type '%s'!" % (key, template, self, key.shotgun_entity_type))
                     
                 entity = entities[key.shotgun_entity_type]
+                sg_keys.append((key, entity))
                 
                 # check the context cache 
                 cache_key = (entity["type"], entity["id"], key.shotgun_field_name)
-                if cache_key in self._entity_fields_cache:
-                    # already have the value cached - no need to fetch from shotgun
-                    fields[key.name] = self._entity_fields_cache[cache_key]
+                if cache_key not in self._entity_fields_cache:
+                    missing_keys.setdefault((key.shotgun_entity_type, entity["id"]), []).append(key)
+
+        for ((entity_type, entity_id), keys) in missing_keys.iteritems():
+            entity = entities[entity_type]
+
+            # get the values from shotgun
+            filters = [["id", "is", entity_id]]
+            query_fields = list(set(key.shotgun_field_name for key in keys))
+            result = self.__tk.shotgun.find_one(entity_type, filters, query_fields)
+            if not result:
+                # no record with that id in shotgun!
+                raise TankError("Could not retrieve Shotgun data for key '%s' in "
+                                "template '%s'. No records in Shotgun are matching "
+                                "entity '%s' (Which is part of the current "
+                                "context '%s')" % (keys[0], template, entity, self))                        
+
+            for key in keys:
+                value = result.get(key.shotgun_field_name)
+
+                # note! It is perfectly possible (and may be valid) to return None values from 
+                # shotgun at this point. In these cases, a None field will be returned in the 
+                # fields dictionary from as_template_fields, and this may be injected into
+                # a template with optional fields.
+
+                if value is None:
+                    processed_val = None
                 
                 else:
-                    # get the value from shotgun
-                    filters = [["id", "is", entity["id"]]]
-                    query_fields = [key.shotgun_field_name]
-                    result = self.__tk.shotgun.find_one(key.shotgun_entity_type, filters, query_fields)
-                    if not result:
-                        # no record with that id in shotgun!
-                        raise TankError("Could not retrieve Shotgun data for key '%s' in "
-                                        "template '%s'. No records in Shotgun are matching "
-                                        "entity '%s' (Which is part of the current "
-                                        "context '%s')" % (key, template, entity, self))                        
-
-                    value = result.get(key.shotgun_field_name)
-
-                    # note! It is perfectly possible (and may be valid) to return None values from 
-                    # shotgun at this point. In these cases, a None field will be returned in the 
-                    # fields dictionary from as_template_fields, and this may be injected into
-                    # a template with optional fields.
-    
-                    if value is None:
-                        processed_val = None
-                    
-                    else:
-
-                        # now convert the shotgun value to a string.
-                        # note! This means that there is no way currently to create an int key
-                        # in a tank template which matches an int field in shotgun, since we are
-                        # force converting everything into strings...
-                                 
-                        processed_val = shotgun_entity.sg_entity_to_string(self.__tk,
-                                                                           key.shotgun_entity_type,
-                                                                           entity.get("id"),
-                                                                           key.shotgun_field_name, 
-                                                                           value)
-                    
-                        if not key.validate(processed_val):                    
-                            raise TankError("Template validation failed for value '%s'. This "
-                                            "value was retrieved from entity %s in Shotgun to "
-                                            "represent key '%s' in "
-                                            "template '%s'." % (processed_val, entity, key, template))
-                            
-                    # all good!
-                    # populate dictionary and cache
-                    fields[key.name] = processed_val
-                    self._entity_fields_cache[cache_key] = processed_val
 
+                    # now convert the shotgun value to a string.
+                    # note! This means that there is no way currently to create an int key
+                    # in a tank template which matches an int field in shotgun, since we are
+                    # force converting everything into strings...
+                             
+                    processed_val = shotgun_entity.sg_entity_to_string(self.__tk,
+                                                                       entity_type,
+                                                                       entity_id,
+                                                                       key.shotgun_field_name, 
+                                                                       value)
+                
+                    if not key.validate(processed_val):                    
+                        raise TankError("Template validation failed for value '%s'. This "
+                                        "value was retrieved from entity %s in Shotgun to "
+                                        "represent key '%s' in "
+                                        "template '%s'." % (processed_val, entity, key, template))
+                        
+                # all good!
+                # populate cache
+                self._entity_fields_cache[(entity["type"], entity_id, key.shotgun_field_name)] = processed_val
+
+        # populate dictionary from the cache
+        fields = {}
+        for (key, entity) in sg_keys:
+            fields[key.name] = self._entity_fields_cache[(entity["type"], entity["id"], key.shotgun_field_name)]
 
         return fields
 
 
-    def _fields_from_entity_paths(self, template):
+    def _fields_from_entity_paths(self, template, path_cache_locations):
         """
         Determines a template's key values based on context by walking up the context entities paths until
         matches for the template are found.
 
-        :param template:    The template to find fields for
-        :returns:           A dictionary of field name, value pairs for any fields found for the template
+        :param template:                The template to find fields for
+        :param path_cache_locations:    All locations on disk for our context object from the path cache
+        :returns:                       A dictionary of field name, value pairs for any fields found for the template
         """
         fields = {}
         project_roots = self.__tk.pipeline_configuration.get_data_roots().values()
 
-        # get all locations on disk for our context object from the path cache
-        path_cache_locations = self.entity_locations 
-
         # now loop over all those locations and check if one of the locations 
         # are matching the template that is passed in. In that case, try to
         # extract the fields values.
@@ -619,7 +704,7 @@ class Context(object):
 
         return fields
 
-    def _fields_from_template_tree(self, template, known_fields, context_entities):
+    def _fields_from_template_tree(self, template, known_fields, context_entities, path_cache, lookups):
         """
         Determines values for a template's keys based on the context by walking down the template tree
         matching template keys with entity types.
@@ -633,6 +718,8 @@ class Context(object):
                                     logic in this method will ensure that any fields found match these.
         :param context_entities:    A dictionary of {entity_type:entity_dict} that contains all the entities 
                                     belonging to this context.
+        :param path_cache:          PathCache instance to look up the paths of the entities in
+        :param lookups:             Data returned by _get_path_cache_lookups
         :returns:                   A dictionary of all fields found by this method
         """
         # Step 1 - Walk up the template tree and collect templates
@@ -655,106 +742,103 @@ class Context(object):
         # at least the fields from all previous levels
         found_fields = {}
 
-        # get a path cache handle
-        path_cache = PathCache(self.__tk)
-        try:
-            for template in templates:
-                # iterate over all keys in the {key_name:key} dictionary for the template
-                # looking for any that represent context entities (key name == entity type)
-                template_key_dict = template.keys
-                for key_name in template_key_dict.keys():
-                    # Check to see if we already have a value for this key: 
-                    if key_name in known_fields or key_name in found_fields:
-                        # already have a value so skip
-                        continue
-
-                    if key_name not in context_entities:
-                        # key doesn't represent an entity so skip
-                        continue
-
-                    # find fields for any paths associated with this entity by looking in the path cache:
-                    entity_fields = _values_from_path_cache(context_entities[key_name], template, path_cache, 
-                                                           required_fields=found_fields)
-
-                    # entity_fields may contain additional fields that correspond to entities
-                    # so we should be sure to validate these as well if we can.
-                    #
-                    # The following example illustrates where the code could previously return incorrect entity 
-                    # information from this method:
-                    #
-                    # With the following template:
-                    #    /{Sequence}/{Shot}/{Step}
-                    #
-                    # And a path cache that contains:
-                    #    Type     | Id  | Name     | Path
-                    #    ----------------------------------------------------
-                    #    Sequence | 001 | Seq_001  | /Seq_001
-                    #    Shot     | 002 | Shot_A   | /Seq_001/Shot_A
-                    #    Step     | 003 | Lighting | /Seq_001/Shot_A/Lighting
-                    #    Step     | 003 | Lighting | /Seq_001/blah/Shot_B/Lighting   <- this is out of date!
-                    #    Shot     | 004 | Shot_B   | /Seq_001/blah/Shot_B            <- this is out of date!
-                    #
-                    # (Note: the schema/templates have been changed since the entries for Shot_b were added)
-                    #
-                    # The sub-templates used to search for fields are:
-                    #    /{Sequence}
-                    #    /{Sequence}/{Shot}
-                    #    /{Sequence}/{Shot}/{Step}
-                    #
-                    # And the entities passed into the method are:
-                    #    Sequence:   Seq_001
-                    #    Shot:       Shot_B
-                    #    Step:       Lighting
-                    #
-                    # We are searching for fields for 'Shot_B' that has a broken entry in the path cache so the fields 
-                    # returned for each level of the template will be:
-                    #    /{Sequence}                 -> {"Sequence":"Seq_001"} <- Correct
-                    #    /{Sequence}/{Shot}          -> {}                     <- entry not found for Shot_B matching 
-                    #                                                             the template
-                    #    /{Sequence}/{Shot}/{Step}   -> {"Sequence":"Seq_001", <- Correct
-                    #                                    "Shot":"Shot_A",      <- Wrong!
-                    #                                    "Step":"Lighting"}    <- Correct
-                    #
-                    # In previous implementations, the final fields would incorrectly be returned as:
-                    #
-                    #     {"Sequence":"Seq_001",
-                    #      "Shot":"Shot_A",
-                    #      "Step":"Lighting"}
-                    #
-                    # The wrong Shot (Shot_A) is returned and not caught because the code only tested that the Step
-                    # entity matches and just assumes that the rest is correct - this isn't the case when there is
-                    # a one-to-many relationship between entities!
-                    #
-                    # Therefore, we need to validate that we didn't find any entity fields that we should have found
-                    # previously/higher up in the template definition.  If we did then the entries that were found 
-                    # may not be correct so we have to discard them!
-                    found_mismatching_field = False
-                    for field_name, field_value in entity_fields.iteritems():
-                        if field_name in known_fields:
-                            # We found a field we already knew about...
-                            if field_value != known_fields[field_name]:
-                                # ...but it doesn't match!
-                                found_mismatching_field = True
-                        elif field_name in found_fields:
-                            # We found a field we found before...
-                            if field_value != found_fields[field_name]:
-                                # ...but it doesn't match!
-                                found_mismatching_field = True
-                        elif field_name == key_name:
-                            # We found a field that matches the entity we were searching for so it must be valid!
-                            found_fields[field_name] = field_value
-                        elif field_name in context_entities:
-                            # We found an entity type that we should have found before (in a previous/shorter 
-                            # template).  This means we can't trust any other fields that were found as they
-                            # may belong to a completely different entity/path! 
+        for template in templates:
+            # iterate over all keys in the {key_name:key} dictionary for the template
+            # looking for any that represent context entities (key name == entity type)
+            template_key_dict = template.keys
+            for key_name in template_key_dict.keys():
+                # Check to see if we already have a value for this key: 
+                if key_name in known_fields or key_name in found_fields:
+                    # already have a value so skip
+                    continue
+
+                if key_name not in context_entities:
+                    # key doesn't represent an entity so skip
+                    continue
+
+                # find fields for any paths associated with this entity by looking in the path cache:
+                entity = context_entities[key_name]
+                entity_fields = _values_from_path_cache(entity, 
+                                                        template, 
+                                                        self._get_entity_paths(entity, path_cache, lookups), 
+                                                        required_fields=found_fields)
+
+                # entity_fields may contain additional fields that correspond to entities
+                # so we should be sure to validate these as well if we can.
+                #
+                # The following example illustrates where the code could previously return incorrect entity 
+                # information from this method:
+                #
+                # With the following template:
+                #    /{Sequence}/{Shot}/{Step}
+                #
+                # And a path cache that contains:
+                #    Type     | Id  | Name     | Path
+                #    ----------------------------------------------------
+                #    Sequence | 001 | Seq_001  | /Seq_001
+                #    Shot     | 002 | Shot_A   | /Seq_001/Shot_A
+                #    Step     | 003 | Lighting | /Seq_001/Shot_A/Lighting
+                #    Step     | 003 | Lighting | /Seq_001/blah/Shot_B/Lighting   <- this is out of date!
+                #    Shot     | 004 | Shot_B   | /Seq_001/blah/Shot_B            <- this is out of date!
+                #
+                # (Note: the schema/templates have been changed since the entries for Shot_b were added)
+                #
+                # The sub-templates used to search for fields are:
+                #    /{Sequence}
+                #    /{Sequence}/{Shot}
+                #    /{Sequence}/{Shot}/{Step}
+                #
+                # And the entities passed into the method are:
+                #    Sequence:   Seq_001
+                #    Shot:       Shot_B
+                #    Step:       Lighting
+                #
+                # We are searching for fields for 'Shot_B' that has a broken entry in the path cache so the fields 
+                # returned for each level of the template will be:
+                #    /{Sequence}                 -> {"Sequence":"Seq_001"} <- Correct
+                #    /{Sequence}/{Shot}          -> {}                     <- entry not found for Shot_B matching 
+                #                                                             the template
+                #    /{Sequence}/{Shot}/{Step}   -> {"Sequence":"Seq_001", <- Correct
+                #                                    "Shot":"Shot_A",      <- Wrong!
+                #                                    "Step":"Lighting"}    <- Correct
+                #
+                # In previous implementations, the final fields would incorrectly be returned as:
+                #
+                #     {"Sequence":"Seq_001",
+                #      "Shot":"Shot_A",
+                #      "Step":"Lighting"}
+                #
+                # The wrong Shot (Shot_A) is returned and not caught because the code only tested that the Step
+                # entity matches and just assumes that the rest is correct - this isn't the case when there is
+                # a one-to-many relationship between entities!
+                #
+                # Therefore, we need to validate that we didn't find any entity fields that we should have found
+                # previously/higher up in the template definition.  If we did then the entries that were found 
+                # may not be correct so we have to discard them!
+                found_mismatching_field = False
+                for field_name, field_value in entity_fields.iteritems():
+                    if field_name in known_fields:
+                        # We found a field we already knew about...
+                        if field_value != known_fields[field_name]:
+                            # ...but it doesn't match!
                             found_mismatching_field = True
-
-                    if not found_mismatching_field:
-                        # all fields are ok so we can add them all to the list of found fields :)
-                        found_fields.update(entity_fields)
-
-        finally:
-            path_cache.close()
+                    elif field_name in found_fields:
+                        # We found a field we found before...
+                        if field_value != found_fields[field_name]:
+                            # ...but it doesn't match!
+                            found_mismatching_field = True
+                    elif field_name == key_name:
+                        # We found a field that matches the entity we were searching for so it must be valid!
+                        found_fields[field_name] = field_value
+                    elif field_name in context_entities:
+                        # We found an entity type that we should have found before (in a previous/shorter 
+                        # template).  This means we can't trust any other fields that were found as they
+                        # may belong to a completely different entity/path! 
+                        found_mismatching_field = True
+
+                if not found_mismatching_field:
+                    # all fields are ok so we can add them all to the list of found fields :)
+                    found_fields.update(entity_fields)
 
         return found_fields
 
@@ -784,67 +868,100 @@ def from_entity(tk, entity_type, entity_id):
 
     :returns: a context object
     """
+    return from_entities(tk, entity_type, [entity_id])[entity_id]
+
+def from_entities(tk, entity_type, entity_ids):
+    """
+    Constructs contexts from several shotgun entities of the same type. This is 
+    equivalent to calling from_entity for each entity, except that Shotgun and the
+    path cache are queried for all the entities at once.
+
+    :param tk:           Sgtk API handle
+    :param entity_type:  The shotgun entity type to produce contexts for
+    :param entity_ids:   List of shotgun entity ids to produce contexts for
+
+    :returns: Dictionary of form {entity id: context object}
+    """
     
     if entity_type is None:
         raise TankError("Cannot create a context from an entity type 'None'!")
     
-    if entity_id is None:
+    if None in entity_ids:
         raise TankError("Cannot create a context from an entity id set to 'None'!")
-    
-    # prep our return data structure
-    context = {
-        "tk": tk,
-        "project": None,
-        "entity": None,
-        "step": None,
-        "user": None,
-        "task": None,
-        "additional_entities": []
-    }
+
+    # remove duplicates
+    entity_ids = dict.fromkeys(entity_ids).keys()
+
+    contexts = {}
+    if not entity_ids:
+        return contexts
+
+    if entity_type in ["PublishedFile", "TankPublishedFile"]:
+        
+        sg_entities = tk.shotgun.find(entity_type, 
+                                      [["id", "in", entity_ids]], 
+                                      ["project", "entity", "task"])
+        sg_entities = dict((sg_entity["id"], sg_entity) for sg_entity in sg_entities)
+
+        # group the published files by the entity their context is based on
+        linked_entities = {}
+        for entity_id in entity_ids:
+            sg_entity = sg_entities.get(entity_id)
+            if sg_entity is None:
+                raise TankError("Entity %s with id %s not found in Shotgun!" % (entity_type, entity_id))
+            
+            # base the context on the task for the published file, otherwise the
+            # entity or the project that the published is linked with
+            linked_entity = sg_entity.get("task") or sg_entity.get("entity") or sg_entity.get("project")
+            if linked_entity:
+                linked_ids = linked_entities.setdefault(linked_entity["type"], {})
+                linked_ids.setdefault(linked_entity["id"], []).append(entity_id)
+            else:
+                contexts[entity_id] = create_empty(tk)
+
+        for (linked_type, linked_ids) in linked_entities.iteritems():
+            linked_contexts = from_entities(tk, linked_type, linked_ids.keys())
+            for (linked_id, ids) in linked_ids.iteritems():
+                for entity_id in ids:
+                    contexts[entity_id] = linked_contexts[linked_id]
+
+        return contexts
 
     if entity_type == "Task":
         # For tasks get data from shotgun query
-        task_context = _task_from_sg(tk, entity_id)
-        context.update(task_context)
+        entities_context = _tasks_from_sg(tk, entity_ids)
 
-    elif entity_type in ["PublishedFile", "TankPublishedFile"]:
-        
-        sg_entity = tk.shotgun.find_one(entity_type, 
-                                        [["id", "is", entity_id]], 
-                                        ["project", "entity", "task"])
-        
-        if sg_entity is None:
-            raise TankError("Entity %s with id %s not found in Shotgun!" % (entity_type, entity_id))
-        
-        if sg_entity.get("task"):
-            # base the context on the task for the published file
-            return from_entity(tk, "Task", sg_entity["task"]["id"])
-        
-        elif sg_entity.get("entity"):
-            # base the context on the entity that the published is linked with
-            return from_entity(tk, sg_entity["entity"]["type"], sg_entity["entity"]["id"])
-        
-        elif sg_entity.get("project"):
-            # base the context on the project that the published is linked with
-            return from_entity(tk, "Project", sg_entity["project"]["id"])
-    
     else:
         # Get data from path cache
-        entity_context = _context_data_from_cache(tk, entity_type, entity_id)
+        entities_context = _contexts_data_from_cache(tk, entity_type, entity_ids)
                     
         # make sure this was actually found in the cache
         # fall back on a shotgun lookup if not found
-        if entity_context["project"] is None:
-            entity_context = _entity_from_sg(tk, entity_type, entity_id)
-        
-        context.update(entity_context)
+        missing_ids = [x for x in entity_ids if entities_context[x]["project"] is None]
+        if missing_ids:
+            entities_context.update(_entities_from_sg(tk, entity_type, missing_ids))
+
+    for entity_id in entity_ids:
+        # prep our return data structure
+        context = {
+            "tk": tk,
+            "project": None,
+            "entity": None,
+            "step": None,
+            "user": None,
+            "task": None,
+            "additional_entities": []
+        }
+        context.update(entities_context[entity_id])
 
         if entity_type == "Project":
             # no need to set entity to point at project in this case
             # that only produces double entries.
             context["entity"] = None
 
-    return Context(**context)
+        contexts[entity_id] = Context(**context)
+
+    return contexts
 
 def from_entity_dictionary(tk, entity_dictionary):
     """
@@ -1033,7 +1150,66 @@ def from_path(tk, path, previous_context=None):
                              path passed in via the path argument.
     :returns: a context object
     """
+    # get a cache handle
+    path_cache = PathCache(tk)
+    try:
+        # contexts are resolved once per directory and previous context for a given state
+        # of the path cache. Only folders are registered in the path cache so all the files
+        # in a directory resolve to the same context.
+        marker = path_cache.get_sync_marker()
+        if marker is not None:
+            directory = os.path.dirname(path) if os.path.isfile(path) else path
+            cache_key = (os.path.normpath(directory), _get_previous_context_key(previous_context))
+            (cached_marker, cached_data) = tk._get_context_cache().get(cache_key, (None, None))
+            if cached_marker and cached_marker() is marker:
+                return Context(tk=tk, **copy.deepcopy(cached_data))
+
+        context = _context_data_from_path(tk, path_cache, path, previous_context)
+
+    finally:
+        path_cache.close()
+
+    if marker is not None:
+        # the marker is only weakly referenced so that outdated data doesn't hold on to it
+        cached_data = dict((k, v) for (k, v) in context.iteritems() if k != "tk")
+        tk._get_context_cache().set(cache_key, (weakref.ref(marker), copy.deepcopy(cached_data)))
+
+    return Context(**context)
+
+def _get_previous_context_key(previous_context):
+    """
+    Returns a hashable value identifying the fields of a previous context used to 
+    extend a context resolved from a path.
 
+    :param previous_context: Context object or None
+    :returns: Tuple of strings, or None if there is no previous context.
+    """
+    if previous_context is None:
+        return None
+
+    def entity_key(entity):
+        # the entities are compared as a whole with the resolved ones so all
+        # their fields matter
+        if entity is None:
+            return None
+        return repr(sorted(entity.items()))
+
+    return (entity_key(previous_context.entity),
+            entity_key(previous_context.step),
+            entity_key(previous_context.task),
+            tuple(entity_key(e) for e in previous_context.additional_entities))
+
+def _context_data_from_path(tk, path_cache, path, previous_context):
+    """
+    Resolves the fields of a context from a path, see from_path.
+
+    :param tk:   Sgtk API handle
+    :param path_cache: PathCache instance to look up the path in.
+    :param path: a file system path
+    :param previous_context: a context object to use to try to automatically extend the 
+                             generated context or None.
+    :returns: Dictionary of keyword arguments for the Context constructor.
+    """
     # prep our return data structure
     context = {
         "tk": tk,
@@ -1048,41 +1224,17 @@ def from_path(tk, path, previous_context=None):
     # ask hook for extra entity types we should recognize and insert into the additional_entities list.
     additional_types = tk.execute_core_hook("context_additional_entities").get("entity_types_in_path", [])
 
-    # get a cache handle
-    path_cache = PathCache(tk)
-
-    # gather all roots as lower case
-    project_roots = [x.lower() for x in tk.pipeline_configuration.get_data_roots().values()]
-
-    # first gather entities
+    # first gather entities for the path and all its parents up to the project root
     entities = []
     secondary_entities = []
-    curr_path = path
-    while True:
-        curr_entity = path_cache.get_entity(curr_path)
+    for (curr_path, curr_entity, curr_secondary_entities) in path_cache.get_entities_for_ancestors(path):
         if curr_entity:
             # Don't worry about entity types we've already got in the context. In the future
             # we should look for entity ids that conflict in order to flag a degenerate schema.
             entities.append(curr_entity)
         
         # add secondary entities
-        secondary_entities.extend( path_cache.get_secondary_entities(curr_path) )
-
-        if curr_path.lower() in project_roots:
-            #TODO this could fail with windows path variations
-            # we have reached a root!
-            break
-
-        # and continue with parent path
-        parent_path = os.path.abspath(os.path.join(curr_path, ".."))
-
-        if curr_path == parent_path:
-            # We're at the disk root, probably a degenerate path
-            break
-        else:
-            curr_path = parent_path
-
-    path_cache.close()
+        secondary_entities.extend(curr_secondary_entities)
 
     # now populate the context
     # go from the root down, so that in the case there are a path with
@@ -1153,14 +1305,19 @@ def from_path(tk, path, previous_context=None):
         # remove double entry!
         context["entity"] = None
 
-    return Context(**context)
+    return context
 
 ################################################################################################
 # serialization
 
 def serialize(context):
     """
-    Serializes the context into a string
+    Serializes the context into a string. The context is serialized to a compact,
+    versioned JSON string, or pickled if its entities hold values which can't be
+    represented in JSON. Both forms can be read back with deserialize().
+
+    :param context: The context to serialize.
+    :returns: String representation of the context.
     """
     # Avoids cyclic imports
     from .api import get_authenticated_user
@@ -1181,17 +1338,44 @@ def serialize(context):
         # We should serialize it as well so that the next process knows who to
         # run as.
         data["_current_user"] = sg_auth.serialize_user(user)
-    return pickle.dumps(data)
+
+    try:
+        return json.dumps(dict(data, _format_version=constants.CONTEXT_SERIALIZATION_FORMAT_VERSION),
+                          separators=(",", ":"))
+    except (TypeError, ValueError):
+        # entities with values such as dates can't be represented in json,
+        # fall back on the older pickle format.
+        return pickle.dumps(data)
 
 
-def deserialize(context_str):
+def deserialize(context_str, tk=None, use_tank_cache=False):
     """
     Deserializes a string created with serialize() into a context object
+
+    Creating a Sgtk API instance for the context is costly, so an existing one
+    can be reused. The tk instance is only used if it belongs to the pipeline
+    configuration the context was serialized from. Otherwise, a new instance is
+    created, unless use_tank_cache is set in which case the instance is shared
+    with all the contexts deserialized in this process for the same pipeline
+    configuration and user.
+
+    :param context_str: String created with serialize()
+    :param tk: Optional Sgtk API instance to use for the context.
+    :param use_tank_cache: Reuse the API instances created by previous calls.
+    :returns: Context object
     """
     # lazy load this to avoid cyclic dependencies
-    from .api import Tank, set_authenticated_user
-
-    data = pickle.loads(context_str)
+    from .api import set_authenticated_user
+
+    if context_str.startswith("{"):
+        data = _from_json(json.loads(context_str))
+        format_version = data.pop("_format_version", None)
+        if format_version != constants.CONTEXT_SERIALIZATION_FORMAT_VERSION:
+            raise TankError("Cannot deserialize context: unsupported format version %s. The context "
+                            "was probably serialized by a different version of the Sgtk API." % format_version)
+    else:
+        # contexts serialized by older versions of the API are pickled
+        data = pickle.loads(context_str)
 
     # first get the pc path out of the dict
     pipeline_config_path = data["_pc_path"]
@@ -1211,8 +1395,9 @@ def deserialize(context_str):
         user = sg_auth.deserialize_user(user_string)
         set_authenticated_user(user)
 
-    # create a Sgtk API instance.
-    tk = Tank(pipeline_config_path)
+    # get a Sgtk API instance.
+    if tk is None or tk.pipeline_configuration.get_path() != pipeline_config_path:
+        tk = _get_tank(pipeline_config_path, user_string, use_tank_cache)
 
     # add it to the constructor instance
     data["tk"] = tk
@@ -1220,6 +1405,47 @@ def deserialize(context_str):
     # and lastly make the obejct
     return Context(**data)
 
+def _get_tank(pipeline_config_path, user_string, use_tank_cache):
+    """
+    Returns a Sgtk API instance for a pipeline configuration.
+
+    :param pipeline_config_path: Path to the pipeline configuration.
+    :param user_string: Serialized user the instance is for, or None.
+    :param use_tank_cache: Reuse the instance created by a previous call for the
+                           same pipeline configuration and user.
+    :returns: Sgtk API instance
+    """
+    # lazy load this to avoid cyclic dependencies
+    from .api import Tank
+
+    if not use_tank_cache:
+        return Tank(pipeline_config_path)
+
+    key = (pipeline_config_path, user_string)
+    g_tank_instances_lock.acquire()
+    try:
+        if key not in g_tank_instances:
+            g_tank_instances[key] = Tank(pipeline_config_path)
+        return g_tank_instances[key]
+    finally:
+        g_tank_instances_lock.release()
+
+def _from_json(value):
+    """
+    Converts the unicode strings of values loaded from json to utf-8 strings,
+    which is how they are returned by Shotgun.
+
+    :param value: Value loaded from json.
+    :returns: Converted value.
+    """
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    if isinstance(value, list):
+        return [_from_json(x) for x in value]
+    if isinstance(value, dict):
+        return dict((_from_json(k), _from_json(v)) for (k, v) in value.iteritems())
+    return value
+
 
 ################################################################################################
 # YAML representer/constructor
@@ -1313,16 +1539,28 @@ def _task_from_sg(tk, task_id, additional_fields = None):
     Because we are constructing the context from a task, we will get a context
     which has both a project, an entity a step and a task associated with it.
 
+    :param tk:                   An Sgtk API instance
+    :param task_id:              The shotgun task id to produce a context for.
+    :param additional_fields:    List of additional fields to query for additional entities.  If this is
+                                'None' then the function will execute the hook to determine them. 
+    """
+    return _tasks_from_sg(tk, [task_id], additional_fields)[task_id]
+
+def _tasks_from_sg(tk, task_ids, additional_fields = None):
+    """
+    Constructs contexts from several shotgun tasks, with a single Shotgun query.
+    Because we are constructing the contexts from tasks, we will get contexts
+    which have both a project, an entity a step and a task associated with them.
+
     Manne 9 April 2013: could we use the path cache primarily and fall back onto
                         a shotgun lookup? 
 
     :param tk:                   An Sgtk API instance
-    :param task_id:              The shotgun task id to produce a context for.
+    :param task_ids:             The shotgun task ids to produce contexts for.
     :param additional_fields:    List of additional fields to query for additional entities.  If this is
                                 'None' then the function will execute the hook to determine them. 
+    :returns:                    Dictionary of form {task id: context dictionary}
     """
-    context = {}
-
     # Look up task's step and entity. This information should be static in practice, so we could
     # likely cache it in the future.
 
@@ -1334,51 +1572,60 @@ def _task_from_sg(tk, task_id, additional_fields = None):
         # ask hook for extra Task entity fields we should query and insert into the additional_entities list.
         additional_fields = tk.execute_core_hook("context_additional_entities").get("entity_fields_on_task", [])
 
-    task = tk.shotgun.find_one("Task", [["id","is",task_id]], standard_fields + additional_fields)
-    if not task:
-        raise TankError("Unable to locate Task with id %s in Shotgun" % task_id)
-
-    # add task so it can be processed with other shotgun entities
-    task["task"] = {"type": "Task", "id": task_id, "name": task["content"]}
-
-    for key in context_keys + additional_fields:
-        data = task.get(key)
-        if data is None:
-            # gracefully skip stuff we don't have
-            # for example tasks may not have a step
-            continue
+    tasks = tk.shotgun.find("Task", [["id", "in", task_ids]], standard_fields + additional_fields)
+    tasks = dict((task["id"], task) for task in tasks)
+
+    contexts = {}
+    for task_id in task_ids:
+        task = tasks.get(task_id)
+        if not task:
+            raise TankError("Unable to locate Task with id %s in Shotgun" % task_id)
+
+        # add task so it can be processed with other shotgun entities
+        task["task"] = {"type": "Task", "id": task_id, "name": task["content"]}
+
+        context = {}
+        for key in context_keys + additional_fields:
+            data = task.get(key)
+            if data is None:
+                # gracefully skip stuff we don't have
+                # for example tasks may not have a step
+                continue
+
+            # be explicit about what we pull in - make no assumptions about what is
+            # being returned from sg (the unit tests mocker doesn't return the same as the API)
+            value = {
+                "name": data.get("name"),
+                "id": data.get("id"),
+                "type": data.get("type")
+            }
 
-        # be explicit about what we pull in - make no assumptions about what is
-        # being returned from sg (the unit tests mocker doesn't return the same as the API)
-        value = {
-            "name": data.get("name"),
-            "id": data.get("id"),
-            "type": data.get("type")
-        }
+            if key in context_keys:
+                context[key] = value
+            elif key in additional_fields:
+                additional_entities = context.get("additional_entities", [])
+                additional_entities.append(value)
+                context["additional_entities"] = additional_entities
 
-        if key in context_keys:
-            context[key] = value
-        elif key in additional_fields:
-            additional_entities = context.get("additional_entities", [])
-            additional_entities.append(value)
-            context["additional_entities"] = additional_entities
+        contexts[task_id] = context
 
-    return context
+    return contexts
 
 
-def _entity_from_sg(tk, entity_type, entity_id):
+def _entities_from_sg(tk, entity_type, entity_ids):
     """
-    Determines the entity details for the specified entity type and id by querying Shotgun.
+    Determines the entity details for the specified entity type and ids by querying Shotgun.
                         
-    If entity_type is 'Project' then this will return a single dictionary for the project.  For all
-    other entity types, this will return dictionaries for both the entity and the project the entity 
-    exists under.
+    If entity_type is 'Project' then this will return a single dictionary for each project.  For
+    all other entity types, this will return dictionaries for both the entity and the project the 
+    entity exists under.
                         
     :param tk:          The sgtk api instance
-    :param entity_type: The entity type to build a context for
-    :param entity_id:   The entity id to build a context for
-    :returns:           Dictionary containing either a project entity-dictionary or both
-                        project and entity entity-dictionaries depending on the input entity type.
+    :param entity_type: The entity type to build contexts for
+    :param entity_ids:  The entity ids to build contexts for
+    :returns:           Dictionary of form {entity id: dictionary} where the dictionaries contain
+                        either a project entity-dictionary or both project and entity 
+                        entity-dictionaries depending on the input entity type.
                         e.g. 
                         {
                             "project":{"type":"Project", "id":123, "name":"My Project"},
@@ -1390,109 +1637,115 @@ def _entity_from_sg(tk, entity_type, entity_id):
     name_field = _get_entity_type_sg_name_field(entity_type)
     
     # get the entity data from Shotgun
-    data = tk.shotgun.find_one(entity_type, [["id", "is", entity_id]], ["project", name_field])
+    sg_data = tk.shotgun.find(entity_type, [["id", "in", entity_ids]], ["project", name_field])
+    sg_data = dict((data["id"], data) for data in sg_data)
 
-    if not data:
-        raise TankError("Unable to locate %s with id %s in Shotgun" % (entity_type, entity_id))
+    contexts = {}
+    for entity_id in entity_ids:
+        data = sg_data.get(entity_id)
+        if not data:
+            raise TankError("Unable to locate %s with id %s in Shotgun" % (entity_type, entity_id))
 
-    # create context
-    context = {}
-    
-    if entity_type == "Project":
-        context["project"] = {"type":"Project", "id": entity_id, "name": data.get(name_field) }
-    
-    else:
-        context["entity"] = {"type": entity_type, "id": entity_id, "name": data.get(name_field) }
-        context["project"] = data.get("project")     
+        # create context
+        context = {}
+        
+        if entity_type == "Project":
+            context["project"] = {"type":"Project", "id": entity_id, "name": data.get(name_field) }
+        
+        else:
+            context["entity"] = {"type": entity_type, "id": entity_id, "name": data.get(name_field) }
+            context["project"] = data.get("project")     
 
-    return context
+        contexts[entity_id] = context
+
+    return contexts
 
 
-def _context_data_from_cache(tk, entity_type, entity_id):
-    """Adds data to context based on path cache.
+def _contexts_data_from_cache(tk, entity_type, entity_ids):
+    """Adds data to contexts based on path cache. The paths of all the entities and
+    all their parents are looked up at once.
 
     :param tk: a Sgtk API instance
     :param entity_type: a Shotgun entity type
-    :param entity_id: a Shotgun entity id
+    :param entity_ids: Shotgun entity ids
+    :returns: Dictionary of form {entity id: context dictionary}
     """
-    context = {}
-
-    # Set entity info for input entity
-    context["entity"] = {"type": entity_type, "id": entity_id}
+    contexts = {}
 
     # Map entity types to context fields
     types_fields = {"Project": "project",
                     "Step": "step",
                     "Task": "task"}
 
-    # Use the path cache to look up all paths linked to the entity and use that to extract
-    # extra entities we should include in the context
+    # Use the path cache to look up all paths linked to the entities and use that to extract
+    # extra entities we should include in the contexts
     path_cache = PathCache(tk)
-
-    # Grab all project roots
-    project_roots = tk.pipeline_configuration.get_data_roots().values()
-
-    # Special case for project as we have the primary data path, which 
-    # always points at a project. We only check if the associated configuration
-    # has any associated data roots, otherwise a primary config won't exist.
-    if tk.pipeline_configuration.has_associated_data_roots():
-        context["project"] = path_cache.get_entity(tk.pipeline_configuration.get_primary_data_root())
-    else:
-        context["project"] = None
-
-    paths = path_cache.get_paths(entity_type, entity_id, primary_only=True)
-
-    for path in paths:
-        # now recurse upwards and look for entity types we haven't found yet
-        curr_path = path
-        curr_entity = path_cache.get_entity(curr_path)
-        
-        if curr_entity is None:
-            # this is some sort of anomaly! the path returned by get_paths
-            # does not resolve in get_entity. This can happen if the storage
-            # mappings are not consistent or if there is not a 1 to 1 relationship
-            #
-            # This can also happen if there are extra slashes at the end of the path
-            # in the local storage defs and in the pipeline_configuration.yml file.
-            raise TankError("The path '%s' associated with %s id %s does not " 
-                            "resolve correctly. This may be an indication of an issue "
-                            "with the local storage setup. Please contact " 
-                            "toolkitsupport@shotgunsoftware.com" % (curr_path, entity_type, entity_id))
-
-        # grab the name for the context entity
-        if curr_entity["type"] == entity_type and curr_entity["id"] == entity_id:
-            context["entity"]["name"] = curr_entity["name"]
-
-        # note - paths returned by get_paths are always prefixed with a
-        # project root so there is no risk we end up with an infinite loop here..
-        while curr_path not in project_roots:
-            curr_path = os.path.abspath(os.path.join(curr_path, ".."))
-            curr_entity = path_cache.get_entity(curr_path)
-            if curr_entity:
-                cur_type = curr_entity["type"]
-                if cur_type in types_fields:
-                    field_name = types_fields[cur_type]
-                    context[field_name] = curr_entity
-
-    path_cache.close()
-    return context
-
-
-def _values_from_path_cache(entity, cur_template, path_cache, required_fields):
+    try:
+        # Special case for project as we have the primary data path, which 
+        # always points at a project. We only check if the associated configuration
+        # has any associated data roots, otherwise a primary config won't exist.
+        if tk.pipeline_configuration.has_associated_data_roots():
+            project = path_cache.get_entity(tk.pipeline_configuration.get_primary_data_root())
+        else:
+            project = None
+
+        paths = path_cache.get_paths_for_entities(entity_type, entity_ids, primary_only=True)
+        all_paths = [path for entity_paths in paths.values() for path in entity_paths]
+        ancestors_by_path = path_cache.get_entities_for_ancestors_of_paths(all_paths)
+    finally:
+        path_cache.close()
+
+    for entity_id in entity_ids:
+        # Set entity info for input entity
+        context = {"entity": {"type": entity_type, "id": entity_id}, 
+                   "project": copy.deepcopy(project)}
+
+        for path in paths[entity_id]:
+            # get the entities for the path and all its parents
+            ancestors = ancestors_by_path[path]
+            curr_entity = ancestors[0][1] if ancestors and ancestors[0][0] == path else None
+            
+            if curr_entity is None:
+                # this is some sort of anomaly! the path returned by get_paths
+                # does not resolve in get_entity. This can happen if the storage
+                # mappings are not consistent or if there is not a 1 to 1 relationship
+                #
+                # This can also happen if there are extra slashes at the end of the path
+                # in the local storage defs and in the pipeline_configuration.yml file.
+                raise TankError("The path '%s' associated with %s id %s does not " 
+                                "resolve correctly. This may be an indication of an issue "
+                                "with the local storage setup. Please contact " 
+                                "toolkitsupport@shotgunsoftware.com" % (path, entity_type, entity_id))
+
+            # grab the name for the context entity
+            if curr_entity["type"] == entity_type and curr_entity["id"] == entity_id:
+                context["entity"]["name"] = curr_entity["name"]
+
+            # now look upwards for entity types we haven't found yet
+            for (curr_path, curr_entity, curr_secondary_entities) in ancestors[1:]:
+                if curr_entity:
+                    cur_type = curr_entity["type"]
+                    if cur_type in types_fields:
+                        field_name = types_fields[cur_type]
+                        context[field_name] = copy.deepcopy(curr_entity)
+
+        contexts[entity_id] = context
+
+    return contexts
+
+
+def _values_from_path_cache(entity, cur_template, entity_paths, required_fields):
     """
     Determine values for template fields based on an entities cached paths.
                             
     :param entity:          The entity to search for fields for
     :param cur_template:    The template to use to search the path cache
-    :path_cache:            An instance of the path_cache to search in
+    :param entity_paths:    The primary paths of the entity in the path cache
     :param required_fields: A list of fields that must exist in any matched path
     :return:                Dictionary of fields found by matching the template against all paths
                             found for the entity
     """
     
-    # use the databsae to go from shotgun type/id --> paths
-    entity_paths = path_cache.get_paths(entity["type"], entity["id"], primary_only=True)
-    
     # Mapping for field values found in conjunction with this entities paths
     unique_fields = {}
     # keys whose values should be removed from return values
@@ -96,6 +96,145 @@ class SynchronizePathCache(Action):
                       "the 'upgrade_folders' tank command.")
 
 
+class PathCacheStatsAction(Action):
+    """
+    Tank command displaying the statistics of the path cache operations saved by 
+    all the processes using the path cache, when the path_cache_stats setting of 
+    the pipeline configuration is on.
+    """
+    
+    def __init__(self):
+        """
+        Constructor
+        """
+        Action.__init__(self, 
+                        "path_cache_stats", 
+                        Action.TK_INSTANCE, 
+                        ("Displays how many path cache lookups, syncs and writes have been carried out "
+                         "and how long they took."), 
+                        "Admin")
+
+        # this method can be executed via the API
+        self.supports_api = True
+        self.parameters = {}        
+        self.parameters["reset"] = { "description": "Delete the statistics once displayed", 
+                                     "default": False, 
+                                     "type": "bool" }
+        
+    def run_noninteractive(self, log, parameters):
+        """
+        API accessor
+        """
+        # validate params and seed default values
+        computed_params = self._validate_parameters(parameters)
+        return self._run(log, computed_params["reset"])
+    
+    def run_interactive(self, log, args):
+        """
+        Tank command accessor
+        """
+        if len(args) == 1 and args[0] == "--reset":
+            reset = True
+        
+        elif len(args) == 0:
+            reset = False
+            
+        else:
+            raise TankError("Syntax: path_cache_stats [--reset]")
+
+        return self._run(log, reset)
+    
+    def _run(self, log, reset):
+        """
+        Actual business logic for command
+        
+        :param log: logger
+        :param reset: boolean flag to indicate that the statistics should be deleted
+        :returns: Dictionary of statistics, as returned by PathCache.get_saved_stats
+        """
+        if not self.tk.pipeline_configuration.get_path_cache_stats_enabled():
+            log.warning("The statistics of the path cache are not saved for this pipeline "
+                        "configuration. Set path_cache_stats to true in the pipeline_configuration.yml "
+                        "file to start saving them.")
+
+        pc = path_cache.PathCache(self.tk)
+        try:
+            stats = pc.get_saved_stats()
+            if stats:
+                log.info("Path cache statistics, slowest operations first:")
+                for line in path_cache.format_stats(stats):
+                    log.info("- %s" % line)
+            else:
+                log.info("No path cache statistics have been saved.")
+
+            if reset:
+                pc.reset_saved_stats()
+                log.info("The path cache statistics have been deleted.")
+        finally:
+            pc.close()
+
+        return stats
+
+
+class PathCacheIndexesAction(Action):
+    """
+    Tank command adding the indices introduced to speed up folder tree lookups to
+    a path cache created by an older version of Toolkit.
+    """
+    
+    def __init__(self):
+        """
+        Constructor
+        """
+        Action.__init__(self, 
+                        "upgrade_path_cache_indexes", 
+                        Action.TK_INSTANCE, 
+                        ("Adds the indices which speed up unregistering folders to a path cache "
+                         "created by an older version of Toolkit."), 
+                        "Admin")
+
+        # this method can be executed via the API
+        self.supports_api = True
+        self.parameters = {}
+        
+    def run_noninteractive(self, log, parameters):
+        """
+        API accessor
+        """
+        return self._run(log)
+    
+    def run_interactive(self, log, args):
+        """
+        Tank command accessor
+        """
+        if len(args) != 0:
+            raise TankError("Syntax: upgrade_path_cache_indexes")
+
+        return self._run(log)
+    
+    def _run(self, log):
+        """
+        Actual business logic for command
+        
+        :param log: logger
+        :returns: List of the names of the indices created.
+        """
+        log.info("Adding the missing indices to the path cache. This locks the path cache "
+                 "and may take a while for large projects...")
+
+        pc = path_cache.PathCache(self.tk)
+        try:
+            created = pc.create_missing_indexes(log)
+        finally:
+            pc.close()
+
+        if created:
+            log.info("Created indices: %s" % ", ".join(created))
+        else:
+            log.info("The path cache is already up to date! Nothing to do!")
+        return created
+
+
 class PathCacheMigrationAction(Action):
     """
     Tank command for migrating an existing project to use the new FilesystemLocation
@@ -166,7 +305,9 @@ class PathCacheMigrationAction(Action):
         log.info("Phase 3/3: Synchronizing your local machine with Shotgun...")
         pc = path_cache.PathCache(self.tk)
         try:
-            pc.synchronize(log, full_sync=True)
+            pc.synchronize(log, 
+                           full_sync=True, 
+                           progress_callback=lambda num_folders: log.info("Synchronized %s folders..." % num_folders))
         finally:
             pc.close()
         
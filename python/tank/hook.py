@@ -13,6 +13,8 @@ Defines the base class for all Tank Hooks.
 
 """
 import os
+import time
+import copy
 import threading
 from . import loader
 from .platform import constants
@@ -24,7 +26,18 @@ class Hook(object):
     engines and apps. The "parent" of the hook is the object that executed the hook,
     which presently could be an instance of the Sgtk API for core hooks, or an Engine
     or Application instance.
+
+    Core hook methods which always return the same value for the same arguments can be
+    declared in the cacheable_methods dictionary of the class implementing them, in which
+    case their results are cached by the Sgtk API. The values of the dictionary are the 
+    number of seconds the results are cached for, or None to cache them for as long as 
+    the Sgtk API instance exists, e.g.:
+
+        cacheable_methods = {"execute": None}
     """
+
+    # methods whose results can be cached, see above
+    cacheable_methods = {}
     
     def __init__(self, parent):
         self.__parent = parent
@@ -227,6 +240,28 @@ def execute_hook_method(hook_paths, parent, method_name, **kwargs):
     """    
     method_name = method_name or constants.DEFAULT_HOOK_METHOD
 
+    # instantiate the class
+    hook = get_hook_class(hook_paths)(parent)
+    
+    # get the method
+    try:
+        hook_method = getattr(hook, method_name)
+    except AttributeError:
+        raise TankError("Cannot execute hook '%s' - the hook class does not "
+                        "have a '%s' method!" % (hook, method_name))
+    
+    # execute the method
+    ret_val = hook_method(**kwargs)
+    
+    return ret_val
+
+def get_hook_class(hook_paths):
+    """
+    Loads the classes of a list of hooks, see execute_hook_method.
+
+    :param hook_paths: List of full paths to hooks, in inheritance order.
+    :returns: The class of the last hook in the list.
+    """
     # keep track of the current base class - this is used when loading hooks to dynamically
     # inherit from the correct base.
     _current_hook_baseclass.value = Hook
@@ -268,21 +303,80 @@ def execute_hook_method(hook_paths, parent, method_name, **kwargs):
     # all class construction done. _current_hook_baseclass contains
     # the last class we iterated over. This is the one we want to 
     # instantiate.
-    
-    # instantiate the class
-    hook = _current_hook_baseclass.value(parent)
-    
-    # get the method
-    try:
-        hook_method = getattr(hook, method_name)
-    except AttributeError:
-        raise TankError("Cannot execute hook '%s' - the hook class does not "
-                        "have a '%s' method!" % (hook, method_name))
-    
-    # execute the method
-    ret_val = hook_method(**kwargs)
-    
-    return ret_val
+    return _current_hook_baseclass.value
+
+def get_cacheable_method_ttl(hook_class, method_name):
+    """
+    Returns whether the results of a hook method can be cached and for how long. Only
+    the declaration of the class implementing the method is taken into account, so that
+    a derived hook overriding a cacheable method isn't cached unless it says so.
+
+    :param hook_class: The hook class.
+    :param method_name: The name of the method or None for the default method.
+    :returns: Tuple of True if the results can be cached and the number of seconds 
+              they can be cached for, or None to cache them indefinitely.
+    """
+    method_name = method_name or constants.DEFAULT_HOOK_METHOD
+    for cls in hook_class.__mro__:
+        if method_name in cls.__dict__:
+            cacheable_methods = cls.__dict__.get("cacheable_methods", {})
+            if method_name in cacheable_methods:
+                return (True, cacheable_methods[method_name])
+            break
+    return (False, None)
+
+
+class HookResultsCache(object):
+    """
+    Cache of the results of hook methods, which expire after the amount of time 
+    they can be cached for. Expired results are discarded when they are looked up
+    and at most HOOK_RESULTS_CACHE_SIZE results are kept, the least recently used
+    ones being evicted first.
+    This class is thread-safe.
+    """
+    def __init__(self):
+        """
+        Construction
+        """
+        # avoid circular refs
+        from .util.lru_cache import LRUCache
+        self._results = LRUCache(constants.HOOK_RESULTS_CACHE_SIZE)
+
+    def get(self, key):
+        """
+        Returns a copy of a cached result.
+
+        :param key: Hashable key the result was cached for.
+        :returns: Tuple of True and the result if a result is cached for the key and
+                  hasn't expired, (False, None) otherwise.
+        """
+        entry = self._results.get(key)
+        if entry is None:
+            return (False, None)
+        (expiry, result) = entry
+        if expiry is not None and expiry < time.time():
+            self._results.remove(key)
+            return (False, None)
+        # the caller may modify the result so always hand out a copy
+        return (True, copy.deepcopy(result))
+
+    def set(self, key, result, ttl=None):
+        """
+        Caches a result.
+
+        :param key: Hashable key to cache the result for.
+        :param result: The result to cache, which is copied.
+        :param ttl: The number of seconds to cache the result for or None to cache it
+                    indefinitely.
+        """
+        expiry = None if ttl is None else time.time() + ttl
+        self._results.set(key, (expiry, copy.deepcopy(result)))
+
+    def clear(self):
+        """
+        Discards all the cached results.
+        """
+        self._results.clear()
 
 def get_hook_baseclass():
     """
@@ -14,10 +14,19 @@ all Tank items in the file system are kept.
 
 """
 
+import atexit
 import collections
+import glob
+import logging
 import sqlite3
+import threading
+import time
 import sys
 import os
+import socket
+import Queue
+import hashlib
+import tempfile
 
 # use api json to cover py 2.5
 # todo - replace with proper external library  
@@ -28,6 +37,10 @@ from .platform.engine import show_global_busy, clear_global_busy
 from .platform import constants
 from .errors import TankError 
 from .util.login import get_current_user
+from .util.lru_cache import LRUCache
+
+# logger for the operations carried out by background threads
+logger = logging.getLogger("sgtk.path_cache")
 
 # Shotgun field definitions to store the path cache data
 SHOTGUN_ENTITY = "FilesystemLocation"
@@ -40,6 +53,52 @@ SG_ENTITY_TYPE_FIELD = "linked_entity_type"
 SG_ENTITY_NAME_FIELD = "code"
 SG_PIPELINE_CONFIG_FIELD = "pipeline_configuration"
 
+# fields of the FilesystemLocation entities replayed in the path cache
+SG_FOLDER_FIELDS = ["id",
+                    SG_METADATA_FIELD, 
+                    SG_IS_PRIMARY_FIELD, 
+                    SG_ENTITY_ID_FIELD,
+                    SG_PATH_FIELD,
+                    SG_ENTITY_TYPE_FIELD, 
+                    SG_ENTITY_NAME_FIELD]
+
+# maximum number of parameters passed to a single sqlite query
+SQLITE_MAX_PARAMETERS = 999
+
+# indices used to look up folder trees, which older path cache databases don't have
+FOLDER_TREE_INDEXES = [
+    ("path_cache_subtree", "CREATE INDEX IF NOT EXISTS path_cache_subtree ON path_cache(root, path COLLATE NOCASE)"),
+    ("shotgun_status_shotgun_id", "CREATE INDEX IF NOT EXISTS shotgun_status_shotgun_id ON shotgun_status(shotgun_id)"),
+]
+
+def _profiled(func):
+    """
+    Decorator recording the calls to a path cache method in the statistics of the 
+    process, together with the time spent in the method and the number of rows it
+    returned.
+
+    :param func: The method to record the calls of.
+    :returns: The decorated method.
+    """
+    def profiled_func(*args, **kwargs):
+        start = time.time()
+        result = None
+        try:
+            result = func(*args, **kwargs)
+            return result
+        finally:
+            if result is None:
+                rows = 0
+            elif isinstance(result, (list, tuple)):
+                rows = len(result)
+            else:
+                rows = 1
+            g_path_cache_stats.record(func.__name__, time.time() - start, rows)
+    profiled_func.__name__ = func.__name__
+    profiled_func.__doc__ = func.__doc__
+    return profiled_func
+
+
 class PathCache(object):
     """
     A global cache which holds the mapping between a shotgun entity and a location on disk.
@@ -55,6 +114,9 @@ class PathCache(object):
         :param tk: Toolkit API instance
         """
         self._connection = None
+        self._pooled_connection = None
+        # in-memory index of the entities associated with paths, see _get_path_entities
+        self._index = None
         self._tk = tk
         self._sync_with_sg = tk.pipeline_configuration.get_shotgun_path_cache_enabled()
         
@@ -78,6 +140,7 @@ class PathCache(object):
         if log:
             log.debug(msg)
     
+    @_profiled
     def _init_db(self):
         """
         Sets up the database
@@ -86,18 +149,33 @@ class PathCache(object):
         # will ensure that there is a valid folder and file on
         # disk, created with all the right permissions etc.
         path_cache_file = self._get_path_cache_location()
-        
-        self._connection = sqlite3.connect(path_cache_file)
-        
-        # this is to handle unicode properly - make sure that sqlite returns 
-        # str objects for TEXT fields rather than unicode. Note that any unicode
-        # objects that are passed into the database will be automatically
-        # converted to UTF-8 strs, so this text_factory guarantees that any character
-        # representation will work for any language, as long as data is either input
-        # as UTF-8 (byte string) or unicode. And in the latter case, the returned data
-        # will always be unicode.
-        self._connection.text_factory = str
-        
+        journal_mode = self._tk.pipeline_configuration.get_path_cache_journal_mode()
+
+        # the shotgun based path cache can be mirrored on the local disk, in which 
+        # case the mirror is used instead
+        mirror_location = self._tk.pipeline_configuration.get_path_cache_mirror_location()
+        if mirror_location and self._sync_with_sg:
+            path_cache_file = g_path_cache_mirrors.get_mirror(self._tk, path_cache_file, mirror_location)
+
+        # reuse a connection previously opened by this thread if possible. New 
+        # connections need to have the database schema checked:
+        self._path_cache_file = path_cache_file
+        self._pooled_connection = g_path_cache_connections.acquire(path_cache_file, journal_mode)
+        self._connection = self._pooled_connection.connection
+        if self._pooled_connection.is_new:
+            # the database file may have been replaced since the in-memory index was
+            # built so it can't be trusted anymore
+            g_path_cache_index.invalidate(path_cache_file)
+            try:
+                _retry_if_locked(self._init_schema)
+            except:
+                self.close()
+                raise
+
+    def _init_schema(self):
+        """
+        Creates the tables of a new database or upgrades the tables of an existing one.
+        """
         c = self._connection.cursor()
         try:
         
@@ -121,6 +199,14 @@ class PathCache(object):
                     CREATE TABLE shotgun_status (path_cache_id integer, shotgun_id integer);
                     
                     CREATE UNIQUE INDEX shotgun_status_id ON shotgun_status(path_cache_id);
+                    
+                    CREATE INDEX path_cache_subtree ON path_cache(root, path COLLATE NOCASE);
+                    
+                    CREATE INDEX shotgun_status_shotgun_id ON shotgun_status(shotgun_id);
+                    
+                    CREATE TABLE full_sync_checkpoint (max_event_log_id integer, last_shotgun_id integer);
+                    
+                    CREATE TABLE sync_watermark (last_shotgun_id integer);
                     """)
                 self._connection.commit()
                 
@@ -138,6 +224,21 @@ class PathCache(object):
                                        CREATE UNIQUE INDEX shotgun_status_id ON shotgun_status(path_cache_id);""")
                     self._connection.commit()
 
+                if "full_sync_checkpoint" not in table_names:
+                    # this is a setup where full syncs can't be resumed
+                    c.executescript("CREATE TABLE full_sync_checkpoint (max_event_log_id integer, last_shotgun_id integer);")
+                    self._connection.commit()
+
+                # note: the indices used to look up folder trees are not added to existing
+                # databases here, as building them on a large path cache takes a while. They 
+                # are added by the upgrade_path_cache_indexes tank command.
+
+                if "sync_watermark" not in table_names:
+                    # this is a setup where the highest id synchronized isn't tracked. It
+                    # will be recorded by the next full sync.
+                    c.executescript("CREATE TABLE sync_watermark (last_shotgun_id integer);")
+                    self._connection.commit()
+
                 
                 # now ensure that some key fields that have been added during the dev cycle are there
                 ret = c.execute("PRAGMA table_info(path_cache)")
@@ -158,6 +259,10 @@ class PathCache(object):
         
                     self._connection.commit()
         
+        except:
+            self._connection.rollback()
+            raise
+
         finally:
             c.close()
 
@@ -278,26 +383,255 @@ class PathCache(object):
         full_path = os.path.join(root_path, path_sep)
         return os.path.normpath(full_path)
 
-    def close(self):
+    def close(self, log=None):
         """
-        Close the database connection.
+        Close the database connection. The connection is actually kept open for a
+        while so that it can be reused by the next path cache created by the current 
+        thread, but any changes which haven't been committed are discarded.
+        
+        The statistics of the path cache operations carried out by the process are 
+        saved if the path_cache_stats setting of the pipeline configuration is on.
+        
+        :param log: Std python logger the statistics are logged to at debug level
+                    or None if the statistics shouldn't be logged.
         """
         if self._connection is not None:
-            self._connection.close()
+            g_path_cache_connections.release(self._pooled_connection)
+            self._pooled_connection = None
             self._connection = None
+            if self._tk.pipeline_configuration.get_path_cache_stats_enabled():
+                g_path_cache_stats.save(self._get_stats_file())
+        self._index = None
+
+        if log:
+            for line in format_stats(self.get_stats()):
+                log.debug("Path cache stats: %s" % line)
+
+    def _begin_write(self, cursor):
+        """
+        Starts a transaction modifying the path cache unless one is already in progress,
+        recording the time spent waiting for other connections to release their write 
+        lock in the statistics.
+
+        The connections' isolation level is IMMEDIATE, so the transaction the sqlite 
+        module starts before the first statement modifying the database acquires the
+        write lock straight away. A statement which doesn't modify anything is used 
+        to trigger it.
+
+        :param cursor: Sqlite database cursor
+        """
+        start = time.time()
+        cursor.execute("DELETE FROM event_log_sync WHERE 0")
+        g_path_cache_stats.record("lock_wait", time.time() - start)
+
+    def _commit(self):
+        """
+        Commits the current transaction, recording the time spent in the statistics.
+        """
+        start = time.time()
+        try:
+            self._connection.commit()
+        finally:
+            g_path_cache_stats.record("commit", time.time() - start)
+
+    ############################################################################################
+    # statistics
+
+    def get_stats(self):
+        """
+        Returns statistics about the path cache operations carried out by the current 
+        process, for all path caches.
+
+        :returns: Dictionary where the keys are the names of the operations, e.g. 
+                  "get_entity", "synchronize", "commit" or "lock_wait", and the values
+                  are dictionaries with keys calls, time (in seconds) and rows.
+        """
+        return g_path_cache_stats.get_stats()
+
+    def get_saved_stats(self):
+        """
+        Returns the statistics saved by all the processes using this path cache, 
+        when the path_cache_stats setting of the pipeline configuration is on.
+
+        :returns: Dictionary in the same form as the one returned by get_stats.
+        """
+        stats = {}
+        for stats_file in self._get_saved_stats_files():
+            for (name, values) in _load_stats(stats_file).iteritems():
+                _add_stats(stats, name, values["calls"], values["time"], values["rows"])
+        return stats
+
+    def reset_saved_stats(self):
+        """
+        Deletes the statistics saved by all the processes using this path cache.
+        """
+        for stats_file in self._get_saved_stats_files():
+            try:
+                os.remove(stats_file)
+            except OSError:
+                # removed by another process
+                pass
+
+    def _get_stats_file(self):
+        """
+        Returns the path to the file the statistics of the current process are saved 
+        to. Each process saves its statistics to its own file, named after the host and 
+        the process id and located next to the path cache database, so that processes 
+        never overwrite each other's statistics.
+
+        :returns: path string
+        """
+        (name, ext) = os.path.splitext(constants.PATH_CACHE_STATS_FILE)
+        file_name = "%s.%s.%d%s" % (name, socket.gethostname(), os.getpid(), ext)
+        return os.path.join(os.path.dirname(self._path_cache_file), file_name)
+
+    def _get_saved_stats_files(self):
+        """
+        Returns the paths to the files the statistics of all the processes were saved to,
+        including the file shared by all processes used by older versions of the path cache.
+
+        :returns: List of path strings
+        """
+        folder = os.path.dirname(self._path_cache_file)
+        (name, ext) = os.path.splitext(constants.PATH_CACHE_STATS_FILE)
+        paths = glob.glob(os.path.join(folder, "%s.*%s" % (name, ext)))
+        shared_path = os.path.join(folder, constants.PATH_CACHE_STATS_FILE)
+        if os.path.exists(shared_path):
+            paths.append(shared_path)
+        return paths
+
+    ############################################################################################
+    # in-memory index
+
+    def _get_index(self):
+        """
+        Returns the in-memory index of the entities associated with paths in this path 
+        cache's database. The index is shared by all the path caches of the process using
+        the same database and is only used when the path cache is synchronized with 
+        Shotgun. In this case, the event log marker stored in the database changes 
+        whenever folders are created or deleted, invalidating the index, and so do the
+        checkpoint of a full sync in progress and the id watermark.
+        
+        :returns: LRUCache instance mapping (root name, db path) tuples to a tuple of a
+                  list of primary entities and a list of secondary entities, each entity
+                  being a (type, id, name) tuple. None if the index shouldn't be used.
+        """
+        if not self._sync_with_sg:
+            return None
+
+        if self._index is None:
+            c = self._connection.cursor()
+            try:
+                res = c.execute("SELECT (SELECT max(last_id) FROM event_log_sync), "
+                                "(SELECT max(last_shotgun_id) FROM full_sync_checkpoint), "
+                                "(SELECT max(last_shotgun_id) FROM sync_watermark)")
+                marker = (self._pooled_connection.file_id, list(res)[0])
+            finally:
+                c.close()
+            self._index = g_path_cache_index.get(self._path_cache_file, marker)
+        return self._index
+
+    def _invalidate_index(self):
+        """
+        Discards the in-memory index after the database was modified.
+        """
+        g_path_cache_index.invalidate(self._path_cache_file)
+        self._index = None
+
+    def _get_missing_indexes(self, cursor):
+        """
+        Returns the indices used to look up folder trees which the database doesn't 
+        have. These are only missing from databases created by older versions of the 
+        path cache.
+
+        :param cursor: Sqlite database cursor
+        :returns: List of (index name, CREATE INDEX statement) tuples.
+        """
+        res = cursor.execute("SELECT name FROM main.sqlite_master WHERE type='index'")
+        index_names = [x[0] for x in res.fetchall()]
+        return [(name, statement) for (name, statement) in FOLDER_TREE_INDEXES if name not in index_names]
+
+    def create_missing_indexes(self, log=None):
+        """
+        Adds the indices used to look up folder trees to a database created by an older 
+        version of the path cache. Building the indices locks the database while the 
+        whole path cache is read, which can take a while for large path caches.
+
+        :param log: Std python logger or None if logging is not required. 
+        :returns: List of the names of the indices created.
+        """
+        c = self._connection.cursor()
+        try:
+            created = []
+            for (name, statement) in self._get_missing_indexes(c):
+                self._log_debug(log, "Creating index %s..." % name)
+                _retry_if_locked(c.execute, statement)
+                self._commit()
+                created.append(name)
+            return created
+        finally:
+            c.close()
+
+    def get_sync_marker(self):
+        """
+        Returns a value identifying the state of the path cache database. A different
+        value is returned once the database has been synchronized with Shotgun or 
+        modified by the current process, so the marker can be used to tell whether 
+        data derived from the path cache is still up to date.
+
+        :returns: Opaque object which should be compared with the 'is' operator, or None
+                  if the path cache isn't synchronized with Shotgun, in which case 
+                  changes made by other processes can't be tracked.
+        """
+        if self._path_cache_disabled:
+            return None
+        return self._get_index()
+
+    def _get_path_entities(self, root_path, db_path):
+        """
+        Returns the entities associated with a path, using the in-memory index.
+
+        :param root_path: Name of the root the path belongs to.
+        :param db_path: The path relative to the root, as stored in the database.
+        :returns: Tuple of a list of primary entities and a list of secondary entities,
+                  each entity being a (type, id, name) tuple.
+        """
+        index = self._get_index()
+        key = (root_path, db_path)
+        entities = index.get(key)
+        if entities is None:
+            c = self._connection.cursor()
+            try:
+                res = c.execute("SELECT entity_type, entity_id, entity_name, primary_entity FROM path_cache WHERE path = ? AND root = ?", (db_path, root_path))
+                data = list(res)
+            finally:
+                c.close()
+            primary_entities = [(str(d[0]), d[1], str(d[2])) for d in data if d[3]]
+            secondary_entities = [(str(d[0]), d[1], str(d[2])) for d in data if not d[3]]
+            entities = (primary_entities, secondary_entities)
+            index.set(key, entities)
+        return entities
                 
     ############################################################################################
     # shotgun synchronization (SG data pushed into path cache database)
 
-    def synchronize(self, log=None, full_sync=False):
+    @_profiled
+    def synchronize(self, log=None, full_sync=False, progress_callback=None):
         """
         Ensure the local path cache is in sync with Shotgun. 
         
         If the method decides to do a full sync, it will attempt to 
-        launch the busy overlay window.
+        launch the busy overlay window. A full sync downloads the folders
+        from Shotgun page by page and commits each page to staging tables, 
+        so that a full sync which is interrupted resumes from the last page 
+        committed the next time the path cache is synchronized. The path 
+        cache content is only replaced once all the pages have been downloaded.
         
         :param log: Std python logger object.
         :param full_sync: Boolean to indicate that a full sync should be carried out. 
+        :param progress_callback: Optional callable which is called during a full sync 
+                                  each time a page of folders has been downloaded, with 
+                                  the number of folders processed so far.
         
         :returns: A list of remote items which were detected, created remotely
                   and not existing in this path cache. These are returned as a list of 
@@ -321,8 +655,13 @@ class PathCache(object):
 
             # check if we should do a full sync
             if full_sync:
-                return self._do_full_sync(c, log)
+                return self._do_full_sync(c, log, progress_callback)
             
+            # an interrupted full sync is resumed before anything else
+            res = c.execute("SELECT count(*) FROM full_sync_checkpoint")
+            if list(res)[0][0]:
+                return self._do_full_sync(c, log, progress_callback)
+
             # first get the last synchronized event log event.        
             res = c.execute("SELECT max(last_id) FROM event_log_sync")
             # get first item in the data set
@@ -333,11 +672,14 @@ class PathCache(object):
             # expect back something like [(249660,)] for a running cache and [(None,)] for a clear
             if len(data) != 1 or data[0] is None:
                 # we should do a full sync
-                return self._do_full_sync(c, log)
+                return self._do_full_sync(c, log, progress_callback)
     
             # we have an event log id - so check if there are any more recent events
             event_log_id = data[0]
 
+            if self._tk.pipeline_configuration.get_path_cache_sync_mode() == "watermark":
+                return self._do_watermark_sync(c, log, event_log_id, progress_callback)
+
             # note! We search for all events greater than the prev event_log_id-1.
             # this way, the first record returned should be the last record that was 
             # synced. This is a way of detecting that the event log chain is not broken.
@@ -377,7 +719,7 @@ class PathCache(object):
             if len(response) == 0:
                 # nothing in event log. Probably a truncated setup.
                 self._log_debug(log, "No sync information in the event log. Falling back on a full sync.")
-                return self._do_full_sync(c, log)
+                return self._do_full_sync(c, log, progress_callback)
                 
             
             elif response[0]["id"] != event_log_id:
@@ -388,7 +730,7 @@ class PathCache(object):
                                      "First event log id returned is %s. It looks "
                                      "like the event log has been truncated, so falling back "
                                      "on a full sync." % (event_log_id, response[0]["id"]))
-                return self._do_full_sync(c, log)        
+                return self._do_full_sync(c, log, progress_callback)        
             
             elif len(response) == 1 and response[0]["id"] == event_log_id:
                 # nothing has changed since the last sync
@@ -398,7 +740,7 @@ class PathCache(object):
             elif num_deletions > 0:
                 # some stuff was deleted. fall back on full sync
                 self._log_debug(log, "Deletions detected, doing full sync") 
-                return self._do_full_sync(c, log)
+                return self._do_full_sync(c, log, progress_callback)
             
             elif num_creations > 0:
                 # we have a complete trail of increments. 
@@ -413,10 +755,11 @@ class PathCache(object):
         finally:       
             c.close()
 
-    def _upload_cache_data_to_shotgun(self, data, event_log_desc, log=None):
+    def _upload_cache_data_to_shotgun(self, data, event_log_desc, log=None, chunk_size=None, max_workers=None):
         """
         Takes a standard chunk of Shotgun data and uploads it to Shotgun
-        using a single batch statement. Then writes a single event log entry record
+        using batch statements of at most chunk_size requests, which are submitted
+        in parallel when there are several. Then writes a single event log entry record
         which binds the created path records. Returns the id of this event log record.
         
         data needs to be a list of dicts with the following keys:
@@ -428,6 +771,12 @@ class PathCache(object):
         
         :param data: List of dicts. See details above.
         :param event_log_desc: Description to add to the event log entry created.
+        :param log: Std python logger or None if logging is not required. 
+        :param chunk_size: Maximum number of entries uploaded by a single batch statement.
+                           Defaults to constants.PATH_CACHE_UPLOAD_CHUNK_SIZE.
+        :param max_workers: Maximum number of batch statements submitted at once, each 
+                            from a separate thread with its own Shotgun connection. 
+                            Defaults to constants.PATH_CACHE_UPLOAD_MAX_WORKERS.
         :returns: A tuple with (event_log_id, sg_id_lookup)
                   - event_log_id is the id for the event log entry which summarizes the 
                     creation event.
@@ -463,29 +812,29 @@ class PathCache(object):
             
             sg_batch_data.append(req)
         
-        # push to shotgun in a single xact
-        self._log_debug(log, "Uploading %s path entries to Shotgun..." % len(sg_batch_data))
+        # push to shotgun in chunks
+        chunk_size = chunk_size or constants.PATH_CACHE_UPLOAD_CHUNK_SIZE
+        chunks = [sg_batch_data[x:x+chunk_size] for x in xrange(0, len(sg_batch_data), chunk_size)]
+        self._log_debug(log, "Uploading %s path entries to Shotgun in %s batches..." % (len(sg_batch_data), len(chunks)))
         
         try:    
-            response = self._tk.shotgun.batch(sg_batch_data)
+            response = self._submit_batches(chunks, max_workers or constants.PATH_CACHE_UPLOAD_MAX_WORKERS, log)
         except Exception, e:
             raise TankError("Critical! Could not update Shotgun with folder "
                             "data. Please contact support. Error details: %s" % e)
         
         # now create a dictionary where input path cache rowid (path_cache_row_id)
         # is mapped to the shotgun ids that were just created
-        def _rowid_from_path(path):
-            for d in data:
-                if d["path"] == path:
-                    return d["path_cache_row_id"] 
-            raise TankError("Could not resolve row id for path! Please contact support! "
-                            "trying to resolve path '%s'. Source data set: %s" % (path, data))
+        rowid_from_path = dict((d["path"], d["path_cache_row_id"]) for d in data)
         
         rowid_sgid_lookup = {}
         for sg_obj in response:
             sg_id = sg_obj["id"]
-            pc_row_id = _rowid_from_path( sg_obj[SG_PATH_FIELD]["local_path"] )
-            rowid_sgid_lookup[pc_row_id] = sg_id
+            path = sg_obj[SG_PATH_FIELD]["local_path"]
+            if path not in rowid_from_path:
+                raise TankError("Could not resolve row id for path! Please contact support! "
+                                "trying to resolve path '%s'. Source data set: %s" % (path, data))
+            rowid_sgid_lookup[rowid_from_path[path]] = sg_id
         
         # now register the created ids in the event log
         # this will later on be read by the synchronization            
@@ -515,6 +864,73 @@ class PathCache(object):
         # return the event log id which represents this uploaded slab
         return (response["id"], rowid_sgid_lookup)
 
+    def _submit_batches(self, chunks, max_workers, log=None):
+        """
+        Submits batch statements to Shotgun. When there are several, up to max_workers
+        of them are submitted at once, each from a separate thread using the thread's 
+        own Shotgun connection. 
+        
+        If any of the batch statements fails, the entities created by the other batch 
+        statements are deleted again before the error is raised.
+
+        :param chunks: List of lists of batch requests.
+        :param max_workers: The maximum number of threads to use.
+        :param log: Std python logger or None if logging is not required. 
+        :returns: The responses of all the batch statements, in the order of the requests.
+        """
+        responses = [None] * len(chunks)
+        errors = []
+        
+        if len(chunks) <= 1 or max_workers <= 1:
+            # no need for threads
+            for (idx, chunk) in enumerate(chunks):
+                try:
+                    responses[idx] = self._tk.shotgun.batch(chunk)
+                except Exception, e:
+                    errors.append(e)
+                    break
+        
+        else:
+            pending = Queue.Queue()
+            for (idx, chunk) in enumerate(chunks):
+                pending.put((idx, chunk))
+
+            def worker():
+                while not errors:
+                    try:
+                        (idx, chunk) = pending.get_nowait()
+                    except Queue.Empty:
+                        return
+                    try:
+                        # note that each thread gets its own shotgun connection
+                        responses[idx] = self._tk.shotgun.batch(chunk)
+                    except Exception, e:
+                        errors.append(e)
+
+            threads = []
+            for _ in range(min(max_workers, len(chunks))):
+                thread = threading.Thread(target=worker)
+                thread.setDaemon(True)
+                thread.start()
+                threads.append(thread)
+            for thread in threads:
+                thread.join()
+        
+        if errors:
+            # leave shotgun as it was
+            created = [sg_obj for response in responses if response for sg_obj in response]
+            if created:
+                self._log_debug(log, "Deleting the %s path entries already uploaded to Shotgun..." % len(created))
+                try:
+                    self._tk.shotgun.batch([{"request_type": "delete", 
+                                             "entity_type": SHOTGUN_ENTITY, 
+                                             "entity_id": sg_obj["id"]} for sg_obj in created])
+                except Exception, e:
+                    self._log_debug(log, "Could not delete the path entries: %s" % e)
+            raise errors[0]
+        
+        return [sg_obj for response in responses for sg_obj in response]
+
     def _get_project_link(self):
         """
         Returns the project link dictionary.
@@ -530,7 +946,8 @@ class PathCache(object):
                 "id": self._tk.pipeline_configuration.get_project_id()
             }
 
-    def _do_full_sync(self, cursor, log):
+    @_profiled
+    def _do_full_sync(self, cursor, log, progress_callback=None):
         """
         Ensure the local path cache is in sync with Shotgun.
         
@@ -541,36 +958,197 @@ class PathCache(object):
             - metadata 
             - path
             
+        If a previous full sync was interrupted, it is resumed from the last page
+        committed and only the items found in the remaining pages are returned.
+            
         :param cursor: Sqlite database cursor
         :param log: Std python logger or None if logging is not required. 
+        :param progress_callback: Optional callable which is called each time a page of
+                                  folders has been downloaded, with the number of folders
+                                  processed so far.
         """
         
-        show_global_busy("Hang on, Toolkit is preparing folders...", 
-                         ("Toolkit is retrieving folder listings from Shotgun and ensuring that your "
-                         "setup is up to date. Hang tight while data is being downloaded..."))
+        # the busy overlay can't be shown by background threads, e.g. when a path 
+        # cache mirror is refreshed
+        show_busy = threading.currentThread().getName() == "MainThread"
+        if show_busy:
+            show_global_busy("Hang on, Toolkit is preparing folders...", 
+                             ("Toolkit is retrieving folder listings from Shotgun and ensuring that your "
+                             "setup is up to date. Hang tight while data is being downloaded..."))
         
         try:
-            self._log_debug(log, "Performing a complete Shotgun folder sync...") 
+            # see if a previous full sync was interrupted. Syncs interrupted by older
+            # versions of the path cache wrote to the path cache tables directly and
+            # can't be resumed.
+            res = cursor.execute("SELECT max_event_log_id, last_shotgun_id FROM full_sync_checkpoint")
+            checkpoint = res.fetchone()
+            res = cursor.execute("SELECT name FROM main.sqlite_master WHERE type='table' "
+                                 "AND name IN ('full_sync_path_cache', 'full_sync_shotgun_status')")
+            if len(res.fetchall()) != 2:
+                checkpoint = None
+
+            if checkpoint:
+                (max_event_log_id, last_shotgun_id) = checkpoint
+                self._log_debug(log, "Resuming the complete Shotgun folder sync after "
+                                     "FilesystemLocation id %s..." % last_shotgun_id)
             
-            # find the max event log id. we will store this in the sync db later.
-            sg_data = self._tk.shotgun.find_one("EventLogEntry", 
-                                                [["event_type", "in", ["Toolkit_Folders_Create", "Toolkit_Folders_Delete"]]], 
-                                                ["id"], 
-                                                [{"field_name": "id", "direction": "desc"}])
-    
-            if sg_data is None:
-                # event log was wiped or we haven't done any folder operations
-                max_event_log_id = 0
             else:
-                max_event_log_id = sg_data["id"]
+                self._log_debug(log, "Performing a complete Shotgun folder sync...") 
+                last_shotgun_id = None
             
-            data = self._replay_folder_entities(cursor, log, max_event_log_id)
+                # find the max event log id. we will store this in the sync db later.
+                sg_data = self._tk.shotgun.find_one("EventLogEntry", 
+                                                    [["event_type", "in", ["Toolkit_Folders_Create", "Toolkit_Folders_Delete"]]], 
+                                                    ["id"], 
+                                                    [{"field_name": "id", "direction": "desc"}])
+        
+                if sg_data is None:
+                    # event log was wiped or we haven't done any folder operations
+                    max_event_log_id = 0
+                else:
+                    max_event_log_id = sg_data["id"]
+            
+            data = self._replay_all_folder_entities(cursor, 
+                                                    log, 
+                                                    max_event_log_id, 
+                                                    last_shotgun_id, 
+                                                    progress_callback)
 
         finally:
-            clear_global_busy()
+            if show_busy:
+                clear_global_busy()
         
         return data
 
+    @_profiled
+    def _do_watermark_sync(self, cursor, log, event_log_id, progress_callback=None):
+        """
+        Ensure the local path cache is in sync with Shotgun.
+        
+        The folders created since the last sync are the ones with ids greater than the 
+        highest id synchronized so far, which is stored in the database. These are 
+        downloaded page by page. Ids are allocated when folders are created but may be
+        committed out of order, so the folders listed by the creation events logged
+        since the last sync which are below the watermark and missing from the path 
+        cache are downloaded as well. The event log is also used to detect deletions, 
+        in which case a full sync is carried out.
+        
+        :param cursor: Sqlite database cursor
+        :param log: Std python logger or None if logging is not required. 
+        :param event_log_id: The event log marker stored in the database.
+        :param progress_callback: Optional callable passed on to a full sync.
+        :returns: A list of remote items which were detected, created remotely
+                  and not existing in this path cache. These are returned as a list of 
+                  dictionaries, each containing keys:
+                    - entity
+                    - metadata
+                    - path 
+        """
+        res = cursor.execute("SELECT max(last_shotgun_id) FROM sync_watermark")
+        watermark = list(res)[0][0]
+        self._log_debug(log, "Path cache sync id watermark in local sqlite db: %r" % watermark)
+        
+        if watermark is None:
+            self._log_debug(log, "No id watermark in the local sqlite db. Falling back on a full sync.")
+            return self._do_full_sync(cursor, log, progress_callback)
+        
+        # make sure no events were lost, as deletions could be missed otherwise
+        if event_log_id and self._tk.shotgun.find_one("EventLogEntry", [["id", "is", event_log_id]]) is None:
+            self._log_debug(log, "Event log entry %s can't be found. It looks like the event log has "
+                                 "been truncated, so falling back on a full sync." % event_log_id)
+            return self._do_full_sync(cursor, log, progress_callback)
+        
+        # find the latest folder event before looking for new folders
+        sg_data = self._tk.shotgun.find_one("EventLogEntry", 
+                                            [["event_type", "in", ["Toolkit_Folders_Create", "Toolkit_Folders_Delete"]],
+                                             ["project", "is", self._get_project_link()]],
+                                            ["id"], 
+                                            [{"field_name": "id", "direction": "desc"}])
+        max_event_log_id = max(event_log_id, sg_data["id"] if sg_data else 0)
+        
+        if max_event_log_id > event_log_id:
+            sg_data = self._tk.shotgun.find_one("EventLogEntry", 
+                                                [["event_type", "is", "Toolkit_Folders_Delete"],
+                                                 ["id", "greater_than", event_log_id],
+                                                 ["project", "is", self._get_project_link()]],
+                                                ["id"])
+            if sg_data:
+                # some stuff was deleted. fall back on full sync
+                self._log_debug(log, "Deletions detected, doing full sync") 
+                return self._do_full_sync(cursor, log, progress_callback)
+        
+        self._log_debug(log, "Fetching the folders created after id %s..." % watermark)
+        return_data = []
+        last_shotgun_id = watermark
+        for sg_data in self._iter_folder_entity_pages(log, watermark):
+            return_data.extend(self._add_folder_entities(cursor, log, sg_data))
+            last_shotgun_id = max(x["id"] for x in sg_data)
+        
+        if max_event_log_id > event_log_id:
+            # folders committed after others with greater ids were synchronized
+            # are below the watermark - find them from the creation events
+            missing_ids = self._get_missed_folder_ids(cursor, log, event_log_id, watermark)
+            if missing_ids:
+                self._log_debug(log, "Fetching the folders committed out of order: %s" % missing_ids)
+                id_in_filter = ["id", "in"]
+                id_in_filter.extend(missing_ids)
+                sg_data = self._tk.shotgun.find(SHOTGUN_ENTITY, 
+                                                [id_in_filter],
+                                                SG_FOLDER_FIELDS,
+                                                [{"field_name": "id", "direction": "asc"},])
+                return_data.extend(self._add_folder_entities(cursor, log, sg_data))
+        
+        if last_shotgun_id == watermark and max_event_log_id == event_log_id:
+            # nothing has changed since the last sync
+            self._log_debug(log, "Path cache syncing not necessary - local folders already up to date!") 
+            return []
+        
+        self._log_debug(log, "Inserting path cache marker %s and id watermark %s in the "
+                             "sqlite db" % (max_event_log_id, last_shotgun_id))
+        self._begin_write(cursor)
+        cursor.execute("DELETE FROM event_log_sync")
+        cursor.execute("INSERT INTO event_log_sync(last_id) VALUES(?)", (max_event_log_id, ))
+        cursor.execute("DELETE FROM sync_watermark")
+        cursor.execute("INSERT INTO sync_watermark(last_shotgun_id) VALUES(?)", (last_shotgun_id, ))
+        
+        self._commit()
+        self._invalidate_index()
+        
+        return return_data
+
+    def _get_missed_folder_ids(self, cursor, log, event_log_id, watermark):
+        """
+        Finds the folders listed by the creation events logged after a given event
+        which have ids below the sync watermark but aren't in the path cache.
+
+        :param cursor: Sqlite database cursor
+        :param log: Std python logger or None if logging is not required. 
+        :param event_log_id: Only events with greater ids are considered.
+        :param watermark: Only folders with lower or equal ids are considered, greater
+                          ids are synchronized from the watermark.
+        :returns: Sorted list of FilesystemLocation ids.
+        """
+        events = self._tk.shotgun.find("EventLogEntry", 
+                                       [["event_type", "is", "Toolkit_Folders_Create"],
+                                        ["id", "greater_than", event_log_id],
+                                        ["project", "is", self._get_project_link()]],
+                                       ["id", "meta"])
+        self._log_debug(log, "Checking the folders of %s creation events against the "
+                             "path cache..." % len(events))
+        candidate_ids = set()
+        for event in events:
+            for sg_id in (event.get("meta") or {}).get("sg_folder_ids", []):
+                if sg_id <= watermark:
+                    candidate_ids.add(sg_id)
+        
+        missing_ids = []
+        for sg_id in sorted(candidate_ids):
+            res = cursor.execute("SELECT 1 FROM shotgun_status WHERE shotgun_id = ?", (sg_id, ))
+            if not list(res):
+                missing_ids.append(sg_id)
+        return missing_ids
+
+    @_profiled
     def _do_incremental_sync(self, cursor, log, sg_data):
         """
         Ensure the local path cache is in sync with Shotgun.
@@ -631,12 +1209,132 @@ class PathCache(object):
         return self._replay_folder_entities(cursor, log, max_event_log_id, created_folder_ids)
 
 
-    def _replay_folder_entities(self, cursor, log, max_event_log_id, ids=None):
+    def _replay_all_folder_entities(self, cursor, log, max_event_log_id, last_shotgun_id, progress_callback):
+        """
+        Downloads all the folders of the project from shotgun and pushes them to 
+        the path cache, replacing its content.
+        
+        The folders are downloaded in pages ordered by id. Each page is written to 
+        staging tables and committed together with a checkpoint recording the last id 
+        processed, so that an interrupted sync can be resumed from there. The path cache
+        tables are left untouched until all pages have been processed. Their content is 
+        then replaced by the staged folders in a single transaction, so other connections
+        never see a partially synchronized path cache. The checkpoint is replaced by the 
+        event_log_sync marker in the sqlite database that tracks what the most recent 
+        event log id was being synced.
+
+        :param cursor: Sqlite database cursor
+        :param log: Std python logger or None if logging is not required. 
+        :param max_event_log_id: max event log marker to write to the path 
+                                 cache database after a full operation.
+        :param last_shotgun_id: Id of the last FilesystemLocation processed by an 
+                                interrupted sync or None to start from scratch.
+        :param progress_callback: Optional callable which is called each time a page of
+                                  folders has been downloaded, with the number of folders
+                                  processed so far.
+        :returns: A list of remote items which were detected, created remotely
+                  and not existing in this path cache. These are returned as a list of 
+                  dictionaries, each containing keys:
+                    - entity
+                    - metadata 
+                    - path
+        """
+        if last_shotgun_id is None:
+            # complete sync - start from empty staging tables
+            self._log_debug(log, "Full sync - clearing local sqlite staging tables...")
+            cursor.executescript("""
+                CREATE TABLE IF NOT EXISTS full_sync_path_cache (entity_type text, entity_id integer, entity_name text, root text, path text, primary_entity integer);
+                CREATE INDEX IF NOT EXISTS full_sync_path_cache_path ON full_sync_path_cache(root, path, primary_entity);
+                CREATE TABLE IF NOT EXISTS full_sync_shotgun_status (path_cache_id integer, shotgun_id integer);
+                """)
+            self._begin_write(cursor)
+            cursor.execute("DELETE FROM full_sync_path_cache")
+            cursor.execute("DELETE FROM full_sync_shotgun_status")
+            cursor.execute("DELETE FROM full_sync_checkpoint")
+            cursor.execute("INSERT INTO full_sync_checkpoint(max_event_log_id, last_shotgun_id) "
+                           "VALUES(?, ?)", (max_event_log_id, 0))
+            self._commit()
+            last_shotgun_id = 0
+
+        num_records = 0
+        return_data = []
+        
+        for sg_data in self._iter_folder_entity_pages(log, last_shotgun_id):
+            return_data.extend(self._add_folder_entities(cursor, log, sg_data, staging=True))
+            num_records += len(sg_data)
+            last_shotgun_id = max(x["id"] for x in sg_data)
+            cursor.execute("UPDATE full_sync_checkpoint SET last_shotgun_id = ?", (last_shotgun_id, ))
+
+            # commit the page so that the sync can be resumed from here
+            self._commit()
+            if progress_callback:
+                progress_callback(num_records)
+
+        # replace the content of the path cache by the staged folders. The rowids are
+        # kept so that the staged shotgun status rows still point to the right rows.
+        self._log_debug(log, "Replacing the local sqlite path cache tables with the folders synced...")
+        self._begin_write(cursor)
+        cursor.execute("DELETE FROM shotgun_status")
+        cursor.execute("DELETE FROM path_cache")
+        cursor.execute("""INSERT INTO path_cache(rowid, entity_type, entity_id, entity_name, root, path, primary_entity)
+                          SELECT rowid, entity_type, entity_id, entity_name, root, path, primary_entity 
+                          FROM full_sync_path_cache""")
+        cursor.execute("""INSERT INTO shotgun_status(path_cache_id, shotgun_id)
+                          SELECT path_cache_id, shotgun_id FROM full_sync_shotgun_status""")
+        cursor.execute("DELETE FROM full_sync_path_cache")
+        cursor.execute("DELETE FROM full_sync_shotgun_status")
+
+        # lastly, id of this event log entry for purpose of future syncing
+        self._log_debug(log, "Inserting path cache marker %s in the sqlite db" % max_event_log_id)
+        cursor.execute("DELETE FROM full_sync_checkpoint")
+        cursor.execute("DELETE FROM event_log_sync")
+        cursor.execute("INSERT INTO event_log_sync(last_id) VALUES(?)", (max_event_log_id, ))
+        # and the highest id synchronized for the purpose of watermark syncs
+        cursor.execute("DELETE FROM sync_watermark")
+        cursor.execute("INSERT INTO sync_watermark(last_shotgun_id) VALUES(?)", (last_shotgun_id, ))
+            
+        self._commit()
+        self._invalidate_index()
+        if progress_callback:
+            progress_callback(num_records)
+
+        return return_data
+
+    def _iter_folder_entity_pages(self, log, last_shotgun_id):
+        """
+        Downloads the folders of the project with ids greater than a given id from 
+        shotgun, one page of PATH_CACHE_SYNC_PAGE_SIZE folders at a time, in the order
+        of their ids.
+
+        :param log: Std python logger or None if logging is not required. 
+        :param last_shotgun_id: Only folders with greater ids are downloaded.
+        :returns: Iterator yielding lists of FilesystemLocation dicts with the 
+                  SG_FOLDER_FIELDS fields.
+        """
+        page_size = constants.PATH_CACHE_SYNC_PAGE_SIZE
+        while True:
+            self._log_debug(log, "Getting the next %s FilesystemLocations for the current project "
+                                 "after id %s..." % (page_size, last_shotgun_id))
+            sg_data = self._tk.shotgun.find(SHOTGUN_ENTITY, 
+                                            [["project", "is", self._get_project_link()],
+                                             ["id", "greater_than", last_shotgun_id]],
+                                            SG_FOLDER_FIELDS,
+                                            [{"field_name": "id", "direction": "asc"},],
+                                            limit=page_size)
+            self._log_debug(log, "...Retrieved %s records." % len(sg_data))
+
+            if sg_data:
+                yield sg_data
+                last_shotgun_id = max(x["id"] for x in sg_data)
+
+            if len(sg_data) < page_size:
+                # this was the last page
+                return
+
+    def _replay_folder_entities(self, cursor, log, max_event_log_id, ids):
         """
         Does the actual download from shotgun and pushes those changes
-        to the path cache. If ids is None, this indicates a full sync, and 
-        the path cache db table is cleared first. If not, the table
-        is appended to.
+        to the path cache for an incremental sync. 
         
         Lastly, this method updates the event_log_sync marker in the sqlite database
         that tracks what the most recent event log id was being synced.
@@ -644,9 +1342,8 @@ class PathCache(object):
         :param cursor: Sqlite database cursor
         :param log: Std python logger or None if logging is not required. 
         :param max_event_log_id: max event log marker to write to the path 
-                                 cache database after a full operation.
-        :param ids: List of FilesystemLocation ids to replay. If set to None,
-                    a full sync will take place.
+                                 cache database after the operation.
+        :param ids: List of FilesystemLocation ids to replay.
         :returns: A list of remote items which were detected, created remotely
                   and not existing in this path cache. These are returned as a list of 
                   dictionaries, each containing keys:
@@ -659,21 +1356,7 @@ class PathCache(object):
         
         sg_data = []
         
-        if ids is None:
-            # get all folder data from shotgun
-            self._log_debug(log, "Doing a full sync, so getting all the FilesystemLocations for "
-                            "the current project...")
-            sg_data = self._tk.shotgun.find(SHOTGUN_ENTITY, 
-                                  [["project", "is", self._get_project_link()]],
-                                  ["id",
-                                   SG_METADATA_FIELD, 
-                                   SG_IS_PRIMARY_FIELD, 
-                                   SG_ENTITY_ID_FIELD,
-                                   SG_PATH_FIELD,
-                                   SG_ENTITY_TYPE_FIELD, 
-                                   SG_ENTITY_NAME_FIELD],
-                                  [{"field_name": "id", "direction": "asc"},])
-        elif ids == []:
+        if ids == []:
             # incremental sync but with no folders
             self._log_debug(log, "No folders need to be replayed, won't fetch anything from Shotgun...")
         
@@ -687,26 +1370,46 @@ class PathCache(object):
             id_in_filter.extend(ids)
             sg_data = self._tk.shotgun.find(SHOTGUN_ENTITY, 
                                   [id_in_filter],
-                                  ["id",
-                                   SG_METADATA_FIELD, 
-                                   SG_IS_PRIMARY_FIELD, 
-                                   SG_ENTITY_ID_FIELD,
-                                   SG_PATH_FIELD,
-                                   SG_ENTITY_TYPE_FIELD, 
-                                   SG_ENTITY_NAME_FIELD],
+                                  SG_FOLDER_FIELDS,
                                   [{"field_name": "id", "direction": "asc"},])
         
         self._log_debug(log, "...Retrieved %s records." % len(sg_data))        
             
         # now start a single transaction in which we do all our work
-        if ids is None:
-            # complete sync - clear our tables first
-            self._log_debug(log, "Full sync - clearing local sqlite path cache tables...")
-            cursor.execute("DELETE FROM event_log_sync")
-            cursor.execute("DELETE FROM shotgun_status")
-            cursor.execute("DELETE FROM path_cache")
+        return_data = self._add_folder_entities(cursor, log, sg_data)
             
-        return_data = []
+        # lastly, id of this event log entry for purpose of future syncing
+        # note - we don't maintain a list of event log entries but just a single
+        # value in the db, so start by clearing the table.
+        self._log_debug(log, "Inserting path cache marker %s in the sqlite db" % max_event_log_id)
+        cursor.execute("DELETE FROM event_log_sync")
+        cursor.execute("INSERT INTO event_log_sync(last_id) VALUES(?)", (max_event_log_id, ))
+            
+        self._commit()
+        self._invalidate_index()
+
+        return return_data
+
+    def _add_folder_entities(self, cursor, log, sg_data, staging=False):
+        """
+        Adds FilesystemLocation records downloaded from shotgun to the path cache,
+        skipping the records which are already in the path cache. The existing 
+        entries for all the paths are fetched at once and the new records are 
+        inserted in bulk. Nothing is committed.
+
+        :param cursor: Sqlite database cursor
+        :param log: Std python logger or None if logging is not required. 
+        :param sg_data: List of FilesystemLocation dicts with the SG_FOLDER_FIELDS fields.
+        :param staging: Add the records to the staging tables of a full sync rather
+                        than to the path cache tables.
+        :returns: A list of remote items which were detected, created remotely
+                  and not existing in this path cache. These are returned as a list of 
+                  dictionaries, each containing keys:
+                    - entity
+                    - metadata 
+                    - path
+        """
+        records = []
             
         for x in sg_data:
             
@@ -716,6 +1419,8 @@ class PathCache(object):
                       "type": x[SG_ENTITY_TYPE_FIELD]}
             is_primary = x[SG_IS_PRIMARY_FIELD]
             
+            self._log_debug(log, "Processing id %s..." % x["id"])
+            
             # note! If a local storage which is associated with a path is retired,
             # parts of the entity data returned by shotgun will be omitted.
             # 
@@ -747,8 +1452,6 @@ class PathCache(object):
             #   'type': 'FilesystemLocation'},
             #
             
-            self._log_debug(log, "Processing id %s..." % x["id"])
-            
             # no path at all - this is an anomaly but handle it gracefully regardless
             if x[SG_PATH_FIELD] is None:
                 self._log_debug(log, "No path associated with entry for %s. Skipping." % entity)
@@ -784,14 +1487,22 @@ class PathCache(object):
                 self._log_debug(log, "Could not resolve storages - skipping: %s" % e)
                 continue
             
-            # all validation checks seem ok - go ahead and make the changes.
-            new_rowid = self._add_db_mapping(cursor, local_os_path, entity, is_primary)
+            # all validation checks seem ok - this record can be added.
+            records.append((x["id"], entity, is_primary, local_os_path))
+
+        table_prefix = "full_sync_" if staging else ""
+        self._begin_write(cursor)
+        rowids = self._add_db_mappings(cursor, [(r[3], r[1], r[2]) for r in records], 
+                                       table_prefix + "path_cache")
+
+        return_data = []
+        sg_status_rows = []
+        for ((sg_id, entity, is_primary, local_os_path), new_rowid) in zip(records, rowids):
             if new_rowid:
                 # something was inserted into the db!
                 # because this record came from shotgun, insert a record in the
                 # shotgun_status table to indicate that this record exists in sg
-                cursor.execute("INSERT INTO shotgun_status(path_cache_id, shotgun_id) "
-                               "VALUES(?, ?)", (new_rowid, x["id"]) )
+                sg_status_rows.append((new_rowid, sg_id))
             
                 # and add this entry to our list of new things that we will return later on.
                 return_data.append({"entity": entity, 
@@ -804,21 +1515,16 @@ class PathCache(object):
                 # not necessarily an anomaly. It could also happen because a previos sync failed
                 # at some point half way through.
                 self._log_debug(log, "Found existing record for '%s', %s. Skipping." % (local_os_path, entity))  
-            
-        # lastly, id of this event log entry for purpose of future syncing
-        # note - we don't maintain a list of event log entries but just a single
-        # value in the db, so start by clearing the table.
-        self._log_debug(log, "Inserting path cache marker %s in the sqlite db" % max_event_log_id)
-        cursor.execute("DELETE FROM event_log_sync")
-        cursor.execute("INSERT INTO event_log_sync(last_id) VALUES(?)", (max_event_log_id, ))
-            
-        self._connection.commit()
+
+        cursor.executemany("INSERT INTO %sshotgun_status(path_cache_id, shotgun_id) VALUES(?, ?)" % table_prefix, 
+                           sg_status_rows)
 
         return return_data
 
     ############################################################################################
     # pre-insertion validation
 
+    @_profiled
     def validate_mappings(self, data):
         """
         Checks a series of path mappings to ensure that they don't conflict with
@@ -907,6 +1613,7 @@ class PathCache(object):
     ############################################################################################
     # database insertion methods
 
+    @_profiled
     def add_mappings(self, data, entity_type, entity_ids):
         """
         Adds a collection of mappings to the path cache in case they are not 
@@ -934,8 +1641,9 @@ class PathCache(object):
         try:
             data_for_sg = []
             
-            for d in data:
-                new_rowid = self._add_db_mapping(c, d["path"], d["entity"], d["primary"]) 
+            self._begin_write(c)
+            rowids = self._add_db_mappings(c, [(d["path"], d["entity"], d["primary"]) for d in data])
+            for (d, new_rowid) in zip(data, rowids):
                 if new_rowid:
                     # this entry wasn't already in the db. So add it to the list to
                     # potentially upload to SG later on
@@ -959,9 +1667,8 @@ class PathCache(object):
                 c.execute("DELETE FROM event_log_sync")
                 c.execute("INSERT INTO event_log_sync(last_id) VALUES(?)", (event_log_id, ))
                 # and indicate in the path cache that all these records have been pushed
-                for (pc_row_id, sg_id) in sg_id_lookup.items():
-                    c.execute("INSERT INTO shotgun_status(path_cache_id, shotgun_id) "
-                              "VALUES(?, ?)", (pc_row_id, sg_id) )
+                c.executemany("INSERT INTO shotgun_status(path_cache_id, shotgun_id) "
+                              "VALUES(?, ?)", sg_id_lookup.items())
                     
 
         except:
@@ -972,7 +1679,8 @@ class PathCache(object):
         
         else:
             # Shotgun insert complete! Now we can commit path cache transaction
-            self._connection.commit()
+            self._commit()
+            self._invalidate_index()
         
         finally:
             c.close()
@@ -980,84 +1688,147 @@ class PathCache(object):
 
 
 
-    def _add_db_mapping(self, cursor, path, entity, primary):
+    def _add_db_mappings(self, cursor, mappings, table="path_cache"):
         """
-        Adds an association to the database. If the association already exists, it will
-        do nothing, just return.
+        Adds associations to the database. Associations which already exist are skipped. 
+        The existing associations for all the paths are fetched at once and the new 
+        associations are inserted in bulk.
         
-        If there is another association which conflicts with the association that is 
+        If there is another association which conflicts with an association that is 
         to be inserted, a TankError is raised.
 
         :param cursor: database cursor to use
-        :param path: a path on disk representing the entity.
-        :param entity: a shotgun entity dict with keys type, id and name
-        :param primary: is this the primary entry for this particular path     
-        
-        :returns: None if nothing was added to the db, otherwise the ROWID for the new row   
+        :param mappings: list of (path, entity, primary) tuples, where path is a path on disk 
+                         representing the entity, entity is a shotgun entity dict with keys 
+                         type, id and name and primary indicates if this is the primary entry 
+                         for this particular path     
+        :param table: The table to add the associations to, either the path cache table
+                      or the staging table of a full sync.
+        
+        :returns: list with, for each mapping, None if nothing was added to the db, 
+                  otherwise the ROWID for the new row   
         """
-        
-        if primary:
-            # the primary entity must be unique: path/id/type 
-            # see if there are any records for this path
-            # note that get_entity does not return secondary entities
-            curr_entity = self.get_entity(path, cursor)
-            
-            if curr_entity is not None:
-                # this path is already registered. Ensure it is connected to
-                # our entity! 
-                #
-                # Note! We are only comparing against the type and the id
-                # not against the name. It should be perfectly valid to rename something
-                # in shotgun and if folders are then recreated for that item, nothing happens
-                # because there is already a folder which repreents that item. (although now with 
-                # an incorrect name)
-                # 
-                # also note that we have already done this once as part of the validation checks -
-                # this time round, we are doing it more as an integrity check.
-                #                
-                if curr_entity["type"] != entity["type"] or curr_entity["id"] != entity["id"]:    
-                    raise TankError("Database concurrency problems: The path '%s' is " 
-                                    "already associated with Shotgun entity %s. Please re-run "
-                                    "folder creation to try again." % (path, str(curr_entity) ))
-                    
-                else:   
-                    # the entry that exists in the db matches what we are trying to insert so skip it
-                    return None
+        keys = []
+        for (path, entity, primary) in mappings:
+            root_name, relative_path = self._separate_root(path)
+            keys.append((root_name, self._path_to_dbpath(relative_path)))
+
+        # get the associations which are already in the db for all these paths
+        primary_entities = {}
+        existing_entries = set()
+        res = self._select_by_paths(cursor, 
+                                    "entity_type, entity_id, entity_name, root, path, primary_entity", 
+                                    [db_path for (root_name, db_path) in keys],
+                                    table)
+        for (entity_type, entity_id, entity_name, root_name, db_path, primary) in res:
+            if primary:
+                primary_entities[(root_name, db_path)] = {"type": str(entity_type), 
+                                                          "id": entity_id, 
+                                                          "name": str(entity_name)}
+            existing_entries.add((entity_type, entity_id, root_name, db_path))
+
+        new_rows = []
+        for ((path, entity, primary), (root_name, db_path)) in zip(mappings, keys):
+
+            if primary:
+                # the primary entity must be unique: path/id/type 
+                # see if there are any records for this path
+                curr_entity = primary_entities.get((root_name, db_path))
                 
-        else:
-            # secondary entity
-            # in this case, it is okay with more than one record for a path
-            # but we don't want to insert the exact same record over and over again
-            paths = self.get_paths(entity["type"], entity["id"], primary_only=False, cursor=cursor)
+                if curr_entity is not None:
+                    # this path is already registered. Ensure it is connected to
+                    # our entity! 
+                    #
+                    # Note! We are only comparing against the type and the id
+                    # not against the name. It should be perfectly valid to rename something
+                    # in shotgun and if folders are then recreated for that item, nothing happens
+                    # because there is already a folder which repreents that item. (although now with 
+                    # an incorrect name)
+                    # 
+                    # also note that we have already done this once as part of the validation checks -
+                    # this time round, we are doing it more as an integrity check.
+                    #                
+                    if curr_entity["type"] != entity["type"] or curr_entity["id"] != entity["id"]:    
+                        raise TankError("Database concurrency problems: The path '%s' is " 
+                                        "already associated with Shotgun entity %s. Please re-run "
+                                        "folder creation to try again." % (path, str(curr_entity) ))
+                        
+                    else:   
+                        # the entry that exists in the db matches what we are trying to insert so skip it
+                        new_rows.append(None)
+                        continue
+                
+                primary_entities[(root_name, db_path)] = entity
+                    
+            else:
+                # secondary entity
+                # in this case, it is okay with more than one record for a path
+                # but we don't want to insert the exact same record over and over again
+                if (entity["type"], entity["id"], root_name, db_path) in existing_entries:
+                    # we already have the association present in the db.
+                    new_rows.append(None)
+                    continue
 
-            if path in paths:
-                # we already have the association present in the db.
-                return None
+            # there was no entity in the db. So let's create it!
+            existing_entries.add((entity["type"], entity["id"], root_name, db_path))
+            new_rows.append((entity["type"], 
+                             entity["id"], 
+                             entity["name"], 
+                             root_name, 
+                             db_path, 
+                             primary))
+
+        inserted_rows = [row for row in new_rows if row is not None]
+        if not inserted_rows:
+            return new_rows
+
+        cursor.executemany("""INSERT INTO %s(entity_type,
+                                             entity_id,
+                                             entity_name,
+                                             root,
+                                             path,
+                                             primary_entity)
+                              VALUES(?, ?, ?, ?, ?, ?)""" % table, 
+                           inserted_rows)
+
+        # now get the ROWIDs of the rows just inserted
+        rowids = {}
+        res = self._select_by_paths(cursor, 
+                                    "rowid, entity_type, entity_id, root, path, primary_entity", 
+                                    [row[4] for row in inserted_rows],
+                                    table)
+        for (rowid, entity_type, entity_id, root_name, db_path, primary) in res:
+            rowids[(entity_type, entity_id, root_name, db_path, bool(primary))] = rowid
+
+        return [rowids[(row[0], row[1], row[3], row[4], bool(row[5]))] if row else None 
+                for row in new_rows]
+
+    def _select_by_paths(self, cursor, columns, db_paths, table="path_cache"):
+        """
+        Selects the rows of the path cache table for several paths at once.
 
-        # there was no entity in the db. So let's create it!
-        root_name, relative_path = self._separate_root(path)
-        db_path = self._path_to_dbpath(relative_path)
-        cursor.execute("""INSERT INTO path_cache(entity_type,
-                                                 entity_id,
-                                                 entity_name,
-                                                 root,
-                                                 path,
-                                                 primary_entity)
-                           VALUES(?, ?, ?, ?, ?, ?)""", 
-                        (entity["type"], 
-                         entity["id"], 
-                         entity["name"], 
-                         root_name, 
-                         db_path, 
-                         primary))
-                
-        return cursor.lastrowid
+        :param cursor: database cursor to use
+        :param columns: the columns to select, e.g. "entity_type, entity_id"
+        :param db_paths: list of paths relative to their root, as stored in the database.
+        :param table: The table to select from, defaults to the path cache table.
+        :returns: list of rows
+        """
+        rows = []
+        db_paths = list(set(db_paths))
+        # sqlite limits the number of parameters of a query, so split long lists
+        for idx in xrange(0, len(db_paths), SQLITE_MAX_PARAMETERS):
+            chunk = db_paths[idx:idx + SQLITE_MAX_PARAMETERS]
+            res = cursor.execute("SELECT %s FROM %s WHERE path IN (%s)" % (columns, table, ",".join(["?"] * len(chunk))), 
+                                 chunk)
+            rows.extend(res.fetchall())
+        return rows
 
 
     
     ############################################################################################
     # database accessor methods
 
+    @_profiled
     def get_shotgun_id_from_path(self, path):
         """
         Returns a FilesystemLocation id given a path.
@@ -1099,6 +1870,7 @@ class PathCache(object):
         else:
             return None
 
+    @_profiled
     def get_folder_tree_from_sg_id(self, shotgun_id):
         """
         Returns a list of items making up the subtree below a certain shotgun id
@@ -1130,12 +1902,24 @@ class PathCache(object):
         matches.append( {"path": self._dbpath_to_path(root_path, path), "sg_id": shotgun_id } )
                          
         
-        # now get all paths that are child paths
-        like_path = "%s/%%" % path
-        res = c.execute("""SELECT pc.root, pc.path, ss.shotgun_id
-                          FROM path_cache pc
-                          INNER JOIN shotgun_status ss on pc.rowid = ss.path_cache_id
-                          WHERE root = ? and path like ?""", (root_name, like_path))
+        # now get all paths that are child paths. These are the paths between 
+        # 'path/' and 'path0', '0' being the character following '/', which is
+        # a range of the path_cache_subtree index. Like the LIKE based query used
+        # when the database doesn't have the index, the comparison is case insensitive.
+        if "path_cache_subtree" not in [name for (name, statement) in self._get_missing_indexes(c)]:
+            res = c.execute("""SELECT pc.root, pc.path, ss.shotgun_id
+                              FROM path_cache pc
+                              INNER JOIN shotgun_status ss on pc.rowid = ss.path_cache_id
+                              WHERE pc.root = ? 
+                              AND pc.path >= ? COLLATE NOCASE 
+                              AND pc.path < ? COLLATE NOCASE""", (root_name, "%s/" % path, "%s0" % path))
+        else:
+            # escape the wildcards which may be part of the folder names
+            like_path = "%s/%%" % path.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            res = c.execute("""SELECT pc.root, pc.path, ss.shotgun_id
+                              FROM path_cache pc
+                              INNER JOIN shotgun_status ss on pc.rowid = ss.path_cache_id
+                              WHERE root = ? and path like ? ESCAPE '\\'""", (root_name, like_path))
         
         for x in list(res):
             root_name = x[0]
@@ -1148,6 +1932,7 @@ class PathCache(object):
         return matches
 
 
+    @_profiled
     def get_paths(self, entity_type, entity_id, primary_only, cursor=None):
         """
         Returns a path given a shotgun entity (type/id pair)
@@ -1193,6 +1978,43 @@ class PathCache(object):
         
         return paths
 
+    @_profiled
+    def get_paths_for_entities(self, entity_type, entity_ids, primary_only):
+        """
+        Returns the paths for several shotgun entities of the same type at once.
+
+        :param entity_type: A Shotgun entity type
+        :param entity_ids: List of Shotgun entity ids
+        :param primary_only: Only return items marked as primary
+        :returns: Dictionary of form {entity id: list of paths on disk}
+        """
+        paths = dict((entity_id, []) for entity_id in entity_ids)
+        if self._path_cache_disabled:
+            # no entries because we don't have a path cache
+            return paths
+
+        entity_ids = list(paths)
+        c = self._connection.cursor()
+        try:
+            # sqlite limits the number of parameters of a query, so split long lists
+            for idx in xrange(0, len(entity_ids), SQLITE_MAX_PARAMETERS - 1):
+                chunk = entity_ids[idx:idx + SQLITE_MAX_PARAMETERS - 1]
+                sql = ("SELECT entity_id, root, path FROM path_cache WHERE entity_type = ? AND entity_id IN (%s)" 
+                       % ",".join(["?"] * len(chunk)))
+                if primary_only:
+                    sql += " AND primary_entity = 1"
+                for (entity_id, root_name, relative_path) in c.execute(sql, [entity_type] + chunk):
+                    root_path = self._roots.get(root_name)
+                    if not root_path:
+                        # The root name doesn't match a recognized name, so skip this entry
+                        continue
+                    paths[entity_id].append(self._dbpath_to_path(root_path, relative_path))
+        finally:
+            c.close()
+
+        return paths
+
+    @_profiled
     def get_entity(self, path, cursor=None):
         """
         Returns an entity given a path.
@@ -1223,17 +2045,24 @@ class PathCache(object):
             # eg. doesn't belong to the project
             return None
 
-        # use built in cursor unless specifically provided - means this
-        # is part of a larger transaction
-        c = cursor or self._connection.cursor()        
+        db_path = self._path_to_dbpath(relative_path)
 
-        try:
-            db_path = self._path_to_dbpath(relative_path)
-            res = c.execute("SELECT entity_type, entity_id, entity_name FROM path_cache WHERE path = ? AND root = ? and primary_entity = 1", (db_path, root_path))
-            data = list(res)
-        finally:
-            if cursor is None:
-                c.close()
+        if cursor is None and self._get_index() is not None:
+            # the index can't be used in a larger transaction as it wouldn't
+            # reflect the changes made in the transaction
+            data = self._get_path_entities(root_path, db_path)[0]
+
+        else:
+            # use built in cursor unless specifically provided - means this
+            # is part of a larger transaction
+            c = cursor or self._connection.cursor()        
+    
+            try:
+                res = c.execute("SELECT entity_type, entity_id, entity_name FROM path_cache WHERE path = ? AND root = ? and primary_entity = 1", (db_path, root_path))
+                data = list(res)
+            finally:
+                if cursor is None:
+                    c.close()
         
         if len(data) > 1:
             # never supposed to happen!
@@ -1246,6 +2075,133 @@ class PathCache(object):
         else:
             return None
 
+    @_profiled
+    def get_entities_for_ancestors(self, path):
+        """
+        Returns the entities associated with a path and with each of its parent folders,
+        up to the root of the project. The entities for all these paths are fetched 
+        from the database at once.
+
+        :param path: a path on disk
+        :returns: List of (path, primary entity, secondary entities) tuples, starting 
+                  with the path itself and ending with the project root. The primary 
+                  entity is a shotgun entity dict, e.g. {"type": "Shot", "name": "xxx", 
+                  "id": 123}, or None and the secondary entities are a list of entity 
+                  dicts. The list is empty if the path doesn't belong to the project.
+        """
+        if self._path_cache_disabled or path is None:
+            return []
+
+        return self.get_entities_for_ancestors_of_paths([path])[path]
+
+    @_profiled
+    def get_entities_for_ancestors_of_paths(self, paths):
+        """
+        Returns the entities associated with several paths and with each of their parent 
+        folders, see get_entities_for_ancestors. The entities for all the paths and their
+        parents are fetched from the database at once.
+
+        :param paths: List of paths on disk
+        :returns: Dictionary of form {path: list of (path, primary entity, secondary 
+                  entities) tuples}, as returned by get_entities_for_ancestors.
+        """
+        if self._path_cache_disabled:
+            return dict((path, []) for path in paths)
+
+        ancestors_by_path = dict((path, self._get_ancestor_keys(path)) for path in paths)
+
+        # get the entities from the index or from the database 
+        index = self._get_index()
+        entities_by_key = {}
+        missing_keys = set()
+        for ancestors in ancestors_by_path.itervalues():
+            for (curr_path, key) in ancestors:
+                if key in entities_by_key or key in missing_keys:
+                    continue
+                entities = index.get(key) if index is not None else None
+                if entities is None:
+                    missing_keys.add(key)
+                else:
+                    entities_by_key[key] = entities
+
+        if missing_keys:
+            fetched_entities = dict((key, ([], [])) for key in missing_keys)
+            c = self._connection.cursor()
+            try:
+                res = self._select_by_paths(c, 
+                                            "root, path, entity_type, entity_id, entity_name, primary_entity", 
+                                            [db_path for (root_path, db_path) in missing_keys])
+            finally:
+                c.close()
+            for (root_path, db_path, entity_type, entity_id, entity_name, primary) in res:
+                entities = fetched_entities.get((root_path, db_path))
+                if entities is not None:
+                    entities[0 if primary else 1].append((str(entity_type), entity_id, str(entity_name)))
+
+            for (key, entities) in fetched_entities.iteritems():
+                if index is not None:
+                    index.set(key, entities)
+                entities_by_key[key] = entities
+
+        results = {}
+        for (path, ancestors) in ancestors_by_path.iteritems():
+            results[path] = []
+            for (curr_path, key) in ancestors:
+                (primary_entities, secondary_entities) = entities_by_key[key]
+                if len(primary_entities) > 1:
+                    # never supposed to happen!
+                    raise TankError("More than one entry in path database for %s!" % curr_path)
+                primary_entity = None
+                if primary_entities:
+                    primary_entity = self._entity_from_tuple(primary_entities[0])
+                results[path].append((curr_path, 
+                                      primary_entity, 
+                                      [self._entity_from_tuple(x) for x in secondary_entities]))
+        return results
+
+    def _get_ancestor_keys(self, path):
+        """
+        Walks up from a path to the project root.
+
+        :param path: a path on disk
+        :returns: List of (path, (root name, db path)) tuples for the path and its 
+                  parents which belong to the project, starting with the path itself.
+        """
+        # walk up to the project root the same way context.from_path always has
+        project_roots = [x.lower() for x in self._roots.values()]
+        ancestors = []
+        curr_path = path
+        while True:
+            try:
+                root_path, relative_path = self._separate_root(curr_path)
+            except TankError:
+                # this path isn't in the project but its parents could be
+                pass
+            else:
+                ancestors.append((curr_path, (root_path, self._path_to_dbpath(relative_path))))
+
+            if curr_path.lower() in project_roots:
+                # we have reached a root!
+                break
+
+            parent_path = os.path.abspath(os.path.join(curr_path, ".."))
+            if curr_path == parent_path:
+                # We're at the disk root, probably a degenerate path
+                break
+            curr_path = parent_path
+
+        return ancestors
+
+    def _entity_from_tuple(self, entity):
+        """
+        Converts an entity stored in the in-memory index to a shotgun entity dict.
+
+        :param entity: (type, id, name) tuple
+        :returns: Shotgun entity dict, e.g. {"type": "Shot", "name": "xxx", "id": 123}
+        """
+        return {"type": entity[0], "id": entity[1], "name": entity[2]}
+
+    @_profiled
     def get_secondary_entities(self, path):
         """
         Returns all the secondary entities for a path.
@@ -1266,13 +2222,18 @@ class PathCache(object):
             # eg. doesn't belong to the project
             return []
 
-        c = self._connection.cursor()
-        try:
-            db_path = self._path_to_dbpath(relative_path)
-            res = c.execute("SELECT entity_type, entity_id, entity_name FROM path_cache WHERE path = ? AND root = ? and primary_entity = 0", (db_path, root_path))
-            data = list(res)
-        finally:
-            c.close()
+        db_path = self._path_to_dbpath(relative_path)
+
+        if self._get_index() is not None:
+            data = self._get_path_entities(root_path, db_path)[1]
+
+        else:
+            c = self._connection.cursor()
+            try:
+                res = c.execute("SELECT entity_type, entity_id, entity_name FROM path_cache WHERE path = ? AND root = ? and primary_entity = 0", (db_path, root_path))
+                data = list(res)
+            finally:
+                c.close()
 
         matches = []
         for d in data:        
@@ -1431,3 +2392,650 @@ class PathCache(object):
         log.info("")
         log.info("Migration complete. %s records created in Shotgun" % len(sg_valid_records))
      
+
+
+############################################################################################
+# database connections
+
+def _retry_if_locked(func, *args, **kwargs):
+    """
+    Calls a function accessing a path cache database, calling it again if the database
+    remains locked by another connection for longer than the busy timeout.
+
+    :param func: Function to call.
+    :returns: The value returned by the function.
+    """
+    delay = constants.PATH_CACHE_BUSY_RETRY_DELAY
+    for attempt in range(constants.PATH_CACHE_BUSY_RETRIES):
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        except sqlite3.OperationalError, e:
+            if "locked" not in str(e):
+                raise
+            time.sleep(delay)
+            delay *= 2
+            # the time spent in the failed attempt was spent waiting for the lock
+            g_path_cache_stats.record("lock_wait", time.time() - start)
+    # last attempt, let the error through
+    return func(*args, **kwargs)
+
+class PooledConnection(object):
+    """
+    A connection to a path cache database handed out by a PathCacheConnectionPool.
+    """
+    def __init__(self, path, connection, file_id, journal_mode):
+        """
+        Construction
+
+        :param path: Path to the path cache database.
+        :param connection: sqlite3 connection to the database.
+        :param file_id: Tuple identifying the database file the connection was opened on.
+        :param journal_mode: The journal mode the connection was opened with.
+        """
+        self.path = path
+        self.connection = connection
+        self.file_id = file_id
+        self.journal_mode = journal_mode
+        # true until the connection is handed out a second time
+        self.is_new = True
+        # time at which the connection was last returned to the pool
+        self.idle_since = None
+
+
+class PathCacheConnectionPool(object):
+    """
+    Keeps the connections to path cache databases open so that they can be reused
+    rather than opening a new connection, and checking the database schema, every 
+    time a path cache is created.
+
+    Sqlite connections can only be used by the thread which created them, so each
+    thread has its own pool of connections. Connections are never handed out to
+    several path caches at once, which could otherwise commit or discard each 
+    other's changes. Connections inherited from a parent process are never reused,
+    and neither are connections to a database file which has since been deleted or 
+    replaced.
+
+    Connections which aren't used for a while are closed, so that files on shared 
+    storage aren't held open for the life of the process. The connections of the 
+    main thread are closed when the process exits. Those of other threads are closed
+    when the threads end.
+    """
+    def __init__(self):
+        """
+        Construction
+        """
+        self._thread_state = threading.local()
+
+    def _get_idle_connections(self):
+        """
+        Returns the connections of the current thread which aren't in use.
+
+        :returns: Dictionary of path cache paths to lists of PooledConnection instances.
+        """
+        state = self._thread_state
+        if getattr(state, "pid", None) != os.getpid():
+            # first use by this thread or this process was forked: connections opened
+            # by the parent process must not be used
+            state.pid = os.getpid()
+            state.idle_connections = {}
+        return state.idle_connections
+
+    def acquire(self, path, journal_mode=None):
+        """
+        Returns a connection to a path cache database, opening a new one if the current 
+        thread has no connection to the database which isn't in use.
+
+        :param path: Path to the path cache database.
+        :param journal_mode: Optional sqlite journal mode for the database, e.g. 'wal'.
+        :returns: PooledConnection instance. Its is_new attribute is true if the
+                  connection was just opened.
+        """
+        self._close_expired_connections()
+
+        file_id = self._get_file_id(path)
+        idle_connections = self._get_idle_connections().get(path, [])
+        while idle_connections:
+            pooled_connection = idle_connections.pop()
+            if pooled_connection.file_id == file_id and pooled_connection.journal_mode == journal_mode:
+                pooled_connection.is_new = False
+                return pooled_connection
+            # database file replaced or settings changed, this connection can't be used anymore
+            pooled_connection.connection.close()
+
+        connection = sqlite3.connect(path,
+                                     timeout=constants.PATH_CACHE_BUSY_TIMEOUT,
+                                     cached_statements=constants.PATH_CACHE_CACHED_STATEMENTS)
+        try:
+            # this is to handle unicode properly - make sure that sqlite returns 
+            # str objects for TEXT fields rather than unicode. Note that any unicode
+            # objects that are passed into the database will be automatically
+            # converted to UTF-8 strs, so this text_factory guarantees that any character
+            # representation will work for any language, as long as data is either input
+            # as UTF-8 (byte string) or unicode. And in the latter case, the returned data
+            # will always be unicode.
+            connection.text_factory = str
+
+            # acquire the write lock when a transaction starts rather than on the first
+            # write, see PathCache._begin_write
+            connection.isolation_level = "IMMEDIATE"
+
+            if journal_mode:
+                # switching the journal mode requires an exclusive lock on the database
+                _retry_if_locked(connection.execute, "PRAGMA journal_mode=%s" % journal_mode)
+        except:
+            connection.close()
+            raise
+
+        return PooledConnection(path, connection, file_id, journal_mode)
+
+    def release(self, pooled_connection):
+        """
+        Returns a connection to the pool once it isn't used anymore. Any changes
+        which haven't been committed are discarded.
+
+        :param pooled_connection: PooledConnection instance returned by acquire().
+        """
+        idle_connections = self._get_idle_connections().setdefault(pooled_connection.path, [])
+        try:
+            pooled_connection.connection.rollback()
+        except sqlite3.Error:
+            # don't reuse a connection in an unknown state
+            pooled_connection.connection.close()
+            return
+
+        if len(idle_connections) < constants.PATH_CACHE_MAX_IDLE_CONNECTIONS:
+            pooled_connection.idle_since = time.time()
+            idle_connections.append(pooled_connection)
+        else:
+            pooled_connection.connection.close()
+
+        self._close_expired_connections()
+
+    def close(self, path=None):
+        """
+        Closes the connections of the current thread which aren't in use.
+
+        :param path: Optional path to a path cache database. If specified, only the
+                     connections to this database are closed.
+        """
+        idle_connections = self._get_idle_connections()
+        for cur_path in idle_connections.keys():
+            if path is None or cur_path == path:
+                for pooled_connection in idle_connections.pop(cur_path):
+                    pooled_connection.connection.close()
+
+    def _close_expired_connections(self):
+        """
+        Closes the connections of the current thread which haven't been used for 
+        longer than the idle timeout.
+        """
+        expiry_time = time.time() - constants.PATH_CACHE_IDLE_CONNECTION_TIMEOUT
+        for idle_connections in self._get_idle_connections().values():
+            for pooled_connection in [x for x in idle_connections if x.idle_since <= expiry_time]:
+                idle_connections.remove(pooled_connection)
+                pooled_connection.connection.close()
+
+    def _get_file_id(self, path):
+        """
+        Returns a tuple identifying a database file, which changes if the file is 
+        deleted and created again.
+
+        :param path: Path to the file.
+        :returns: Tuple of the device and inode numbers of the file, or None if the
+                  file doesn't exist.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_dev, stat.st_ino)
+
+
+# connections to path cache databases shared by all path caches
+g_path_cache_connections = PathCacheConnectionPool()
+atexit.register(g_path_cache_connections.close)
+
+
+class PathCacheIndex(object):
+    """
+    Holds the in-memory indexes of the entities associated with paths in path cache 
+    databases, each index being valid for a given marker read from the database.
+    This class is thread-safe.
+    """
+    def __init__(self):
+        """
+        Construction
+        """
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, marker):
+        """
+        Returns the index for a path cache database, creating a new index if the 
+        current one was created for a different marker.
+
+        :param path: Path to the path cache database.
+        :param marker: Value identifying the state of the database.
+        :returns: LRUCache instance.
+        """
+        self._lock.acquire()
+        try:
+            (index_marker, index) = self._indexes.get(path, (None, None))
+            if index is None or index_marker != marker:
+                index = LRUCache(constants.PATH_CACHE_INDEX_SIZE)
+                self._indexes[path] = (marker, index)
+            return index
+        finally:
+            self._lock.release()
+
+    def invalidate(self, path):
+        """
+        Discards the index for a path cache database.
+
+        :param path: Path to the path cache database.
+        """
+        self._lock.acquire()
+        try:
+            self._indexes.pop(path, None)
+        finally:
+            self._lock.release()
+
+
+# in-memory indexes of the path cache databases shared by all path caches
+g_path_cache_index = PathCacheIndex()
+
+
+class PathCacheMirrors(object):
+    """
+    Maintains copies of shotgun based path caches on the local disk, so that the path
+    cache can be read without accessing the network file system the path cache would 
+    otherwise be stored on. 
+    
+    Each process using a mirror has a background thread which periodically checks 
+    whether the mirror was synchronized with Shotgun recently, as recorded by the 
+    modification time of a file next to the mirror. Only one process of the host 
+    synchronizes a mirror which is out of date, the others skip it while a lock file
+    held by this process exists.
+    This class is thread-safe.
+    """
+    def __init__(self):
+        """
+        Construction
+        """
+        # (process id, thread, stop event) for each mirror refreshed by this process
+        self._refreshers = {}
+        self._lock = threading.Lock()
+
+    def get_mirror(self, tk, path, mirror_location):
+        """
+        Returns the mirror of a path cache database, creating it from the database if it 
+        doesn't exist yet, and makes sure that the mirror is refreshed by this process.
+
+        :param tk: Toolkit API instance used to synchronize the mirror.
+        :param path: Path to the path cache database.
+        :param mirror_location: Folder on the local disk where the mirror is stored.
+        :returns: Path to the mirror.
+        """
+        mirror_path = os.path.join(mirror_location, "path_cache_%s.db" % hashlib.md5(path).hexdigest())
+        
+        self._lock.acquire()
+        try:
+            if not os.path.exists(mirror_path):
+                self._create_mirror(path, mirror_path)
+
+            (pid, thread, stop_event) = self._refreshers.get(mirror_path, (None, None, None))
+            if pid != os.getpid() or not thread.isAlive():
+                # threads aren't inherited from a parent process
+                stop_event = threading.Event()
+                thread = threading.Thread(target=self._refresh, args=(tk, mirror_path, stop_event))
+                thread.setDaemon(True)
+                thread.start()
+                self._refreshers[mirror_path] = (os.getpid(), thread, stop_event)
+        finally:
+            self._lock.release()
+        
+        return mirror_path
+
+    def stop(self, mirror_path=None):
+        """
+        Stops refreshing mirrors.
+
+        :param mirror_path: Path to the mirror to stop refreshing or None to stop
+                            refreshing all the mirrors.
+        """
+        self._lock.acquire()
+        try:
+            if mirror_path is None:
+                refreshers = self._refreshers.values()
+                self._refreshers = {}
+            else:
+                refreshers = [self._refreshers.pop(mirror_path)] if mirror_path in self._refreshers else []
+        finally:
+            self._lock.release()
+
+        for (pid, thread, stop_event) in refreshers:
+            stop_event.set()
+            if pid == os.getpid():
+                thread.join()
+
+    def _create_mirror(self, path, mirror_path):
+        """
+        Creates the mirror of a path cache database. The database is copied to a temporary 
+        file which is then renamed, so that a partially written mirror is never used.
+
+        :param path: Path to the path cache database.
+        :param mirror_path: Path to the mirror.
+        """
+        old_umask = os.umask(0)
+        try:
+            mirror_location = os.path.dirname(mirror_path)
+            if not os.path.exists(mirror_location):
+                os.makedirs(mirror_location, 0777)
+
+            (fd, temp_path) = tempfile.mkstemp(dir=mirror_location, prefix=os.path.basename(mirror_path))
+            os.close(fd)
+            try:
+                if os.path.exists(path) and os.path.getsize(path) > 0:
+                    try:
+                        _copy_database(path, temp_path)
+                    except sqlite3.Error:
+                        # start from an empty mirror which will be synchronized with shotgun
+                        os.remove(temp_path)
+                        open(temp_path, "wb").close()
+                os.chmod(temp_path, 0666)
+                try:
+                    os.rename(temp_path, mirror_path)
+                except OSError:
+                    # another process created the mirror first on windows
+                    if not os.path.exists(mirror_path):
+                        raise
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        finally:
+            os.umask(old_umask)
+
+    def _refresh(self, tk, mirror_path, stop_event):
+        """
+        Synchronizes a mirror with shotgun periodically until told to stop, unless 
+        another process of the host did it recently.
+
+        :param tk: Toolkit API instance used to synchronize the mirror.
+        :param mirror_path: Path to the mirror.
+        :param stop_event: Event set when the mirror should no longer be refreshed.
+        """
+        refreshed_path = "%s.refreshed" % mirror_path
+        lock_path = "%s.lock" % mirror_path
+        while not stop_event.isSet():
+            stop_event.wait(constants.PATH_CACHE_MIRROR_REFRESH_INTERVAL)
+            if stop_event.isSet() or not self._is_stale(refreshed_path):
+                continue
+
+            if not _acquire_lock_file(lock_path, constants.PATH_CACHE_MIRROR_LOCK_TIMEOUT):
+                # another process of this host is refreshing the mirror
+                continue
+            try:
+                # the mirror may have been refreshed while the lock was taken
+                if not self._is_stale(refreshed_path):
+                    continue
+                try:
+                    pc = PathCache(tk)
+                    try:
+                        pc.synchronize()
+                    finally:
+                        pc.close()
+                    _touch(refreshed_path)
+                except Exception, e:
+                    # try again next time
+                    logger.warning("Could not synchronize the path cache mirror %s with "
+                                   "Shotgun: %s" % (mirror_path, e), exc_info=True)
+            finally:
+                _release_lock_file(lock_path)
+
+    def _is_stale(self, refreshed_path):
+        """
+        Checks whether a mirror needs to be synchronized with shotgun.
+
+        :param refreshed_path: Path to the file touched each time the mirror is synchronized.
+        :returns: True if the mirror wasn't synchronized for at least the refresh interval.
+        """
+        try:
+            refresh_time = os.path.getmtime(refreshed_path)
+        except OSError:
+            return True
+        return time.time() - refresh_time >= constants.PATH_CACHE_MIRROR_REFRESH_INTERVAL
+
+def _touch(path):
+    """
+    Creates an empty file or updates its modification time if it exists.
+
+    :param path: Path to the file.
+    """
+    old_umask = os.umask(0)
+    try:
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0666))
+        os.utime(path, None)
+    finally:
+        os.umask(old_umask)
+
+def _acquire_lock_file(path, timeout):
+    """
+    Takes a lock shared by the processes of the host by creating a lock file. A lock 
+    file older than the timeout is assumed to have been left behind by a process which 
+    died and is removed.
+
+    :param path: Path to the lock file.
+    :param timeout: Number of seconds after which the lock file is considered stale.
+    :returns: True if the lock was taken, False if it is held by another process.
+    """
+    try:
+        if time.time() - os.path.getmtime(path) > timeout:
+            os.remove(path)
+    except OSError:
+        # no lock file or it was just removed by another process
+        pass
+
+    old_umask = os.umask(0)
+    try:
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0666))
+    except OSError:
+        return False
+    finally:
+        os.umask(old_umask)
+    return True
+
+def _release_lock_file(path):
+    """
+    Releases a lock taken with _acquire_lock_file.
+
+    :param path: Path to the lock file.
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def _copy_database(path, target_path):
+    """
+    Copies an sqlite database, reading all the tables within a single transaction so 
+    that the copy is consistent even if the database is being written to.
+
+    :param path: Path to the database to copy.
+    :param target_path: Path to the copy, which should be an empty file.
+    """
+    source = sqlite3.connect(path, constants.PATH_CACHE_BUSY_TIMEOUT)
+    try:
+        # manage the transactions explicitly
+        source.isolation_level = None
+        source.execute("BEGIN")
+        target = sqlite3.connect(target_path)
+        try:
+            target.isolation_level = None
+            for statement in source.iterdump():
+                target.execute(statement)
+        finally:
+            target.close()
+    finally:
+        source.close()
+
+
+# local-disk mirrors of the path cache databases refreshed by this process
+g_path_cache_mirrors = PathCacheMirrors()
+
+
+class PathCacheStats(object):
+    """
+    Collects statistics about the path cache operations carried out by the process:
+    the number of calls to each operation, the time spent in them and the number of 
+    rows they returned. The statistics can be saved to a file only written to by 
+    the process.
+    This class is thread-safe.
+    """
+    def __init__(self):
+        """
+        Construction
+        """
+        # statistics since the start of the process and statistics not saved yet
+        self._stats = {}
+        self._unsaved_stats = {}
+        self._last_save = time.time()
+        self._lock = threading.Lock()
+        # serializes the writes of the statistics file by the threads of the process
+        self._save_lock = threading.Lock()
+
+    def record(self, name, duration, rows=0):
+        """
+        Records an operation.
+
+        :param name: Name of the operation.
+        :param duration: Time spent in the operation in seconds.
+        :param rows: Number of rows returned by the operation.
+        """
+        self._lock.acquire()
+        try:
+            _add_stats(self._stats, name, 1, duration, rows)
+            _add_stats(self._unsaved_stats, name, 1, duration, rows)
+        finally:
+            self._lock.release()
+
+    def get_stats(self):
+        """
+        Returns the statistics since the start of the process.
+
+        :returns: Dictionary where the keys are the names of the operations and the
+                  values are dictionaries with keys calls, time and rows.
+        """
+        self._lock.acquire()
+        try:
+            return dict((name, dict(values)) for (name, values) in self._stats.iteritems())
+        finally:
+            self._lock.release()
+
+    def save(self, path, force=False):
+        """
+        Adds the statistics which haven't been saved yet to a file. Unless forced, this 
+        is done at most every PATH_CACHE_STATS_SAVE_INTERVAL seconds. The file should 
+        only be written to by this process. This method doesn't raise if the file can't 
+        be written, the statistics are simply lost.
+
+        :param path: Path to the statistics file.
+        :param force: True to save the statistics whenever the last save happened.
+        """
+        self._lock.acquire()
+        try:
+            if not self._unsaved_stats:
+                return
+            if not force and time.time() - self._last_save < constants.PATH_CACHE_STATS_SAVE_INTERVAL:
+                return
+            unsaved_stats = self._unsaved_stats
+            self._unsaved_stats = {}
+            self._last_save = time.time()
+        finally:
+            self._lock.release()
+
+        self._save_lock.acquire()
+        old_umask = os.umask(0)
+        try:
+            stats = _load_stats(path)
+            for (name, values) in unsaved_stats.iteritems():
+                _add_stats(stats, name, values["calls"], values["time"], values["rows"])
+
+            # write to a temporary file which is then renamed so that other processes
+            # never read a partially written file
+            (fd, temp_path) = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path))
+            try:
+                fh = os.fdopen(fd, "w")
+                try:
+                    json.dump(stats, fh)
+                finally:
+                    fh.close()
+                os.chmod(temp_path, 0666)
+                if os.path.exists(path) and os.name == "nt":
+                    # renaming doesn't replace existing files on windows
+                    os.remove(path)
+                os.rename(temp_path, path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        except (IOError, OSError, ValueError):
+            # the statistics can't be written, continue silently
+            pass
+        finally:
+            os.umask(old_umask)
+            self._save_lock.release()
+
+def _add_stats(stats, name, calls, duration, rows):
+    """
+    Adds to the statistics of an operation.
+
+    :param stats: Dictionary of statistics to update.
+    :param name: Name of the operation.
+    :param calls: Number of calls to add.
+    :param duration: Time in seconds to add.
+    :param rows: Number of rows to add.
+    """
+    values = stats.setdefault(name, {"calls": 0, "time": 0.0, "rows": 0})
+    values["calls"] += calls
+    values["time"] += duration
+    values["rows"] += rows
+
+def _load_stats(path):
+    """
+    Loads statistics saved to a file.
+
+    :param path: Path to the statistics file.
+    :returns: Dictionary of statistics, empty if the file doesn't exist or can't be read.
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        fh = open(path, "r")
+        try:
+            return dict((str(name), values) for (name, values) in json.load(fh).iteritems())
+        finally:
+            fh.close()
+    except (IOError, OSError, ValueError):
+        # the file was removed or is corrupt, start again
+        return {}
+
+def format_stats(stats):
+    """
+    Formats statistics for display, slowest operations first.
+
+    :param stats: Dictionary of statistics as returned by PathCache.get_stats
+    :returns: List of strings, one per operation.
+    """
+    lines = []
+    for (name, values) in sorted(stats.iteritems(), key=lambda x: x[1]["time"], reverse=True):
+        lines.append("%s: %d calls, %.3fs total, %.3fms per call, %d rows" % 
+                     (name, 
+                      values["calls"], 
+                      values["time"], 
+                      1000.0 * values["time"] / max(values["calls"], 1), 
+                      values["rows"]))
+    return lines
+
+
+# statistics of the path cache operations carried out by the process
+g_path_cache_stats = PathCacheStats()
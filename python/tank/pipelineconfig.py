@@ -110,6 +110,12 @@ class PipelineConfiguration(object):
         self._cache_folder = None
         self._path_cache_path = None
         self._use_shotgun_path_cache = None
+        self._path_cache_journal_mode = None
+        self._path_cache_sync_mode = None
+        self._path_cache_mirror_location = None
+        self._path_cache_stats_enabled = None
+        self._cacheable_hooks = None
+        self._core_hook_cache_ttls = {}
 
     def _load_metadata_from_sg(self):
         """
@@ -304,6 +310,138 @@ class PipelineConfiguration(object):
 
         return self._use_shotgun_path_cache
 
+    def get_path_cache_journal_mode(self):
+        """
+        Returns the sqlite journal mode to use for the path cache database.
+
+        This can be set with the path_cache_journal_mode setting in the pipeline
+        configuration file. Setting it to 'wal' turns on write-ahead logging, so that
+        reading the path cache doesn't block writing to it. This should only be done
+        if the cache_location core hook stores the path cache on a local disk, as WAL
+        isn't supported on network file systems such as NFS and may corrupt the
+        database there. By default, the journal mode of the database is left as it is.
+
+        :returns: Journal mode string, e.g. 'wal' or 'delete', or None if the journal
+                  mode of the database shouldn't be changed.
+        """
+        if self._path_cache_journal_mode is None:
+            data = pipelineconfig_utils.get_metadata(self._pc_root)
+            journal_mode = data.get("path_cache_journal_mode")
+            # cache False rather than None so that the settings are only read once
+            self._path_cache_journal_mode = str(journal_mode).lower() if journal_mode else False
+
+        return self._path_cache_journal_mode or None
+
+    def get_path_cache_sync_mode(self):
+        """
+        Returns how the shotgun based path cache finds the folders created since it
+        was last synchronized, as set with the path_cache_sync_mode setting in the 
+        pipeline configuration file:
+
+        - 'event_log' (default): The folder creation event log entries are replayed.
+        - 'watermark': The folders with ids greater than the highest id synchronized 
+          so far are fetched. The event log is only used to detect folder deletions.
+
+        :returns: 'event_log' or 'watermark'
+        """
+        if self._path_cache_sync_mode is None:
+            data = pipelineconfig_utils.get_metadata(self._pc_root)
+            sync_mode = data.get("path_cache_sync_mode") or "event_log"
+            if sync_mode not in ("event_log", "watermark"):
+                raise TankError("Invalid path_cache_sync_mode '%s' in the pipeline configuration %s. "
+                                "Expected 'event_log' or 'watermark'." % (sync_mode, self._pc_root))
+            self._path_cache_sync_mode = sync_mode
+
+        return self._path_cache_sync_mode
+
+    def get_path_cache_mirror_location(self):
+        """
+        Returns the folder on the local disk where a copy of the shotgun based path
+        cache should be kept, as set with the path_cache_mirror_location setting in the
+        pipeline configuration file. Environment variables and ~ are expanded.
+
+        :returns: Path to a folder or None if the path cache shouldn't be mirrored.
+        """
+        if self._path_cache_mirror_location is None:
+            data = pipelineconfig_utils.get_metadata(self._pc_root)
+            location = data.get("path_cache_mirror_location")
+            if location:
+                location = os.path.expanduser(os.path.expandvars(location))
+            # cache False rather than None so that the settings are only read once
+            self._path_cache_mirror_location = location or False
+
+        return self._path_cache_mirror_location or None
+
+    def get_path_cache_stats_enabled(self):
+        """
+        Returns true if the statistics of the path cache operations carried out by each
+        process should be saved, so that they can be reviewed with the path_cache_stats
+        tank command. This is set with the path_cache_stats setting in the pipeline 
+        configuration file and is off by default.
+        """
+        if self._path_cache_stats_enabled is None:
+            data = pipelineconfig_utils.get_metadata(self._pc_root)
+            self._path_cache_stats_enabled = bool(data.get("path_cache_stats"))
+
+        return self._path_cache_stats_enabled
+
+    def get_cacheable_hooks(self):
+        """
+        Returns the core hooks whose results can be cached by the Sgtk API, as set with 
+        the cacheable_hooks setting in the pipeline configuration file. The setting is 
+        either a list of hook names or a dictionary of hook names and the number of 
+        seconds the results of each hook can be cached for, or null to cache them for as
+        long as the API instance exists. Methods of new style hooks are given as 
+        hook_name.method_name, e.g.:
+
+            cacheable_hooks:
+                context_additional_entities: null
+                cache_location.path_cache: 60
+
+        :returns: Dictionary of form {hook name: number of seconds or None}
+        """
+        if self._cacheable_hooks is None:
+            data = pipelineconfig_utils.get_metadata(self._pc_root)
+            cacheable_hooks = data.get("cacheable_hooks") or {}
+            if isinstance(cacheable_hooks, list):
+                cacheable_hooks = dict.fromkeys(cacheable_hooks)
+            if not isinstance(cacheable_hooks, dict):
+                raise TankError("Invalid cacheable_hooks setting in the pipeline configuration "
+                                "file: expected a list or a dictionary of hook names!")
+            for (name, ttl) in cacheable_hooks.iteritems():
+                if ttl is not None and (not isinstance(ttl, (int, float)) or ttl < 0):
+                    raise TankError("Invalid cacheable_hooks setting in the pipeline configuration "
+                                    "file: '%s' should be cached for a positive number of seconds "
+                                    "or null!" % name)
+            self._cacheable_hooks = cacheable_hooks
+
+        return self._cacheable_hooks
+
+    def get_core_hook_cache_ttl(self, hook_name, method_name=None):
+        """
+        Returns whether the results of a core hook can be cached and for how long. This
+        is the case when the hook is listed in the cacheable_hooks setting of the pipeline
+        configuration file or when the hook method is declared in the cacheable_methods
+        of the hook class.
+
+        :param hook_name: Name of the hook.
+        :param method_name: Name of the method of a new style hook or None for an old 
+                            style hook.
+        :returns: Tuple of True if the results can be cached and the number of seconds 
+                  they can be cached for, or None to cache them indefinitely.
+        """
+        key = (hook_name, method_name)
+        if key not in self._core_hook_cache_ttls:
+            cacheable_hooks = self.get_cacheable_hooks()
+            name = hook_name if method_name is None else "%s.%s" % (hook_name, method_name)
+            if name in cacheable_hooks:
+                self._core_hook_cache_ttls[key] = (True, cacheable_hooks[name])
+            else:
+                hook_class = hook.get_hook_class(self._get_core_hook_paths(hook_name, method_name is not None))
+                self._core_hook_cache_ttls[key] = hook.get_cacheable_method_ttl(hook_class, method_name)
+
+        return self._core_hook_cache_ttls[key]
+
     def turn_on_shotgun_path_cache(self):
         """
         Updates the pipeline configuration settings to have the shotgun based (v0.15+)
@@ -642,11 +780,22 @@ class PipelineConfiguration(object):
         
         return env_obj
 
-    def get_templates_config(self):
+    def get_templates_file(self):
+        """
+        Returns the path to the templates file, which may not exist.
+
+        :returns: path string
+        """
+        return os.path.join(self._pc_root, "config", "core", constants.CONTENT_TEMPLATES_FILE)
+
+    def get_templates_config(self, included_files=None):
         """
         Returns the templates configuration as an object
+
+        :param included_files: Optional list to which the paths of the files included
+                               by the templates file are appended.
         """
-        templates_file = os.path.join(self._pc_root, "config", "core", constants.CONTENT_TEMPLATES_FILE)
+        templates_file = self.get_templates_file()
 
         if os.path.exists(templates_file):
             config_file = open(templates_file, "r")
@@ -658,7 +807,7 @@ class PipelineConfiguration(object):
             data = {}
 
         # and process include files
-        data = template_includes.process_includes(templates_file, data)
+        data = template_includes.process_includes(templates_file, data, included_files)
 
         return data
 
@@ -679,19 +828,8 @@ class PipelineConfiguration(object):
         :param **kwargs: Named arguments to pass to the hook
         :returns: Return value of the hook.
         """
-        # first look for the hook in the pipeline configuration
-        # if it does not exist, fall back onto core API default implementation.
-        hook_folder = self.get_core_hooks_location()
-        file_name = "%s.py" % hook_name
-        hook_path = os.path.join(hook_folder, file_name)
-        if not os.path.exists(hook_path):
-            # no custom hook detected in the pipeline configuration
-            # fall back on the hooks that come with the currently running version
-            # of the core API.
-            hooks_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "hooks"))
-            hook_path = os.path.join(hooks_path, file_name)
-
-        return hook.execute_hook(hook_path, parent, **kwargs)
+        hook_paths = self._get_core_hook_paths(hook_name, False)
+        return hook.execute_hook(hook_paths[0], parent, **kwargs)
 
     def execute_core_hook_method_internal(self, hook_name, method_name, parent, **kwargs):
         """
@@ -707,18 +845,39 @@ class PipelineConfiguration(object):
         :param **kwargs: Named arguments to pass to the hook
         :returns: Return value of the hook.
         """
-        # this is a new style hook which supports an inheritance chain
-        
-        # first add the built-in core hook to the chain
+        hook_paths = self._get_core_hook_paths(hook_name, True)
+        return hook.execute_hook_method(hook_paths, parent, method_name, **kwargs)
+
+    def _get_core_hook_paths(self, hook_name, new_style):
+        """
+        Returns the paths to the files implementing a core hook.
+
+        :param hook_name: Name of the hook.
+        :param new_style: True for a new style hook, which supports an inheritance chain.
+        :returns: List of paths in inheritance order.
+        """
         file_name = "%s.py" % hook_name
         hooks_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "hooks"))
-        hook_paths = [os.path.join(hooks_path, file_name)]
-        
-        # now add a custom hook if that exists.
-        hook_folder = self.get_core_hooks_location()        
+        hook_folder = self.get_core_hooks_location()
         hook_path = os.path.join(hook_folder, file_name)
-        if os.path.exists(hook_path):
-            hook_paths.append(hook_path)
+
+        if new_style:
+            # this is a new style hook which supports an inheritance chain
             
-        return hook.execute_hook_method(hook_paths, parent, method_name, **kwargs)
+            # first add the built-in core hook to the chain
+            hook_paths = [os.path.join(hooks_path, file_name)]
+            
+            # now add a custom hook if that exists.
+            if os.path.exists(hook_path):
+                hook_paths.append(hook_path)
+            return hook_paths
+
+        # first look for the hook in the pipeline configuration
+        # if it does not exist, fall back onto core API default implementation.
+        if not os.path.exists(hook_path):
+            # no custom hook detected in the pipeline configuration
+            # fall back on the hooks that come with the currently running version
+            # of the core API.
+            hook_path = os.path.join(hooks_path, file_name)
+        return [hook_path]
 
@@ -84,6 +84,61 @@ PIPELINE_CONFIGURATION_INIT_HOOK_NAME = "pipeline_configuration_init"
 # hook that is executed whenever a cache location should be determined
 CACHE_LOCATION_HOOK_NAME = "cache_location"
 
+# the maximum number of results of cacheable core hooks kept by an API instance
+HOOK_RESULTS_CACHE_SIZE = 1000
+
+# number of seconds a path cache database connection waits for another connection
+# to release its lock before giving up
+PATH_CACHE_BUSY_TIMEOUT = 30.0
+
+# number of times an operation on the path cache database is retried when the database
+# remains locked for longer than the busy timeout, and the initial delay in seconds
+# between attempts. The delay doubles after each attempt.
+PATH_CACHE_BUSY_RETRIES = 3
+PATH_CACHE_BUSY_RETRY_DELAY = 0.5
+
+# number of prepared statements cached by each path cache database connection
+PATH_CACHE_CACHED_STATEMENTS = 100
+
+# maximum number of unused path cache database connections kept open by each thread
+PATH_CACHE_MAX_IDLE_CONNECTIONS = 4
+
+# number of seconds after which an unused path cache database connection is closed
+PATH_CACHE_IDLE_CONNECTION_TIMEOUT = 60.0
+
+# maximum number of paths for which the entities found in the path cache database are
+# kept in memory
+PATH_CACHE_INDEX_SIZE = 10000
+
+# number of FilesystemLocation entities downloaded from Shotgun and committed to the path
+# cache at once during a full sync
+PATH_CACHE_SYNC_PAGE_SIZE = 5000
+
+# number of FilesystemLocation entities created in Shotgun by a single batch request when
+# folders are created, and the maximum number of batch requests sent at once
+PATH_CACHE_UPLOAD_CHUNK_SIZE = 500
+PATH_CACHE_UPLOAD_MAX_WORKERS = 4
+
+# number of seconds between the synchronizations of the local-disk mirror of a path cache
+PATH_CACHE_MIRROR_REFRESH_INTERVAL = 60.0
+
+# number of seconds after which the lock taken by the process refreshing a path cache mirror
+# is considered to have been left behind by a process which died
+PATH_CACHE_MIRROR_LOCK_TIMEOUT = 1800.0
+
+# file next to the path cache database where path cache statistics are saved, and the
+# minimum number of seconds between two saves by a process
+PATH_CACHE_STATS_FILE = "path_cache_stats.json"
+PATH_CACHE_STATS_SAVE_INTERVAL = 10.0
+
+# maximum number of directories for which a Tank instance remembers the context 
+# resolved from the path cache
+CONTEXT_FROM_PATH_CACHE_SIZE = 1000
+
+# version of the format contexts are serialized with. Needs to be bumped whenever
+# the serialized data changes in a way older versions of the API can't read.
+CONTEXT_SERIALIZATION_FORMAT_VERSION = 1
+
 # hook to get current login
 CURRENT_LOGIN_HOOK_NAME = "get_current_login"
 
@@ -210,6 +265,25 @@ TEMPLATE_PATH_SECTION = "paths"
 # the string section in a templates file
 TEMPLATE_STRING_SECTION = "strings"
 
+# the parsers that can be used to extract fields from paths for a template
+TEMPLATE_PARSER_BACKTRACKING = "backtracking"
+TEMPLATE_PARSER_COMPILED = "compiled"
+TEMPLATE_PARSERS = [TEMPLATE_PARSER_BACKTRACKING, TEMPLATE_PARSER_COMPILED]
+
+# the default number of paths for which a template remembers the extracted fields.
+# This can be overridden per template with the cache_size option in the templates file.
+TEMPLATE_FIELDS_CACHE_SIZE = 1000
+
+# the maximum number of threads used to search the file system for paths matching a template
+PATHS_FROM_TEMPLATE_MAX_WORKERS = 8
+
+# the name of the file in the pipeline configuration's cache folder holding the templates
+# read from the templates file, formatted with the platform and the name of the user the
+# templates were cached for. The format version needs to be bumped whenever the template
+# or template key classes change in a way which breaks previously cached data.
+TEMPLATE_CACHE_FILE = "templates.%s.%s.cache"
+TEMPLATE_CACHE_FORMAT_VERSION = 2
+
 # the shotgun engine always has this name
 SHOTGUN_ENGINE_NAME = "tk-shotgun"
 
@@ -0,0 +1,218 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Collapsing of paths found on disk into abstract paths, grouping the frames of
+image sequences without having to parse the path of every frame.
+"""
+
+import os
+import re
+
+from .templatekey import SequenceKey
+
+class ImageSequence(object):
+    """
+    An abstract path together with the frames found on disk for it.
+    """
+    def __init__(self, path, frames):
+        """
+        Construction
+
+        :param path:    The abstract path, e.g. /path/to/file.%04d.exr
+        :param frames:  The frame numbers found for the path.
+        """
+        self.path = path
+        self.frames = sorted(frames)
+
+    @property
+    def first_frame(self):
+        """
+        The first frame found or None if no frames were found.
+        """
+        return self.frames[0] if self.frames else None
+
+    @property
+    def last_frame(self):
+        """
+        The last frame found or None if no frames were found.
+        """
+        return self.frames[-1] if self.frames else None
+
+    @property
+    def missing_frames(self):
+        """
+        Sorted list of the frames between the first and the last frame that
+        were not found.
+        """
+        if not self.frames:
+            return []
+        return sorted(set(range(self.first_frame, self.last_frame + 1)) - set(self.frames))
+
+    def __repr__(self):
+        return "<Sgtk ImageSequence %s [%s-%s]>" % (self.path, self.first_frame, self.last_frame)
+
+
+class SequenceScanner(object):
+    """
+    Collapses the paths found on disk for a template into abstract paths.
+
+    Abstract keys are replaced by their abstract value unless a value is specified
+    for them in the fields. When the last key in the file name is a sequence key
+    followed only by static text, files in the same directory with the same text
+    around the frame number are grouped together and only the first file of each
+    group is parsed. The frame numbers of the other files in the group are simply
+    validated against the sequence key.
+    """
+    def __init__(self, template, fields, search_template=None):
+        """
+        Construction
+
+        :param template:        Template used to build the abstract paths.
+        :param fields:          Mapping of keys to values with which to assemble the
+                                abstract paths.
+        :param search_template: Optional template the paths are found with. This is
+                                either the template or one of its parents and defaults
+                                to the template.
+        """
+        self._template = template
+        self._fields = fields
+        self._search_template = search_template or template
+        self._abstract_key_names = [k.name for k in self._search_template.keys.values() if k.is_abstract]
+
+        self._sequence_key = None
+        self._frame_regex = None
+        if self._search_template is template:
+            self._init_frame_regex()
+
+        # abstract path for each group of files, or None if the files in
+        # the group need to be parsed individually
+        self._groups = {}
+        # frames found for each abstract path
+        self._frames = {}
+
+    def _init_frame_regex(self):
+        """
+        Builds the regular expression used to split file names into the text before
+        the frame number, the frame number and the text after it, if the template
+        allows it.
+        """
+        sequence_keys = [k for k in self._template.keys.values() if isinstance(k, SequenceKey)]
+        if len(sequence_keys) != 1 or sequence_keys[0].name in self._fields:
+            return
+        sequence_key = sequence_keys[0]
+
+        # the sequence key needs to be the last key of the file name in all the
+        # variations of the definition and be followed by the same static text:
+        suffixes = set()
+        for definition in self._template._definitions:
+            file_name = definition.split(os.path.sep)[-1]
+            key_names = re.findall(r"{(.*?)}", file_name)
+            if not key_names or key_names[-1] != sequence_key.name:
+                return
+            suffixes.add(file_name.split("{%s}" % sequence_key.name)[-1])
+        if len(suffixes) != 1:
+            return
+
+        self._sequence_key = sequence_key
+        self._frame_regex = re.compile(r"^(.*?)([0-9]+)(%s)$" % re.escape(suffixes.pop()), re.IGNORECASE)
+
+    def add_path(self, path):
+        """
+        Adds a path found on disk. The path doesn't need to have been validated
+        against the template.
+
+        :param path:    The path to add.
+        :returns:       The abstract path for the path if this is the first path
+                        found for it, otherwise None.
+        """
+        if self._frame_regex:
+            directory, file_name = os.path.split(path)
+            match = self._frame_regex.match(file_name)
+            if match:
+                head, frame_str, tail = match.groups()
+                group_key = (directory, head, len(frame_str), tail)
+                if group_key not in self._groups:
+                    # first file found for the group, parse it to get the values
+                    # of the other keys:
+                    fields = self._search_template.parse(path).fields
+                    if fields is not None and fields.get(self._sequence_key.name) == int(frame_str):
+                        self._groups[group_key] = self._get_abstract_path(fields)
+                    else:
+                        # something else is going on, don't group these files
+                        self._groups[group_key] = None
+
+                abstract_path = self._groups[group_key]
+                if abstract_path is not None:
+                    if not self._sequence_key.validate(frame_str):
+                        return None
+                    return self._add_frame(abstract_path, int(frame_str))
+
+        # parse the path on its own
+        fields = self._search_template.parse(path).fields
+        if fields is None:
+            return None
+        frame = None
+        if self._sequence_key and isinstance(fields.get(self._sequence_key.name), int):
+            frame = fields[self._sequence_key.name]
+        return self._add_frame(self._get_abstract_path(fields), frame)
+
+    def get_sequences(self):
+        """
+        Returns the abstract paths found, together with their frames.
+
+        :returns: List of ImageSequence instances sorted by path.
+        """
+        return [ImageSequence(path, self._frames[path]) for path in sorted(self._frames)]
+
+    def _add_frame(self, abstract_path, frame):
+        """
+        Records a frame found for an abstract path.
+
+        :param abstract_path:   The abstract path.
+        :param frame:           The frame number or None if the path isn't a frame.
+        :returns:               The abstract path if this is the first path found for
+                                it, otherwise None.
+        """
+        is_new = abstract_path not in self._frames
+        frames = self._frames.setdefault(abstract_path, set())
+        if frame is not None:
+            frames.add(frame)
+        return abstract_path if is_new else None
+
+    def _get_abstract_path(self, fields):
+        """
+        Builds the abstract path from the fields found in a path.
+
+        :param fields:  Fields found in the path with the search template.
+        :returns:       The abstract path.
+        """
+        # pass 1 - go through the fields for this file and
+        # zero out the abstract fields - this way, apply
+        # fields will pick up defaults for those fields
+        #
+        # if the system found matches for eye=left and eye=right,
+        # by deleting all eye values they will be replaced by %V
+        # as the template is applied.
+        #
+        for abstract_key_name in self._abstract_key_names:
+            fields.pop(abstract_key_name, None)
+
+        # pass 2 - if we ignored the leaf level, add those fields back
+        # note that there is no risk that we add abstract fields at this point
+        # since the fields dictionary should only ever contain "real" values.
+        # also, we may have deleted actual fields in the pass above and now we
+        # want to put them back again.
+        for f in self._fields:
+            if f not in fields:
+                fields[f] = self._fields[f]
+
+        # now we have all the fields we need to compose the full template
+        return self._template.apply_fields(fields)
@@ -18,9 +18,11 @@ import re
 import sys
 
 from . import templatekey
+from . import template_cache
 from .errors import TankError
 from .platform import constants
-from .template_path_parser import TemplatePathParser
+from .util.lru_cache import LRUCache
+from .template_path_parser import TemplatePathParser, CompiledTemplatePathParser, ParseResult
 
 class Template(object):
     """
@@ -58,7 +60,7 @@ class Template(object):
                 ordered_keys.append(key)
         return names_keys, ordered_keys
         
-    def __init__(self, definition, keys, name=None):
+    def __init__(self, definition, keys, name=None, parser=None, cache_size=None):
         """
         :param definition: Template definition.
         :type definition: String.
@@ -66,9 +68,30 @@ class Template(object):
         :type keys: Dictionary 
         :param name: (Optional) name for this template.
         :type name: String.
+        :param parser: (Optional) name of the parser used to extract fields from paths,
+                       either 'backtracking' (the default) or 'compiled'.
+        :type parser: String.
+        :param cache_size: (Optional) maximum number of paths for which the extracted fields
+                           are remembered. 0 disables the cache.
+        :type cache_size: Integer.
 
         """
         self.name = name
+
+        if cache_size is None:
+            cache_size = constants.TEMPLATE_FIELDS_CACHE_SIZE
+        if not isinstance(cache_size, (int, long)) or cache_size < 0:
+            raise TankError("Template %s has an invalid cache_size '%s'. The cache size must be 0 "
+                            "or a positive integer." % (name, cache_size))
+        # results of get_fields(), keyed by normalized path and skipped keys
+        self._fields_cache = LRUCache(cache_size)
+
+        if parser not in [None] + constants.TEMPLATE_PARSERS:
+            raise TankError("Template %s uses an unknown parser '%s'. Valid parsers are: %s" 
+                            % (name, parser, ", ".join(constants.TEMPLATE_PARSERS)))
+        self._parser = parser or constants.TEMPLATE_PARSER_BACKTRACKING
+        # compiled patterns for each variation, used by the compiled parser
+        self._compiled_patterns = None
         # version for __repr__
         self._repr_def = self._fix_key_names(definition, keys)
 
@@ -105,6 +128,15 @@ class Template(object):
         else:
             return "<Sgtk %s %s>" % (class_name, self._repr_def)
 
+    def __getstate__(self):
+        """
+        Returns the state to pickle. Patterns compiled for the parser are left out
+        and will be compiled again when needed.
+        """
+        state = self.__dict__.copy()
+        state["_compiled_patterns"] = None
+        return state
+
     @property
     def definition(self):
         """
@@ -195,6 +227,154 @@ class Template(object):
         """
         return self._apply_fields(fields, platform=platform)
 
+    def apply_fields_batch(self, fields_list, platform=None):
+        """
+        Creates paths for several sets of fields at once. This gives the same results as
+        calling apply_fields() for each set of fields but is much faster when the sets of
+        fields share values, as the definition variation used for each combination of keys
+        and the string for each value are only computed once.
+
+        :param fields_list: List of mappings of keys to fields.
+        :param platform: Optional operating system platform, as for apply_fields().
+
+        :returns: List of paths, in the same order as the list of fields.
+        """
+        # variation index and keys for each set of keys with values:
+        variations = {}
+        # string for each value of each key:
+        value_strings = {}
+
+        paths = []
+        for fields in fields_list:
+            key_names = frozenset(name for name in fields if fields[name] is not None)
+            variation = variations.get(key_names)
+            if variation is None:
+                variation = self._get_apply_fields_variation(fields)
+                variations[key_names] = variation
+            (index, keys) = variation
+
+            processed_fields = {}
+            for key_name, key in keys.iteritems():
+                value = fields.get(key_name)
+                if value is None:
+                    # defaults may be generated on the fly, don't reuse them
+                    processed_fields[key_name] = key.str_from_value(value)
+                    continue
+                cache_key = (key_name, type(value), value)
+                try:
+                    value_string = value_strings.get(cache_key)
+                except TypeError:
+                    # unhashable value
+                    cache_key = None
+                    value_string = None
+                if value_string is None:
+                    value_string = key.str_from_value(value)
+                    if cache_key is not None:
+                        value_strings[cache_key] = value_string
+                processed_fields[key_name] = value_string
+
+            paths.append(self._get_full_path(self._cleaned_definitions[index] % processed_fields, platform))
+        return paths
+
+    def apply_fields_product(self, base_fields, varying, platform=None):
+        """
+        Creates paths for all the combinations of values of some keys. The definition
+        variation is resolved and the values of the keys which don't vary are validated
+        only once, so that only the varying keys are processed for each path.
+
+        Example:
+
+            >>> tmpl = tk.templates["nuke_shot_render_mono_dpx"]
+            >>> tmpl.apply_fields_product({"Sequence": "seq_1", "Shot": "shot_2", "name": "main", 
+            ...                            "version": 3}, {"SEQ": range(1, 4)})
+            ['/mnt/proj/seq_1/shot_2/render/main/v003/shot_2_main_v003.0001.dpx',
+             '/mnt/proj/seq_1/shot_2/render/main/v003/shot_2_main_v003.0002.dpx',
+             '/mnt/proj/seq_1/shot_2/render/main/v003/shot_2_main_v003.0003.dpx']
+
+        :param base_fields: Mapping of keys to the values that are the same for all paths.
+        :param varying: Mapping of keys to lists of values. Paths are created for all 
+                        the combinations of these values.
+        :param platform: Optional operating system platform, as for apply_fields().
+
+        :returns: List of paths. The varying keys are combined in alphabetical order
+                  of their names, with the values of the last key changing the fastest, 
+                  in the order of the lists of values.
+        """
+        varying_names = sorted(varying)
+        varying_values = [list(varying[name]) for name in varying_names]
+        if not all(varying_values):
+            # no combinations
+            return []
+
+        if any(value is None for values in varying_values for value in values):
+            # the variation used depends on which keys have values so it can't be
+            # resolved once for all the combinations:
+            fields_list = []
+            for combination in _product(varying_values):
+                fields = dict(base_fields)
+                fields.update(zip(varying_names, combination))
+                fields_list.append(fields)
+            return self.apply_fields_batch(fields_list, platform)
+
+        # the variation only depends on which keys have values:
+        fields = dict(base_fields)
+        for name, values in zip(varying_names, varying_values):
+            fields[name] = values[0]
+        (index, keys) = self._get_apply_fields_variation(fields)
+        definition = self._cleaned_definitions[index]
+
+        # resolve the keys which don't vary into the definition once, leaving
+        # placeholders for the varying keys only:
+        placeholders = {}
+        for key_name, key in keys.iteritems():
+            if key_name in varying:
+                placeholders[key_name] = "%%(%s)s" % key_name
+            else:
+                value_string = key.str_from_value(base_fields.get(key_name))
+                placeholders[key_name] = value_string.replace("%", "%%")
+        definition = definition % placeholders
+
+        # prefix the definition with the root path once rather than for each path, unless
+        # the root path contains characters which would be interpreted by the formatting:
+        full_definition = None
+        if platform is None:
+            prefixed_definition = self._get_full_path(definition, platform)
+            if prefixed_definition.count("%") == definition.count("%"):
+                full_definition = prefixed_definition
+
+        # the strings of the varying keys, each list of values is validated at once.
+        # Keys which aren't in the definition are ignored:
+        varying_strings = []
+        for name, values in zip(varying_names, varying_values):
+            key = keys.get(name)
+            if key is None:
+                varying_strings.append([None] * len(values))
+            else:
+                varying_strings.append(key._str_from_values(values))
+
+        if full_definition is None:
+            paths = []
+            for combination in _product(varying_strings):
+                processed_fields = dict(zip(varying_names, combination))
+                paths.append(self._get_full_path(definition % processed_fields, platform))
+            return paths
+
+        # turn the placeholders into positional ones so that each path is a single
+        # string formatting of the strings of the combination:
+        positions = []
+        def to_positional(match):
+            if match.group(0) == "%%":
+                return "%%"
+            positions.append(varying_names.index(match.group(1)))
+            return "%s"
+        positional_definition = re.sub(r"%%|%\((\w+)\)s", to_positional, full_definition)
+
+        if positions == [0] and len(varying_strings) == 1:
+            # a single key appearing once, e.g. the frame number
+            return [positional_definition % (value_string,) for value_string in varying_strings[0]]
+        return [positional_definition % tuple([combination[p] for p in positions])
+                for combination in _product(varying_strings)]
+
     def _apply_fields(self, fields, ignore_types=None, platform=None):
         """
         Creates path using fields.
@@ -213,21 +393,7 @@ class Template(object):
         """        
         ignore_types = ignore_types or []
 
-        # find largest key mapping without missing values
-        keys = None
-        # index of matching keys will be used to find cleaned_definition
-        index = -1
-        for index, cur_keys in enumerate(self._keys):
-            missing_keys = self._missing_keys(fields, cur_keys, skip_defaults=True)
-            if not missing_keys:
-                keys = cur_keys
-                break
-
-        
-        if keys is None:
-            raise TankError("Tried to resolve a path from the template %s and a set "
-                            "of input fields '%s' but the following required fields were missing "
-                            "from the input: %s" % (self, fields, missing_keys))
+        (index, keys) = self._get_apply_fields_variation(fields)
 
         # Process all field values through template keys 
         processed_fields = {}
@@ -236,7 +402,36 @@ class Template(object):
             ignore_type =  key_name in ignore_types
             processed_fields[key_name] = key.str_from_value(value, ignore_type=ignore_type)
 
-        return self._cleaned_definitions[index] % processed_fields
+        return self._get_full_path(self._cleaned_definitions[index] % processed_fields, platform)
+
+    def _get_apply_fields_variation(self, fields):
+        """
+        Finds the most inclusive definition variation for which there are no missing
+        fields.
+
+        :param fields: Mapping of keys to fields.
+        :returns: Tuple of the index of the variation and its keys.
+        :raises: TankError if fields are missing for all the variations.
+        """
+        # find largest key mapping without missing values
+        for index, cur_keys in enumerate(self._keys):
+            missing_keys = self._missing_keys(fields, cur_keys, skip_defaults=True)
+            if not missing_keys:
+                return (index, cur_keys)
+
+        raise TankError("Tried to resolve a path from the template %s and a set "
+                        "of input fields '%s' but the following required fields were missing "
+                        "from the input: %s" % (self, fields, missing_keys))
+
+    def _get_full_path(self, relative_path, platform):
+        """
+        Turns the string resolved from the definition into the final path.
+
+        :param relative_path: The definition with the fields inserted.
+        :param platform: Optional operating system platform.
+        :returns: The final path.
+        """
+        return relative_path
 
     def _definition_variations(self, definition):
         """
@@ -335,11 +530,10 @@ class Template(object):
         skip_keys = skip_keys or []
         
         # Path should split into keys as per template
-        path_fields = {}
-        try:
-            path_fields = self.get_fields(path, skip_keys=skip_keys)
-        except TankError:
+        result = self.parse(path, skip_keys=skip_keys)
+        if not result:
             return None
+        path_fields = result.fields
         
         # Check that all required fields were found in the path:
         for key, value in required_fields.items():
@@ -377,26 +571,156 @@ class Template(object):
         :returns: Values found in the path based on keys in template
         :rtype: Dictionary
         """
-        path_parser = None
-        fields = None
+        result = self.parse(input_path, skip_keys)
+        if not result:
+            raise TankError("Template %s: %s" % (str(self), result.error))
+        return result.fields
+
+    def parse(self, input_path, skip_keys=None):
+        """
+        Extracts key name, value pairs from a string without raising an error if the
+        string doesn't match the template.  This doesn't modify the template or its
+        keys so can safely be called from multiple threads.
+
+        :param input_path: Source path for values
+        :type input_path: String
+        :param skip_keys: Optional keys to skip
+        :type skip_keys: List
+
+        :returns: ParseResult containing either the values found in the path based on 
+                  keys in template or the error reported if the path doesn't match.
+        :rtype: ParseResult
+        """
+        cache_key = (type(input_path), os.path.normpath(input_path), tuple(sorted(skip_keys or [])))
+        result = self._fields_cache.get(cache_key)
+        if result is None:
+            result = self._parse(input_path, skip_keys)
+            self._fields_cache.set(cache_key, result)
+
+        # always return a copy so that the cached fields can't be modified by the caller:
+        return ParseResult(dict(result.fields) if result else None, result.error)
 
-        for ordered_keys, static_tokens in zip(self._ordered_keys, self._static_tokens):
-            path_parser = TemplatePathParser(ordered_keys, static_tokens)
-            fields = path_parser.parse_path(input_path, skip_keys)
-            if fields != None:
+    def _parse(self, input_path, skip_keys):
+        """
+        Runs the path parsers for each variation of the definition until one of them
+        succeeds.
+
+        :param input_path: Source path for values
+        :param skip_keys: Optional keys to skip
+        :returns: ParseResult from the first successful parser or from the last parser 
+                  if none of them succeeded.
+        """
+        result = None
+        for index in range(len(self._ordered_keys)):
+            result = self._create_path_parser(index).parse(input_path, skip_keys)
+            if result:
                 break
+        return result
+
+    @property
+    def cache_info(self):
+        """
+        Statistics about the cache of fields extracted from paths by get_fields().
+
+        :returns: Dictionary with the keys 'hits', 'misses', 'size' and 'max_size'
+        :rtype: Dictionary
+        """
+        return {"hits": self._fields_cache.hits,
+                "misses": self._fields_cache.misses,
+                "size": len(self._fields_cache),
+                "max_size": self._fields_cache.max_size}
+
+    def clear_cache(self):
+        """
+        Clears the cache of fields extracted from paths by get_fields().
+        """
+        self._fields_cache.clear()
+
+    def _create_path_parser(self, index):
+        """
+        Creates the parser used to extract fields from paths for a variation of the definition.
 
-        if fields is None:
-            raise TankError("Template %s: %s" % (str(self), path_parser.last_error))
+        :param index: Index of the definition variation
+        :returns: TemplatePathParser instance
+        """
+        ordered_keys = self._ordered_keys[index]
+        static_tokens = self._static_tokens[index]
+        if self._parser == constants.TEMPLATE_PARSER_COMPILED:
+            if self._compiled_patterns is None:
+                self._compiled_patterns = [CompiledTemplatePathParser.compile_pattern(keys, tokens) 
+                                           for keys, tokens in zip(self._ordered_keys, self._static_tokens)]
+            return CompiledTemplatePathParser(ordered_keys, static_tokens, self._compiled_patterns[index])
+        return TemplatePathParser(ordered_keys, static_tokens)
+
+    def get_fields_batch(self, input_paths, skip_keys=None):
+        """
+        Extracts key name, value pairs from a list of strings.
+
+        This is equivalent to calling get_fields() for each path but is more efficient
+        when processing large numbers of paths sharing the same parent directories, 
+        for example all the frames of an image sequence. The search for static tokens
+        within a directory is only carried out once for all the paths in that directory 
+        and paths that can't possibly match the template are discarded without being parsed.
+
+        :param input_paths: Source paths for values
+        :type input_paths: List of strings
+        :param skip_keys: Optional keys to skip
+        :type skip_keys: List
+
+        :returns: Dictionary keyed by input path, containing the values found in the path 
+                  based on keys in template, or None if the path doesn't match the template.
+        :rtype: Dictionary
+        """
+        results = {}
+        # token search state for each directory, keyed by the lower case directory
+        directory_cache = {}
+
+        for input_path in input_paths:
+            if input_path in results:
+                continue
 
-        return fields
+            lower_path = os.path.normpath(self._expand_input_path(input_path)).lower()
+            directory = lower_path[:lower_path.rfind(os.path.sep) + 1]
+
+            # find as many static tokens as possible within the directory - these will be
+            # the same for all paths in the directory so only need to be found once:
+            directory_states = directory_cache.get(directory)
+            if directory_states is None:
+                directory_states = [_find_static_tokens(directory, static_tokens, 0, 0) 
+                                    for static_tokens in self._static_tokens]
+                directory_cache[directory] = directory_states
+
+            # and then look for the remaining tokens in the rest of the path.
+            # All tokens need to be found for the path to be able to match
+            may_match = False
+            for static_tokens, (token_index, start_pos) in zip(self._static_tokens, directory_states):
+                if _find_static_tokens(lower_path, static_tokens, token_index, start_pos)[0] == len(static_tokens):
+                    may_match = True
+                    break
+
+            fields = None
+            if may_match:
+                fields = self.parse(input_path, skip_keys=skip_keys).fields
+            results[input_path] = fields
+
+        return results
+
+    def _expand_input_path(self, input_path):
+        """
+        Returns the input path as it will be parsed by get_fields().
+
+        :param input_path: Source path for values
+        :returns: Expanded path
+        """
+        return input_path
 
 
 class TemplatePath(Template):
     """
     Class for templates for paths.
     """
-    def __init__(self, definition, keys, root_path, name=None, per_platform_roots=None):
+    def __init__(self, definition, keys, root_path, name=None, per_platform_roots=None, parser=None, 
+                 cache_size=None):
         """
         :param definition: Template definition string.
         :param keys: Mapping of key names to keys (dict)
@@ -404,10 +728,15 @@ class TemplatePath(Template):
         :param name: Optional name for this template.
         :param per_platform_roots: Root paths for all supported operating systems. 
                                    This is a dictionary with sys.platform-style keys
+        :param parser: Optional name of the parser used to extract fields from paths.
+        :param cache_size: Optional maximum number of paths for which the extracted fields 
+                           are remembered.
         """
-        super(TemplatePath, self).__init__(definition, keys, name=name)
+        super(TemplatePath, self).__init__(definition, keys, name=name, parser=parser, cache_size=cache_size)
         self._prefix = root_path
         self._per_platform_roots = per_platform_roots
+        # used to validate the components of paths found on disk, see _validate_path_component
+        self._path_component_validators = None
 
         # Make definition use platform separator
         for index, rel_definition in enumerate(self._definitions):
@@ -423,10 +752,94 @@ class TemplatePath(Template):
         for definition in self._definitions:
             self._static_tokens.append(self._calc_static_tokens(definition))
 
+    def __getstate__(self):
+        """
+        Returns the state to pickle. The path component validators are left out
+        and will be computed again when needed.
+        """
+        state = super(TemplatePath, self).__getstate__()
+        state["_path_component_validators"] = None
+        return state
+
     @property
     def root_path(self):
         return self._prefix
 
+    def _validate_path_component(self, path):
+        """
+        Checks that the last component of a path inside the root path is valid for the
+        template. This is the case if the component could be part of a path matching 
+        the template. Only components that represent a single key that is at the same 
+        depth in all variations of the definition are actually checked, all other 
+        components are considered valid.
+
+        This is used to prune directories that can't contain any matching paths when
+        searching the file system.
+
+        :param path: Path to check.
+        :returns: False if no path matching the template can contain the path.
+        """
+        root_path = self.root_path
+        if not path.startswith(root_path):
+            return True
+        relative_path = path[len(root_path):]
+        if root_path and not root_path.endswith(os.path.sep):
+            if not relative_path.startswith(os.path.sep):
+                return True
+            relative_path = relative_path[1:]
+
+        components = relative_path.split(os.path.sep)
+        if not components[-1]:
+            # path ending with a separator
+            return True
+        validators = self._get_path_component_validators()
+        if len(components) > len(validators) or not validators[len(components) - 1]:
+            return True
+        prefix, key, suffix = validators[len(components) - 1]
+
+        # the static parts of the component are compared case insensitively 
+        # in the same way as when parsing the path
+        name = components[-1]
+        if (len(name) <= len(prefix) + len(suffix)
+            or not name.lower().startswith(prefix) 
+            or not name.lower().endswith(suffix)):
+            return False
+        try:
+            return key.validate(name[len(prefix):len(name) - len(suffix)])
+        except Exception:
+            # leave it to the parser to handle values the key can't validate
+            return True
+
+    def _get_path_component_validators(self):
+        """
+        Returns the information needed to validate each component of a relative path.
+
+        :returns: List containing for each depth either a tuple (lower case prefix, key,
+                  lower case suffix) or None if the component can't be validated on its own.
+        """
+        if self._path_component_validators is None:
+            # the component definitions used at each depth in the different variations:
+            definitions_by_depth = []
+            for definition in self._definitions:
+                for depth, component in enumerate(definition.split(os.path.sep)):
+                    if depth == len(definitions_by_depth):
+                        definitions_by_depth.append(set())
+                    definitions_by_depth[depth].add(component)
+
+            validators = []
+            for definitions in definitions_by_depth:
+                validator = None
+                if len(definitions) == 1:
+                    component = list(definitions)[0]
+                    key_names = re.findall(r"{(.*?)}", component)
+                    if len(key_names) == 1:
+                        prefix, suffix = component.split("{%s}" % key_names[0])
+                        key = self.keys[key_names[0]]
+                        validator = (prefix.lower(), key, suffix.lower())
+                validators.append(validator)
+            self._path_component_validators = validators
+        return self._path_component_validators
+
     @property
     def parent(self):
         """
@@ -437,27 +850,28 @@ class TemplatePath(Template):
         """
         parent_definition = os.path.dirname(self.definition)
         if parent_definition:
-            return TemplatePath(parent_definition, self.keys, self.root_path, None, self._per_platform_roots)
+            return TemplatePath(parent_definition, 
+                                self.keys, 
+                                self.root_path, 
+                                None, 
+                                self._per_platform_roots, 
+                                parser=self._parser,
+                                cache_size=self._fields_cache.max_size)
         return None
 
-    def _apply_fields(self, fields, ignore_types=None, platform=None):
+    def _get_full_path(self, relative_path, platform):
         """
-        Creates path using fields.
+        Prefixes the relative path resolved from the definition with the root path.
 
-        :param fields: Mapping of keys to fields. Keys must match those in template 
-                       definition.
-        :param ignore_types: Keys for whom the defined type is ignored as list of strings.
-                            This allows setting a Key whose type is int with a string value.
+        :param relative_path: The definition with the fields inserted.
         :param platform: Optional operating system platform. If you leave it at the 
                          default value of None, paths will be created to match the 
                          current operating system. If you pass in a sys.platform-style string
                          (e.g. 'win32', 'linux2' or 'darwin'), paths will be generated to 
                          match that platform.
 
-        :returns: Full path, matching the template with the given fields inserted.
-        """        
-        relative_path = super(TemplatePath, self)._apply_fields(fields, ignore_types, platform)
-        
+        :returns: Full path.
+        """
         if platform is None:
             # return the current OS platform's path
             return os.path.join(self.root_path, relative_path) if relative_path else self.root_path
@@ -503,8 +917,8 @@ class TemplateString(Template):
     """
     Template class for templates not representing paths.
     """
-    def __init__(self, definition, keys, name=None, validate_with=None):
-        super(TemplateString, self).__init__(definition, keys, name=name)
+    def __init__(self, definition, keys, name=None, validate_with=None, parser=None, cache_size=None):
+        super(TemplateString, self).__init__(definition, keys, name=name, parser=parser, cache_size=cache_size)
         self.validate_with = validate_with
         self._prefix = "@"
 
@@ -521,7 +935,7 @@ class TemplateString(Template):
         return None
 
 
-    def get_fields(self, input_path, skip_keys=None):
+    def parse(self, input_path, skip_keys=None):
         """
         Given a path, return mapping of key values based on template.
         
@@ -530,12 +944,269 @@ class TemplateString(Template):
         :param skip_keys: Optional keys to skip
         :type skip_keys: List
 
-        :returns: Values found in the path based on keys in template
-        :rtype: Dictionary
+        :returns: ParseResult containing either the values found in the path based on 
+                  keys in template or the error reported if the path doesn't match.
+        :rtype: ParseResult
         """
         # add path prefix as origonal design was to require project root
-        adj_path = os.path.join(self._prefix, input_path)
-        return super(TemplateString, self).get_fields(adj_path, skip_keys=skip_keys)
+        adj_path = self._expand_input_path(input_path)
+        return super(TemplateString, self).parse(adj_path, skip_keys=skip_keys)
+
+    def _expand_input_path(self, input_path):
+        """
+        Returns the input path as it will be parsed by get_fields().
+
+        :param input_path: Source path for values
+        :returns: Expanded path
+        """
+        return os.path.join(self._prefix, input_path)
+
+
+class TemplateDict(dict):
+    """
+    Dictionary of templates keyed by template name, as returned by read_templates.
+
+    The dictionary counts its modifications so that the template index can cheaply
+    tell whether templates were added or removed since it was built.
+    """
+    # number of times the dictionary was modified
+    version = 0
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self.version += 1
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self.version += 1
+
+    def clear(self):
+        dict.clear(self)
+        self.version += 1
+
+    def pop(self, *args):
+        self.version += 1
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self.version += 1
+        return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        self.version += 1
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self.version += 1
+
+
+class TemplateIndex(object):
+    """
+    Index used to quickly narrow down which templates may match a given path.
+
+    Each template variation is bucketed by its first static token. This token
+    always contains the template prefix (e.g. the storage root for path templates)
+    and usually some of the static folders that follow it. The buckets are
+    organized as a tree of path components so that a lookup only needs to walk
+    the components of the path rather than testing every template.
+
+    The index is conservative - it may return templates that don't match the
+    path but it will never leave out a template that could match. Candidates
+    still need to be validated against the path.
+    """
+
+    class _Node(object):
+        """
+        A node in the index tree, representing a path component.
+        """
+        def __init__(self):
+            # child nodes keyed by path component
+            self.children = {}
+            # list of (remaining token, template ordinal) tuples for all
+            # first static tokens which end below this node
+            self.entries = []
+
+    def __init__(self, templates):
+        """
+        Construction
+
+        :param templates: Dictionary of templates to index, keyed by template name.
+        """
+        # keep track of what was indexed so we can detect changes. Changes to a
+        # TemplateDict are tracked by its version, other dictionaries are compared
+        self._source = templates
+        self._source_version = getattr(templates, "version", None)
+        self._snapshot = None if isinstance(templates, TemplateDict) else dict(templates)
+        self._templates = []
+        # one tree for path templates and one for string templates, since
+        # these expand the input path differently before parsing it
+        self._roots = {TemplatePath: self._Node(), TemplateString: self._Node()}
+        # variations for which the path may start with a key rather than with
+        # the first static token, stored as (template type, first token, ordinal)
+        self._key_first = []
+        # templates that can't be indexed and that always need to be validated
+        self._unindexed = []
+
+        for name, template in templates.iteritems():
+            ordinal = len(self._templates)
+            self._templates.append(template)
+
+            template_type = TemplateString if isinstance(template, TemplateString) else TemplatePath
+            if (type(template).get_fields != Template.get_fields 
+                or type(template).parse not in (Template.parse, TemplateString.parse)):
+                # a template type with custom parsing - we don't know enough about
+                # it to be able to index it.
+                self._unindexed.append(ordinal)
+                continue
+
+            for ordered_keys, static_tokens in zip(template._ordered_keys, template._static_tokens):
+                if not static_tokens:
+                    self._unindexed.append(ordinal)
+                    continue
+
+                first_token = static_tokens[0]
+                components = first_token.split(os.path.sep)
+                node = self._roots[template_type]
+                for component in components[:-1]:
+                    node = node.children.setdefault(component, self._Node())
+                node.entries.append((components[-1], ordinal))
+
+                if len(ordered_keys) >= len(static_tokens):
+                    # the parser also considers paths that start with a key
+                    # followed by the first static token
+                    self._key_first.append((template_type, first_token, ordinal))
+
+    def is_up_to_date(self, templates):
+        """
+        Checks whether the index is still valid for the given templates.
+
+        :param templates: Dictionary of templates, keyed by template name.
+        :returns: True if the index was built from the exact same templates
+        """
+        if isinstance(templates, TemplateDict):
+            return templates is self._source and templates.version == self._source_version
+        return self._snapshot == templates
+
+    def get_candidates(self, path):
+        """
+        Returns the templates that could potentially match the given path.
+
+        :param path: Path or string to find candidate templates for
+        :returns: List of templates, in the order they were indexed.
+        """
+        return self.get_candidates_batch([path])[path]
+
+    def get_candidates_batch(self, paths):
+        """
+        Returns the templates that could potentially match each of the given paths.
+
+        The index tree is only walked once for each directory so this is more 
+        efficient than calling get_candidates() for each path when many of the paths 
+        share the same parent directory.
+
+        :param paths: List of paths or strings to find candidate templates for
+        :returns: Dictionary keyed by path containing lists of templates, in the 
+                  order they were indexed.
+        """
+        walk_cache = {}
+        results = {}
+        for path in paths:
+            if path not in results:
+                results[path] = self._get_candidates(path, walk_cache)
+        return results
+
+    def _get_candidates(self, path, walk_cache):
+        """
+        Returns the templates that could potentially match the given path.
+
+        :param path: Path or string to find candidate templates for
+        :param walk_cache: Dictionary used to cache the nodes visited for each directory.
+        :returns: List of templates, in the order they were indexed.
+        """
+        # expand the path in the same way the templates do before parsing it
+        lower_paths = {TemplatePath: os.path.normpath(path).lower(),
+                       TemplateString: os.path.normpath(os.path.join("@", path)).lower()}
+
+        ordinals = set(self._unindexed)
+
+        for template_type, lower_path in lower_paths.iteritems():
+            # only components that are followed by a separator can be walked so 
+            # the nodes visited only depend on the directory part of the path:
+            directory = lower_path[:lower_path.rfind(os.path.sep) + 1]
+            visited_nodes = walk_cache.get((template_type, directory))
+            if visited_nodes is None:
+                visited_nodes = self._walk(self._roots[template_type], directory)
+                walk_cache[(template_type, directory)] = visited_nodes
+
+            for node, offset in visited_nodes:
+                for remainder, ordinal in node.entries:
+                    if lower_path.startswith(remainder, offset):
+                        ordinals.add(ordinal)
+
+        for template_type, first_token, ordinal in self._key_first:
+            # the value of the first key would be everything up to an occurrence
+            # of the first static token so it can't contain a path separator.
+            lower_path = lower_paths[template_type]
+            token_pos = lower_path.find(first_token, 1)
+            if token_pos > 0 and os.path.sep not in lower_path[:token_pos]:
+                ordinals.add(ordinal)
+
+        return [self._templates[ordinal] for ordinal in sorted(ordinals)]
+
+    def _walk(self, node, directory):
+        """
+        Walks the index tree following the components of a directory.
+
+        :param node: Node to start walking from
+        :param directory: Lower case directory path, ending with a separator
+        :returns: List of (node, offset) tuples for all the nodes visited, where offset
+                  is the position in the path of the first character below the node.
+        """
+        visited_nodes = [(node, 0)]
+        offset = 0
+        for component in directory.split(os.path.sep)[:-1]:
+            node = node.children.get(component)
+            if node is None:
+                break
+            offset += len(component) + 1
+            visited_nodes.append((node, offset))
+        return visited_nodes
+
+
+def _find_static_tokens(lower_path, static_tokens, token_index, start_pos):
+    """
+    Finds static tokens in a path in the same way the template path parser does - each 
+    token has to be found after the first occurance of the previous token.
+
+    :param lower_path: Lower case path to search
+    :param static_tokens: List of static tokens to find
+    :param token_index: Index of the first token to look for
+    :param start_pos: Position in the path to start looking from
+    :returns: Tuple containing the index of the first token that couldn't be found and
+              the position to look for it from.
+    """
+    while token_index < len(static_tokens):
+        token = static_tokens[token_index]
+        token_pos = lower_path.find(token, start_pos)
+        if token_pos < 0:
+            break
+        start_pos = token_pos + len(token)
+        token_index += 1
+    return (token_index, start_pos)
+
+def _product(sequences):
+    """
+    Computes the cartesian product of sequences, in the same order as itertools.product
+    which isn't available in python 2.5.
+
+    :param sequences: List of sequences
+    :returns: List of tuples holding one item from each sequence
+    """
+    combinations = [()]
+    for sequence in sequences:
+        combinations = [combination + (item,) for combination in combinations for item in sequence]
+    return combinations
 
 def split_path(input_path):
     """
@@ -553,14 +1224,22 @@ def split_path(input_path):
 
 def read_templates(pipeline_configuration):
     """
-    Creates templates and keys based on contents of templates file.
+    Creates templates and keys based on contents of templates file. The templates
+    are loaded from the pipeline configuration's cache when the templates file and
+    its includes didn't change since they were last read.
 
     :param pipeline_configuration: pipeline config object
 
-    :returns: Dictionary of form {template name: template object}
+    :returns: TemplateDict of form {template name: template object}
     """    
     per_platform_roots = pipeline_configuration.get_all_platform_data_roots()
-    data = pipeline_configuration.get_templates_config()            
+
+    templates = template_cache.load_templates(pipeline_configuration, per_platform_roots)
+    if templates is not None:
+        return TemplateDict(templates)
+
+    included_files = []
+    data = pipeline_configuration.get_templates_config(included_files)
     
     # get dictionaries from the templates config file:
     def get_data_section(section_name):
@@ -583,7 +1262,9 @@ def read_templates(pipeline_configuration):
     # Put path and strings together
     templates = template_paths
     templates.update(template_strings)
-    return templates
+
+    template_cache.save_templates(pipeline_configuration, per_platform_roots, included_files, templates)
+    return TemplateDict(templates)
 
 
 def make_template_paths(data, keys, all_per_platform_roots):
@@ -617,7 +1298,13 @@ def make_template_paths(data, keys, all_per_platform_roots):
             raise TankError("Undefined Shotgun storage! The local file storage '%s' is not defined for this "
                             "operating system." % root_name)
 
-        template_path = TemplatePath(definition, keys, root_path, template_name, all_per_platform_roots[root_name])
+        template_path = TemplatePath(definition, 
+                                     keys, 
+                                     root_path, 
+                                     template_name, 
+                                     all_per_platform_roots[root_name], 
+                                     parser=template_data.get("parser"),
+                                     cache_size=template_data.get("cache_size"))
         template_paths[template_name] = template_path
 
     return template_paths
@@ -650,7 +1337,9 @@ def make_template_strings(data, keys, template_paths):
         template_string = TemplateString(definition,
                                          keys,
                                          template_name,
-                                         validate_with=validator)
+                                         validate_with=validator,
+                                         parser=template_data.get("parser"),
+                                         cache_size=template_data.get("cache_size"))
 
         template_strings[template_name] = template_string
 
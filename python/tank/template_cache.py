@@ -0,0 +1,186 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Persistent cache of the templates read from the templates file.
+
+Loading the templates file and its includes and creating all the templates is
+costly, so the templates are pickled to a file in the pipeline configuration's
+cache folder. The cached templates are only used when none of the files they
+were read from changed since the cache was written, which is checked by comparing
+the hashes of the files' content.
+
+The cache file holds two pickles: a header describing the platform, files,
+environment variables and roots the templates depend on, followed by the
+templates. The templates are only unpickled once the header has been found to
+be up to date.
+
+Unpickling data can execute arbitrary code, so each user gets their own cache
+file, written with the default permissions, and a cache file which isn't owned
+by the current user or which other users can modify is never loaded.
+"""
+
+import os
+import sys
+import re
+import stat
+import getpass
+import tempfile
+import hashlib
+import cPickle as pickle
+
+from .platform import constants
+
+# environment variables which could be used in the path of an include, as expanded
+# by os.path.expandvars on the different platforms: $name, ${name} or %name%
+_ENV_VAR_REGEX = re.compile(r"\$\{?(\w+)|%(\w+)%")
+
+def load_templates(pipeline_configuration, per_platform_roots):
+    """
+    Loads the templates from the cache of a pipeline configuration. This method
+    never raises, a cache which can't be read is simply ignored.
+
+    :param pipeline_configuration: The pipeline configuration to load the templates for.
+    :param per_platform_roots: The roots the templates should have been created with.
+    :returns: Dictionary of form {template name: template object} or None if the cache
+              doesn't exist or is out of date.
+    """
+    try:
+        cache_file = _get_cache_location(pipeline_configuration)
+        if not os.path.exists(cache_file):
+            return None
+
+        fh = open(cache_file, "rb")
+        try:
+            if not _is_trusted(fh):
+                return None
+            header = pickle.load(fh)
+            if header.get("format_version") != constants.TEMPLATE_CACHE_FORMAT_VERSION:
+                return None
+            if header.get("platform") != sys.platform:
+                return None
+            if header.get("roots") != per_platform_roots:
+                return None
+            if _get_dependencies(header["files"]) != (header["files"], header["environment"]):
+                return None
+            return pickle.load(fh)
+        finally:
+            fh.close()
+    except:
+        # failed to load the cache. Continue silently.
+        return None
+
+def save_templates(pipeline_configuration, per_platform_roots, included_files, templates):
+    """
+    Saves templates to the cache of a pipeline configuration. This method never raises,
+    the templates are simply not cached if the cache can't be written.
+
+    :param pipeline_configuration: The pipeline configuration the templates were read for.
+    :param per_platform_roots: The roots the templates were created with.
+    :param included_files: The paths of all the files included by the templates file.
+    :param templates: Dictionary of form {template name: template object}
+    """
+    paths = [pipeline_configuration.get_templates_file(), _get_core_manifest_path()]
+    paths.extend(included_files)
+    files, environment = _get_dependencies(dict.fromkeys(paths))
+    header = {"format_version": constants.TEMPLATE_CACHE_FORMAT_VERSION,
+              "platform": sys.platform,
+              "roots": per_platform_roots,
+              "files": files,
+              "environment": environment}
+
+    try:
+        cache_file = _get_cache_location(pipeline_configuration)
+        cache_dir = os.path.dirname(cache_file)
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        # write to a temporary file which is then renamed so that other processes
+        # never read a partially written cache. The temporary file is only readable
+        # and writable by the current user.
+        (fd, temp_file) = tempfile.mkstemp(dir=cache_dir, prefix=os.path.basename(cache_file))
+        try:
+            fh = os.fdopen(fd, "wb")
+            try:
+                pickle.dump(header, fh, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(templates, fh, pickle.HIGHEST_PROTOCOL)
+            finally:
+                fh.close()
+            if os.path.exists(cache_file) and os.name == "nt":
+                # renaming doesn't replace existing files on windows
+                os.remove(cache_file)
+            os.rename(temp_file, cache_file)
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+
+    except:
+        # silently continue in case exceptions are raised
+        pass
+
+def _get_cache_location(pipeline_configuration):
+    """
+    Returns the path to the templates cache file of a pipeline configuration for the
+    current platform and user.
+
+    :param pipeline_configuration: The pipeline configuration.
+    :returns: path string
+    """
+    file_name = constants.TEMPLATE_CACHE_FILE % (sys.platform, getpass.getuser())
+    return os.path.join(pipeline_configuration.get_shotgun_menu_cache_location(), file_name)
+
+def _is_trusted(fh):
+    """
+    Checks that an open cache file can safely be unpickled, i.e. that it is owned by
+    the current user and can't be modified by other users. Ownership can't be checked
+    on Windows, where the permissions of the cache folder are relied upon instead.
+
+    :param fh: The open cache file.
+    :returns: True if the file can be loaded, False otherwise.
+    """
+    if not hasattr(os, "getuid"):
+        return True
+    st = os.fstat(fh.fileno())
+    return st.st_uid == os.getuid() and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+def _get_core_manifest_path():
+    """
+    Returns the path to the manifest of the core API currently running. Changes to
+    the manifest, i.e. a different core version, invalidate the cache.
+
+    :returns: path string
+    """
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "info.yml"))
+
+def _get_dependencies(files):
+    """
+    Computes the current state of files the templates depend on.
+
+    :param files: Dictionary whose keys are the paths of the files.
+    :returns: Tuple of a dictionary of form {path: hash of the content or None if the
+              file doesn't exist} and a dictionary of form {name: value} for the
+              environment variables referenced in the files.
+    """
+    hashes = {}
+    environment = {}
+    for path in files:
+        if not os.path.isfile(path):
+            hashes[path] = None
+            continue
+        fh = open(path, "rb")
+        try:
+            content = fh.read()
+        finally:
+            fh.close()
+        hashes[path] = hashlib.md5(content).hexdigest()
+        for names in _ENV_VAR_REGEX.findall(content):
+            name = names[0] or names[1]
+            environment[name] = os.environ.get(name)
+    return hashes, environment
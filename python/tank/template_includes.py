@@ -86,12 +86,14 @@ def _get_includes(file_name, data):
     return resolved_includes
 
 
-def _process_template_includes_r(file_name, data):
+def _process_template_includes_r(file_name, data, included_files=None):
     """
     Recursively add template include files.
     
     For each of the sections keys, strings, path, populate entries based on
     include files.
+
+    :param included_files: Optional list to which the paths of the included files are appended.
     """
     
     # return data    
@@ -104,6 +106,9 @@ def _process_template_includes_r(file_name, data):
     included_paths = _get_includes(file_name, data)
     
     for included_path in included_paths:
+
+        if included_files is not None:
+            included_files.append(included_path)
                 
         # path exists, so try to read it
         fh = open(included_path, "r")
@@ -113,7 +118,7 @@ def _process_template_includes_r(file_name, data):
             fh.close()
         
         # before doing any type of processing, allow the included data to be resolved.
-        included_data = _process_template_includes_r(included_path, included_data)
+        included_data = _process_template_includes_r(included_path, included_data, included_files)
         
         # add the included data's different sections
         for ts in constants.TEMPLATE_SECTIONS:
@@ -128,7 +133,7 @@ def _process_template_includes_r(file_name, data):
     
     return output_data
         
-def process_includes(file_name, data):
+def process_includes(file_name, data, included_files=None):
     """
     Processes includes for the main templates file. Will look for 
     any include data structures and transform them into real data.
@@ -139,10 +144,14 @@ def process_includes(file_name, data):
        if there are multiple files, they are loaded in order.
     2. now, on top of this, load in this file's keys, strings and path defs
     3. lastly, process all @refs in the paths section
-        
+
+    :param file_name: Path to the main templates file.
+    :param data: Data loaded from the main templates file.
+    :param included_files: Optional list to which the paths of all the files included,
+                           directly or indirectly, are appended.
     """
     # first recursively load all template data from includes
-    resolved_includes_data = _process_template_includes_r(file_name, data)
+    resolved_includes_data = _process_template_includes_r(file_name, data, included_files)
     
     # Now recursively process any @resolves.
     # these are of the following form:
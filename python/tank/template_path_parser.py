@@ -13,7 +13,38 @@ Parsing of template paths into values for specified keys using a list of static
 """
 
 import os
+import re
+
 from .errors import TankError
+from .templatekey import StringKey, IntegerKey, SequenceKey
+
+class ParseResult(object):
+    """
+    Result of parsing a path against a template. Contains either the fields found
+    in the path or the error explaining why the path couldn't be parsed.
+    """
+    def __init__(self, fields, error=None):
+        """
+        Construction
+
+        :param fields:  Dictionary of fields mapping key names to their values or None
+                        if the path couldn't be parsed.
+        :param error:   The error reported when the path couldn't be parsed.
+        """
+        self.fields = fields
+        self.error = error
+
+    def __nonzero__(self):
+        """
+        :returns: True if the path was successfully parsed.
+        """
+        return self.fields is not None
+
+    def __repr__(self):
+        if self.fields is None:
+            return "<ParseResult error: %s>" % self.error
+        return "<ParseResult fields: %s>" % self.fields
+
 
 class TemplatePathParser(object):
     """
@@ -61,6 +92,25 @@ class TemplatePathParser(object):
         self.last_error = "Unable to parse path" 
 
     def parse_path(self, input_path, skip_keys):
+        """
+        Parses a path against the set of keys and static tokens to extract valid values
+        for the keys.  The error reported if the path can't be parsed is stored in
+        last_error.  This method is retained for backwards compatibility, parse() should
+        be used instead as it doesn't modify the parser and so can safely be called from 
+        multiple threads.
+
+        :param input_path:  The path to parse.
+        :param skip_keys:   List of keys for whom we do not need to find values.
+
+        :returns:           If succesful, a dictionary of fields mapping key names to 
+                            their values. None if the fields can't be resolved. 
+        """
+        result = self.parse(input_path, skip_keys)
+        if not result:
+            self.last_error = result.error
+        return result.fields
+
+    def parse(self, input_path, skip_keys):
         """
         Parses a path against the set of keys and static tokens to extract valid values
         for the keys.  This will make use of as much information as it can within all
@@ -84,11 +134,14 @@ class TemplatePathParser(object):
         :param input_path:  The path to parse.
         :param skip_keys:   List of keys for whom we do not need to find values.
 
-        :returns:           If succesful, a dictionary of fields mapping key names to 
-                            their values. None if the fields can't be resolved. 
+        :returns:           ParseResult containing, if successful, a dictionary of fields 
+                            mapping key names to their values or the error found if the 
+                            fields can't be resolved.
         """
         skip_keys = skip_keys or []
         input_path = os.path.normpath(input_path)
+        no_match_error = ("Tried to extract fields from path '%s', "
+                          "but the path does not fit the template." % input_path)
 
         # all token comparisons are done case insensitively.
         lower_path = input_path.lower()
@@ -100,11 +153,11 @@ class TemplatePathParser(object):
                 # but where the static part of the template is matching
                 # the input path
                 # (e.g. template: foo/bar - input path foo/bar)
-                return {}
+                return ParseResult({})
             else:
                 # template with no keys - in this case not matching 
                 # the input path. Return for no match.
-                return None        
+                return ParseResult(None, no_match_error)
             
         # find all occurances of all tokens in the path.  This will 
         # produce a list of lists, one list of positions for each token.
@@ -138,9 +191,7 @@ class TemplatePathParser(object):
                     token_pos += len(token)
             if not positions:
                 # didn't find token!
-                self.last_error = ("Tried to extract fields from path '%s', "
-                                   "but the path does not fit the template." % input_path)
-                return None
+                return ParseResult(None, no_match_error)
             token_positions.append(positions)
             
         # disgard positions that can't be valid - e.g. where the position is greater than the
@@ -187,10 +238,7 @@ class TemplatePathParser(object):
 
         if not possible_values:
             # failed to find anything!
-            if not self.last_error:
-                self.last_error = ("Tried to extract fields from path '%s', "
-                                   "but the path does not fit the template." % input_path)
-            return None
+            return ParseResult(None, no_match_error)
     
         # ensure that we only have a single set of valid values for all keys.  If we don't
         # then attempt to report the best error we can
@@ -203,8 +251,7 @@ class TemplatePathParser(object):
             elif len(possible_values) == 1:
                 if not possible_values[0].fully_resolved:
                     # failed to fully resolve the path!
-                    self.last_error = possible_values[0].last_error 
-                    return None
+                    return ParseResult(None, possible_values[0].last_error or no_match_error)
                 
                 # only found one possible value!
                 key_value = possible_values[0].value
@@ -220,22 +267,22 @@ class TemplatePathParser(object):
                     possible_values = resolved_possible_values[0].downstream_values
                 elif num_resolved > 1:
                     # found more than one valid value so value is ambiguous!
-                    self.last_error = ("Ambiguous values found for key '%s' could be any of: '%s'" 
-                                       % (key.name, "', '".join([v.value for v in resolved_possible_values])))
-                    return None
+                    error = ("Ambiguous values found for key '%s' could be any of: '%s'"
+                             % (key.name, "', '".join([v.value for v in resolved_possible_values])))
+                    return ParseResult(None, error)
                 else:
                     # didn't find any fully resolved values so we have multiple 
                     # non-fully resolved values which also means the value is ambiguous!
-                    self.last_error = ("Ambiguous values found for key '%s' could be any of: '%s'" 
-                                       % (key.name, "', '".join([v.value for v in possible_values])))
-                    return None
+                    error = ("Ambiguous values found for key '%s' could be any of: '%s'"
+                             % (key.name, "', '".join([v.value for v in possible_values])))
+                    return ParseResult(None, error)
 
             # if key isn't a skip key then add it to the fields dictionary:            
             if key_value is not None and key.name not in skip_keys:
                 fields[key.name] = key_value
                 
         # return the single unique set of fields:
-        return fields
+        return ParseResult(fields)
     
     def __find_possible_key_values_recursive(self, path, key_position, tokens, token_positions, 
                                              keys, skip_keys, key_values=None):
@@ -358,4 +405,207 @@ class TemplatePathParser(object):
                                                                     fully_resolved, 
                                                                     last_error))
             
-        return possible_values
\ No newline at end of file
+        return possible_values
+
+class CompiledTemplatePathParser(TemplatePathParser):
+    """
+    Parser which matches a path against a single regular expression compiled from
+    the keys and static tokens rather than searching for all combinations of token
+    positions.
+
+    This is only possible when the values of the keys are restricted so that there
+    can't be more than one way to split a path into key values, e.g. when each key
+    is followed by a static token starting with a character that isn't valid for 
+    the key. For templates where this can't be guaranteed, or for paths where the
+    backtracking parser could find alternative solutions, parsing falls back to 
+    the backtracking parser so the results are always the same.
+    """
+
+    def __init__(self, ordered_keys, static_tokens, compiled_pattern=None):
+        """
+        Construction
+
+        :param ordered_keys:        Template key objects in order that they appear in the
+                                    template definition.
+        :param static_tokens:       Pieces of the definition that don't represent Template Keys.
+        :param compiled_pattern:    Optional pattern previously returned by compile_pattern()
+                                    for the same keys and static tokens.
+        """
+        super(CompiledTemplatePathParser, self).__init__(ordered_keys, static_tokens)
+        if compiled_pattern is None:
+            compiled_pattern = self.compile_pattern(ordered_keys, static_tokens)
+        self._pattern = compiled_pattern
+
+    @classmethod
+    def compile_pattern(cls, ordered_keys, static_tokens):
+        """
+        Compiles a regular expression matching the keys and static tokens.
+
+        :param ordered_keys:    Template key objects in order that they appear in the
+                                template definition.
+        :param static_tokens:   Pieces of the definition that don't represent Template Keys.
+        :returns:               Compiled regular expression or False if the keys and static
+                                tokens can't be unambiguously matched using a regular expression.
+        """
+        num_keys = len(ordered_keys)
+        num_tokens = len(static_tokens)
+
+        # only handle templates where tokens and keys alternate, starting with a token
+        if not ordered_keys or num_keys not in (num_tokens - 1, num_tokens):
+            return False
+
+        expression = "^%s" % re.escape(static_tokens[0])
+        for index, key in enumerate(ordered_keys):
+            char_class = _get_value_char_class(key)
+            if index + 1 < num_tokens:
+                next_token = static_tokens[index + 1]
+                if re.match(char_class, next_token[0]):
+                    # the key could contain the start of the following token so there may
+                    # be more than one way to parse the path.
+                    return False
+                expression += "(%s+)%s" % (char_class, re.escape(next_token))
+            else:
+                expression += "(%s+)" % char_class
+        expression += r"\Z"
+
+        return re.compile(expression)
+
+    def parse(self, input_path, skip_keys):
+        """
+        Parses a path against the set of keys and static tokens to extract valid values
+        for the keys.
+
+        :param input_path:  The path to parse.
+        :param skip_keys:   List of keys for whom we do not need to find values.
+
+        :returns:           ParseResult containing, if successful, a dictionary of fields 
+                            mapping key names to their values or the error found if the 
+                            fields can't be resolved.
+        """
+        skip_keys = skip_keys or []
+        if (not self._pattern 
+            or not isinstance(input_path, str)
+            or [key for key in self.ordered_keys if key.name in skip_keys]):
+            # skipped keys aren't validated and the character classes only
+            # handle byte strings, so use the backtracking parser:
+            return super(CompiledTemplatePathParser, self).parse(input_path, skip_keys)
+
+        input_path = os.path.normpath(input_path)
+        # all token comparisons are done case insensitively.
+        lower_path = input_path.lower()
+
+        if self.__has_alternative_solutions(lower_path):
+            return super(CompiledTemplatePathParser, self).parse(input_path, skip_keys)
+
+        match = self._pattern.match(lower_path)
+        if not match:
+            error = ("Tried to extract fields from path '%s', "
+                     "but the path does not fit the template." % input_path)
+            return ParseResult(None, error)
+
+        if not self.__are_token_positions_found(lower_path, match):
+            # the match relies on overlapping token occurrences which the backtracking 
+            # parser doesn't consider, so let it handle the path.
+            return super(CompiledTemplatePathParser, self).parse(input_path, skip_keys)
+
+        fields = {}
+        key_values = {}
+        for index, key in enumerate(self.ordered_keys):
+            value_str = input_path[match.start(index + 1):match.end(index + 1)]
+
+            # can't have two different values for the same key:
+            if key_values.get(key.name, value_str) != value_str:
+                error = ("%s: Conflicting values found for key %s: %s and %s"
+                         % (self, key.name, key_values[key.name], value_str))
+                return ParseResult(None, error)
+            key_values[key.name] = value_str
+
+            # get the actual value for this key - this will also validate the value:
+            try:
+                fields[key.name] = key.value_from_str(value_str)
+            except TankError, e:
+                error = ("%s: Failed to get value for key '%s' - %r"
+                         % (self, key.name, e))
+                return ParseResult(None, error)
+
+        return ParseResult(fields)
+
+    def __are_token_positions_found(self, lower_path, match):
+        """
+        Checks that the positions of the static tokens in a match would also be found
+        by the backtracking parser, which only looks for non-overlapping occurrences of 
+        each token after the first occurrence of the previous token.
+
+        :param lower_path:  The normalized, lower case path being parsed.
+        :param match:       Regular expression match for the path.
+        :returns:           True if all the token positions would be found.
+        """
+        start_pos = 0
+        for index, token in enumerate(self.static_tokens):
+            # the first token is always matched at the start of the path and the
+            # following ones are matched after each key:
+            match_pos = match.end(index) if index else 0
+            token_pos = lower_path.find(token, start_pos)
+            start_pos = token_pos + len(token)
+            while 0 <= token_pos < match_pos:
+                token_pos = lower_path.find(token, token_pos + len(token))
+            if token_pos != match_pos:
+                return False
+        return True
+
+    def __has_alternative_solutions(self, lower_path):
+        """
+        Checks if the backtracking parser could find solutions for the path that
+        the regular expression doesn't represent.
+
+        :param lower_path:  The normalized, lower case path to parse.
+        :returns:           True if the path needs to be parsed by the backtracking parser.
+        """
+        num_keys = len(self.ordered_keys)
+        num_tokens = len(self.static_tokens)
+
+        # the path could start with a key followed by the first static token. The
+        # value of this key can't contain a path separator.
+        if num_keys >= num_tokens:
+            token_pos = lower_path.find(self.static_tokens[0], 1)
+            if token_pos > 0 and os.path.sep not in lower_path[:token_pos]:
+                return True
+
+        # the backtracking parser stops if it runs out of path after a token even
+        # if there are keys remaining
+        for token in self.static_tokens[1:num_keys]:
+            if lower_path.endswith(token):
+                return True
+
+        return False
+
+
+def _get_value_char_class(key):
+    """
+    Returns a regular expression character class matching all the characters that
+    can be found in a lower case value for the key. This only needs to be a superset 
+    of the valid characters as the values are still validated by the key.
+
+    :param key: Template key object
+    :returns:   Regular expression character class
+    """
+    # note: exact types are used as sub-classes may be less restrictive
+    key_type = type(key)
+    if key_type is SequenceKey:
+        # integers and all kinds of frame specs
+        chars = "0123456789 \t\n\r\x0b\x0c[]-%s%s" % (key.FRAMESPEC_FORMAT_INDICATOR, 
+                                                     "".join(key.VALID_FORMAT_STRINGS))
+        return "[%s]" % re.escape("".join(sorted(set(chars.lower()))))
+    elif key_type is IntegerKey:
+        if key._zero_padded:
+            return "[0-9]"
+        # leading whitespace is allowed when not zero padded
+        return r"[0-9 \t\n\r\x0b\x0c]"
+    elif key_type is StringKey and key.filter_by == "alphanumeric":
+        # any non-ascii characters or ascii letters and digits
+        return r"[^\x00-\x2f\x3a-\x60\x7b-\x7f]"
+    elif key_type is StringKey and key.filter_by == "alpha":
+        # any non-ascii characters or ascii letters
+        return r"[^\x00-\x60\x7b-\x7f]"
+    # anything but a path separator
+    return "[^%s]" % re.escape(os.path.sep)
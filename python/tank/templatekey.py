@@ -15,6 +15,7 @@ Classes for fields on TemplatePaths and TemplateStrings
 import re
 import datetime
 import time
+import threading
 from .platform import constants
 from .errors import TankError
 
@@ -59,7 +60,6 @@ class TemplateKey(object):
         self.shotgun_field_name = shotgun_field_name
         self.is_abstract = abstract
         self.length = length
-        self._last_error = ""
 
         # check that the key name doesn't contain invalid characters
         if not re.match(r"^%s$" % constants.TEMPLATE_KEY_NAME_REGEX, name):
@@ -79,6 +79,44 @@ class TemplateKey(object):
         if not all(self.validate(choice) for choice in self.choices):
             raise TankError(self._last_error)
 
+    def __getstate__(self):
+        """
+        Returns the state to pickle, leaving out the thread local storage which
+        can't be pickled and will be recreated on demand.
+        """
+        state = self.__dict__.copy()
+        state.pop("_TemplateKey__thread_state", None)
+        return state
+
+    def _get_last_error(self):
+        """
+        The error reported by the last call to validate() made from the current thread.
+        Keys are shared by all the templates using them, so the error is stored per
+        thread to avoid threads validating values concurrently reporting each other's
+        errors.
+        """
+        return getattr(self.__get_thread_state(), "last_error", "")
+
+    def _set_last_error(self, value):
+        """
+        Sets the error reported by validate() for the current thread.
+        """
+        self.__get_thread_state().last_error = value
+
+    _last_error = property(_get_last_error, _set_last_error)
+
+    def __get_thread_state(self):
+        """
+        Returns the thread local storage for this key.  This is created on demand as
+        derived classes may validate values before calling the base class constructor.
+
+        :returns: threading.local instance
+        """
+        thread_state = self.__dict__.get("_TemplateKey__thread_state")
+        if thread_state is None:
+            thread_state = self.__dict__.setdefault("_TemplateKey__thread_state", threading.local())
+        return thread_state
+
     @property
     def default(self):
         """
@@ -131,6 +169,18 @@ class TemplateKey(object):
         else:
             raise TankError(self._last_error)
 
+    def _str_from_values(self, values):
+        """
+        Returns the string versions of several values, as str_from_value() would.
+        Derived classes can validate and convert all the values in one go.
+
+        :param values: List of values to process.
+
+        :returns: List of strings, in the same order as the values.
+        :throws: TankError if a value is not valid for the key.
+        """
+        return [self.str_from_value(value) for value in values]
+
     def value_from_str(self, str_value):
         """
         Validates and translates a string into an appropriate value for this key.
@@ -332,6 +382,28 @@ class TimestampKey(TemplateKey):
             default=default
         )
 
+    def __getstate__(self):
+        """
+        Returns the state to pickle. The defaults generating the current time are
+        bound methods which can't be pickled so they are replaced by their name.
+        """
+        state = super(TimestampKey, self).__getstate__()
+        if self._default == self.__get_current_time:
+            state["_default"] = "now"
+        elif self._default == self.__get_current_utc_time:
+            state["_default"] = "utc_now"
+        return state
+
+    def __setstate__(self, state):
+        """
+        Restores the state of an unpickled key.
+        """
+        self.__dict__.update(state)
+        if self._default == "now":
+            self._default = self.__get_current_time
+        elif self._default == "utc_now":
+            self._default = self.__get_current_utc_time
+
     def __get_current_time(self):
         """
         Returns the current time as a datetime.datetime instance.
@@ -552,6 +624,27 @@ class IntegerKey(TemplateKey):
             return super(IntegerKey, self).validate(value)
         return True
 
+    def _str_from_values(self, values):
+        """
+        Returns the string versions of several values, as str_from_value() would.
+        When all the values are integers and the key has no choices, exclusions or
+        length to check them against, they are only formatted.
+
+        :param values: List of values to process.
+
+        :returns: List of strings, in the same order as the values.
+        :throws: TankError if a value is not valid for the key.
+        """
+        if (type(self) not in (IntegerKey, SequenceKey) or self.exclusions or self._choices
+            or self.length is not None or not all(type(value) is int for value in values)):
+            return super(IntegerKey, self)._str_from_values(values)
+
+        if self.format_spec:
+            format_str = "%%%sd" % self.format_spec
+        else:
+            format_str = "%d"
+        return [format_str % value for value in values]
+
     def _loosely_matches(self, value):
         """
         Checks if the value loosely matches. The value loosely matches if it can be turned into an
@@ -688,20 +781,17 @@ class SequenceKey(IntegerKey):
 
     def validate(self, value):
 
-        # use a std error message
-        full_format_strings = ["%s %s" % (self.FRAMESPEC_FORMAT_INDICATOR, x) for x in self.VALID_FORMAT_STRINGS]
-        error_msg = "%s Illegal value '%s', expected an Integer, a frame spec or format spec.\n" % (self, value)
-        error_msg += "Valid frame specs: %s\n" % str(self._frame_specs)
-        error_msg += "Valid format strings: %s\n" % full_format_strings
-        
+        if isinstance(value, int):
+            # frame numbers are the most common values, check them first
+            return super(SequenceKey, self).validate(value)
 
-        if isinstance(value, basestring) and value.startswith(self.FRAMESPEC_FORMAT_INDICATOR):
+        elif isinstance(value, basestring) and value.startswith(self.FRAMESPEC_FORMAT_INDICATOR):
             # FORMAT: YXZ string - check that XYZ is in VALID_FORMAT_STRINGS
             pattern = self._extract_format_string(value)        
             if pattern in self.VALID_FORMAT_STRINGS:
                 return True
             else:
-                self._last_error = error_msg
+                self._last_error = self._get_error_message(value)
                 return False
                 
         elif isinstance(value, basestring) and re.match(self.FLAME_PATTERN_REGEX, value):
@@ -709,19 +799,37 @@ class SequenceKey(IntegerKey):
             # [1234-5678]
             return True
                 
-        elif not(isinstance(value, int) or value.isdigit()):
+        elif not value.isdigit():
             # not a digit - so it must be a frame spec! (like %05d)
             # make sure that it has the right length and formatting.
             if value in self._frame_specs:
                 return True
             else:
-                self._last_error = error_msg
+                self._last_error = self._get_error_message(value)
                 return False
                 
         else:
             return super(SequenceKey, self).validate(value)
 
+    def _get_error_message(self, value):
+        """
+        Returns the std error message for an invalid value. This is only built
+        when needed as validating values is frequent.
+
+        :param value: The invalid value.
+        :returns: Error message string.
+        """
+        full_format_strings = ["%s %s" % (self.FRAMESPEC_FORMAT_INDICATOR, x) for x in self.VALID_FORMAT_STRINGS]
+        error_msg = "%s Illegal value '%s', expected an Integer, a frame spec or format spec.\n" % (self, value)
+        error_msg += "Valid frame specs: %s\n" % str(self._frame_specs)
+        error_msg += "Valid format strings: %s\n" % full_format_strings
+        return error_msg
+
     def _as_string(self, value):
+
+        if isinstance(value, int):
+            # resolve frame numbers via the integerKey base class
+            return super(SequenceKey, self)._as_string(value)
         
         if isinstance(value, basestring) and value.startswith(self.FRAMESPEC_FORMAT_INDICATOR):
             # this is a FORMAT: XYZ - convert it to the proper resolved frame spec
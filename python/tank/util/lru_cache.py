@@ -0,0 +1,192 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Implements a bounded, thread-safe, least recently used cache.
+"""
+
+import threading
+
+# indices of the fields of a link in the list of cached items
+_PREV, _NEXT, _KEY, _VALUE = 0, 1, 2, 3
+
+class LRUCache(object):
+    """
+    Cache storing up to a fixed number of items. When the cache is full, the
+    least recently used item is evicted to make room for the new one.
+
+    The items are stored in a dictionary of links forming a circular doubly linked
+    list, ordered from the least to the most recently used item. Each link is a
+    list of the form [previous link, next link, key, value].
+    """
+    def __init__(self, max_size):
+        """
+        Construction
+
+        :param max_size:    The maximum number of items to store in the cache.  A size
+                            of 0 disables the cache.
+        """
+        self._max_size = max(int(max_size), 0)
+        self._cache = {}
+        self._root = self._new_root()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def __getstate__(self):
+        """
+        Returns the state to pickle. Only the size of the cache is pickled, the
+        cached items and the lock are not.
+        """
+        return {"max_size": self._max_size}
+
+    def __setstate__(self, state):
+        """
+        Restores an empty cache from the pickled state.
+        """
+        self.__init__(state["max_size"])
+
+    @property
+    def max_size(self):
+        """
+        The maximum number of items stored in the cache.
+        """
+        return self._max_size
+
+    @property
+    def hits(self):
+        """
+        The number of lookups which found an item in the cache.
+        """
+        return self._hits
+
+    @property
+    def misses(self):
+        """
+        The number of lookups which didn't find an item in the cache.
+        """
+        return self._misses
+
+    def __len__(self):
+        """
+        The number of items currently stored in the cache.
+        """
+        return len(self._cache)
+
+    def get(self, key, default=None):
+        """
+        Retrieve the item stored for the specified key and mark it as the most
+        recently used. This method is thread-safe.
+
+        :param key:     The key of the item to retrieve.
+        :param default: The value to return if the key isn't in the cache.
+        :returns:       The cached item or the default value.
+        """
+        self._lock.acquire()
+        try:
+            if key not in self._cache:
+                self._misses += 1
+                return default
+            self._hits += 1
+            link = self._cache[key]
+            self._unlink(link)
+            self._append(link)
+            return link[_VALUE]
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        """
+        Add or update an item in the cache, evicting the least recently used items
+        if the cache is full. This method is thread-safe.
+
+        :param key:     The key of the item to store.
+        :param value:   The item to store.
+        """
+        if not self._max_size:
+            return
+
+        self._lock.acquire()
+        try:
+            link = self._cache.get(key)
+            if link is not None:
+                self._unlink(link)
+                link[_VALUE] = value
+            else:
+                link = [None, None, key, value]
+                self._cache[key] = link
+            self._append(link)
+            while len(self._cache) > self._max_size:
+                oldest = self._root[_NEXT]
+                self._unlink(oldest)
+                del self._cache[oldest[_KEY]]
+        finally:
+            self._lock.release()
+
+    def remove(self, key):
+        """
+        Remove the item stored for the specified key, if any. This method is
+        thread-safe.
+
+        :param key:     The key of the item to remove.
+        """
+        self._lock.acquire()
+        try:
+            link = self._cache.pop(key, None)
+            if link is not None:
+                self._unlink(link)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """
+        Remove all items from the cache and reset the hit and miss counters.
+        This method is thread-safe.
+        """
+        self._lock.acquire()
+        try:
+            self._cache.clear()
+            self._root = self._new_root()
+            self._hits = 0
+            self._misses = 0
+        finally:
+            self._lock.release()
+
+    def _new_root(self):
+        """
+        Creates the sentinel link of an empty list of cached items.
+
+        :returns: Link pointing to itself.
+        """
+        root = [None, None, None, None]
+        root[_PREV] = root[_NEXT] = root
+        return root
+
+    def _unlink(self, link):
+        """
+        Removes a link from the list of cached items.
+
+        :param link: The link to remove.
+        """
+        link[_PREV][_NEXT] = link[_NEXT]
+        link[_NEXT][_PREV] = link[_PREV]
+
+    def _append(self, link):
+        """
+        Adds a link at the end of the list of cached items, as the most recently
+        used item.
+
+        :param link: The link to add.
+        """
+        last = self._root[_PREV]
+        link[_PREV] = last
+        link[_NEXT] = self._root
+        last[_NEXT] = link
+        self._root[_PREV] = link
@@ -0,0 +1,265 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Finds the paths matching several glob patterns at once, listing directories
+from a pool of threads.
+
+The patterns are merged into a tree of path components so that directories
+shared by several patterns are only listed once. The paths found are the same
+as the ones glob.iglob() would return for each pattern.
+"""
+
+import os
+import sys
+import glob
+import fnmatch
+import threading
+import Queue
+
+class _PatternNode(object):
+    """
+    Node in the tree of pattern components.
+    """
+    def __init__(self):
+        """
+        Construction
+        """
+        # child nodes keyed by the pattern component they match
+        self.children = {}
+        # True if a pattern ends at this node
+        self.is_terminal = False
+
+
+class _DirectoryLister(object):
+    """
+    Performs the file system operations needed to match the children of a node
+    within a directory. Directory listings are cached so that directories reached
+    through several nodes are only listed once.
+    This class is thread-safe.
+    """
+    def __init__(self):
+        """
+        Construction
+        """
+        self._listings = {}
+        self._lock = threading.Lock()
+
+    def match_children(self, node, dirname):
+        """
+        Finds the names in a directory that match the children of a node.
+
+        :param node:    _PatternNode instance whose children should be matched.
+        :param dirname: The directory to match the children in.
+        :returns:       List of (child node, path) tuples.
+        """
+        matches = []
+        for component, child in node.children.iteritems():
+            if glob.has_magic(component):
+                names = fnmatch.filter(self._list(dirname, component), component)
+            elif component == "":
+                # pattern ending with a separator which should only match directories
+                names = [component] if os.path.isdir(dirname) else []
+            else:
+                names = [component] if os.path.lexists(os.path.join(dirname, component)) else []
+            matches.extend((child, os.path.join(dirname, name)) for name in names)
+        return matches
+
+    def _list(self, dirname, component):
+        """
+        Lists the names in a directory that may match a pattern component, in the
+        same way as glob.glob1().
+
+        :param dirname:     The directory to list.
+        :param component:   The pattern component the names will be matched against.
+        :returns:           List of names in the directory, or an empty list if the
+                            directory can't be listed.
+        """
+        if not dirname:
+            dirname = os.curdir
+        if isinstance(component, unicode) and not isinstance(dirname, unicode):
+            dirname = unicode(dirname, sys.getfilesystemencoding() or sys.getdefaultencoding())
+
+        cache_key = (dirname, type(dirname))
+        self._lock.acquire()
+        try:
+            names = self._listings.get(cache_key)
+        finally:
+            self._lock.release()
+
+        if names is None:
+            try:
+                names = os.listdir(dirname)
+            except os.error:
+                names = []
+            self._lock.acquire()
+            try:
+                self._listings[cache_key] = names
+            finally:
+                self._lock.release()
+
+        # hidden files are only matched by patterns starting with a dot:
+        if component[0] != ".":
+            names = [name for name in names if name[0] != "."]
+        return names
+
+
+def iglob(patterns, accept=None, max_workers=1):
+    """
+    Returns an iterator which yields the paths matching any of the glob patterns.
+    Each path is only returned once, in no particular order.
+
+    :param patterns:    List of glob patterns, as accepted by glob.iglob().
+    :param accept:      Optional callable which will be passed each path matching a
+                        component of a pattern, including intermediate directories,
+                        and which can return False to ignore the path and everything
+                        below it.
+    :param max_workers: The maximum number of threads used to access the file system
+                        concurrently. If 1 or less, the file system is accessed from
+                        the calling thread.
+    """
+    roots = {}
+    literal_patterns = []
+    for pattern in patterns:
+        if not glob.has_magic(pattern):
+            literal_patterns.append(pattern)
+            continue
+
+        # split the pattern the same way glob does: from the end until the
+        # remaining directory doesn't contain any magic characters
+        components = []
+        dirname = pattern
+        while True:
+            head, basename = os.path.split(dirname)
+            components.insert(0, basename)
+            if head == dirname or not glob.has_magic(head):
+                dirname = head
+                break
+            dirname = head
+
+        node = roots.setdefault(dirname, _PatternNode())
+        for component in components:
+            node = node.children.setdefault(component, _PatternNode())
+        node.is_terminal = True
+
+    found_paths = set()
+
+    # patterns without any magic characters only need to be checked for existence:
+    for pattern in literal_patterns:
+        dirname, basename = os.path.split(pattern)
+        exists = os.path.lexists(pattern) if basename else os.path.isdir(dirname)
+        if exists and pattern not in found_paths:
+            found_paths.add(pattern)
+            yield pattern
+
+    lister = _DirectoryLister()
+    if max_workers > 1:
+        results = _iter_threaded_matches(lister, roots, accept, max_workers)
+    else:
+        results = _iter_matches(lister, roots, accept)
+
+    for path in results:
+        if path not in found_paths:
+            found_paths.add(path)
+            yield path
+
+
+def _iter_matches(lister, roots, accept):
+    """
+    Walks the tree of pattern components from the calling thread.
+
+    :param lister:  _DirectoryLister instance used to access the file system.
+    :param roots:   Dictionary of root directories to pattern nodes.
+    :param accept:  Optional callable used to ignore paths.
+    :returns:       Iterator yielding the matching paths.
+    """
+    pending = [(node, dirname) for dirname, node in roots.iteritems()]
+    while pending:
+        node, dirname = pending.pop()
+        for child, path in lister.match_children(node, dirname):
+            if accept and not accept(path):
+                continue
+            if child.is_terminal:
+                yield path
+            if child.children:
+                pending.append((child, path))
+
+
+def _iter_threaded_matches(lister, roots, accept, max_workers):
+    """
+    Walks the tree of pattern components, matching the children of each node
+    from a pool of threads. Paths are yielded as soon as they are found.
+
+    :param lister:      _DirectoryLister instance used to access the file system.
+    :param roots:       Dictionary of root directories to pattern nodes.
+    :param accept:      Optional callable used to ignore paths.
+    :param max_workers: The maximum number of threads to use.
+    :returns:           Iterator yielding the matching paths.
+    """
+    tasks = Queue.Queue()
+    results = Queue.Queue()
+
+    def worker():
+        while True:
+            task = tasks.get()
+            if task is None:
+                # told to stop
+                return
+            node, dirname = task
+            try:
+                results.put((lister.match_children(node, dirname), None))
+            except Exception, e:
+                results.put((None, e))
+
+    threads = []
+    num_pending = 0
+    try:
+        for dirname, node in roots.iteritems():
+            tasks.put((node, dirname))
+            num_pending += 1
+
+        for _ in range(min(max_workers, num_pending)):
+            thread = threading.Thread(target=worker)
+            thread.setDaemon(True)
+            thread.start()
+            threads.append(thread)
+
+        while num_pending:
+            matches, error = results.get()
+            num_pending -= 1
+            if error:
+                raise error
+
+            for child, path in matches:
+                if accept and not accept(path):
+                    continue
+                if child.is_terminal:
+                    yield path
+                if child.children:
+                    if len(threads) < max_workers:
+                        # more directories to list, so use more threads if possible
+                        thread = threading.Thread(target=worker)
+                        thread.setDaemon(True)
+                        thread.start()
+                        threads.append(thread)
+                    tasks.put((child, path))
+                    num_pending += 1
+    finally:
+        # stop all threads, including if the caller stopped iterating early in 
+        # which case the directories still waiting to be listed can be ignored:
+        try:
+            while True:
+                tasks.get_nowait()
+        except Queue.Empty:
+            pass
+        for _ in threads:
+            tasks.put(None)
+        for thread in threads:
+            thread.join()
@@ -20,6 +20,7 @@ import sgtk
 import tank
 from tank.api import Tank
 from tank.errors import TankError
+from tank.hook import HookResultsCache
 from tank.template import TemplatePath, TemplateString
 from tank.templatekey import StringKey, IntegerKey, SequenceKey
 
@@ -64,6 +65,81 @@ class TestTemplateFromPath(TankTestBase):
         self.assertIsNotNone(template)
         self.assertIsInstance(template, TemplateString)
 
+    def test_index_candidates(self):
+        """Check that the template index never leaves out a matching template."""
+        paths = [os.path.join(self.project_root, "sequences/Sequence_1/shot_010/Anm/publish/shot_010.jfk.v001.ma"),
+                 os.path.join(self.project_root, "sequences/Sequence_1/shot_010/Anm/work/shot_010.jfk.v001.ma"),
+                 os.path.join(self.project_root, "sequences/Sequence_1/shot_010"),
+                 os.path.join(self.project_root, "assets/Character/foo/mod/work/foo.v001.ma"),
+                 os.path.join(self.project_root, "sequences"),
+                 self.project_root,
+                 "Nuke Script Name, v002",
+                 "/some/other/path"]
+        for path in paths:
+            expected = [t for t in self.tk.templates.values() if t.validate(path)]
+            candidates = self.tk._get_template_index().get_candidates(path)
+            for template in expected:
+                self.assertIn(template, candidates)
+            self.assertTrue(len(candidates) < len(self.tk.templates))
+
+    def test_modified_templates(self):
+        """Templates added after the index was built should still be found."""
+        keys = {"Shot": StringKey("Shot")}
+        template = TemplatePath("extra_folder/{Shot}", keys, self.project_root, "extra_folder")
+        self.tk.templates["extra_folder"] = template
+        file_path = os.path.join(self.project_root, "extra_folder", "shot_010")
+        self.assertEqual(template, self.tk.template_from_path(file_path))
+        del self.tk.templates["extra_folder"]
+        self.assertIsNone(self.tk.template_from_path(file_path))
+
+    def test_index_up_to_date(self):
+        """Checking the index shouldn't compare the templates one by one."""
+        index = self.tk._get_template_index()
+        with patch.object(tank.template.TemplateDict, "__eq__") as eq_mock:
+            self.assertTrue(index is self.tk._get_template_index())
+            self.assertFalse(eq_mock.called)
+        self.tk.templates.popitem()
+        self.assertFalse(index is self.tk._get_template_index())
+        # replacing the dictionary also rebuilds the index
+        index = self.tk._get_template_index()
+        self.tk.templates = dict(self.tk.templates)
+        self.assertFalse(index is self.tk._get_template_index())
+
+    def test_templates_from_paths(self):
+        """Batch resolution should match resolving each path on its own."""
+        publish_dir = os.path.join(self.project_root, "sequences/Sequence_1/shot_010/Anm/publish")
+        paths = [os.path.join(publish_dir, "shot_010.jfk.v%03d.ma" % v) for v in range(1, 20)]
+        paths += [publish_dir,
+                  os.path.join(self.project_root, "sequences/Sequence 1/shot_010/Anm/publish/"),
+                  "Nuke Script Name, v002"]
+        results = self.tk.templates_from_paths(paths)
+        self.assertEqual(set(paths), set(results))
+        for path in paths:
+            template = self.tk.template_from_path(path)
+            if template is None:
+                self.assertIsNone(results[path])
+            else:
+                self.assertEqual((template, template.get_fields(path)), results[path])
+        self.assertIsNotNone(results[paths[0]])
+
+    def test_templates_from_paths_ambiguous(self):
+        """Ambiguous paths should raise the same error as template_from_path."""
+        keys = {"Shot": StringKey("Shot")}
+        self.tk.templates["extra_a"] = TemplatePath("extra/{Shot}", keys, self.project_root, "extra_a")
+        self.tk.templates["extra_b"] = TemplatePath("extra/{Shot}", keys, self.project_root, "extra_b")
+        path = os.path.join(self.project_root, "extra", "shot_010")
+        self.assertRaises(TankError, self.tk.template_from_path, path)
+        self.assertRaises(TankError, self.tk.templates_from_paths, [path])
+
+    def test_key_first_candidates(self):
+        """Templates whose first static token isn't at the start of the path."""
+        keys = {"name": StringKey("name"), "ext": StringKey("ext")}
+        template = TemplatePath("{name}.{ext}", keys, "", "file_name")
+        index = tank.template.TemplateIndex({"file_name": template})
+        self.assertEqual([template], index.get_candidates("foo.ma"))
+        self.assertTrue(template.validate("foo.ma"))
+        self.assertEqual([], index.get_candidates(os.path.join("foo", "bar.ma")))
+
 
 class TestTemplatesLoaded(TankTestBase):
     """Test case for the loading of templates from project level config."""
@@ -92,6 +168,15 @@ class TestTemplatesLoaded(TankTestBase):
         alt_template = self.tk.templates["maya_shot_publish"]
         self.assertEquals(self.alt_root_1, alt_template.root_path)
 
+    def test_reload_clears_cache(self):
+        """Reloading templates should discard the fields cached by the previous templates."""
+        template = self.tk.templates["shot_project"]
+        template.get_fields(os.path.join(self.project_root, "sequences", "Seq", "shot_010", "Anm", "work"))
+        self.assertEquals(1, template.cache_info["size"])
+        self.tk.reload_templates()
+        self.assertEquals(0, template.cache_info["size"])
+        self.assertEquals(0, self.tk.templates["shot_project"].cache_info["size"])
+
 
 class TestPathsFromTemplate(TankTestBase):
     """Tests for tank.paths_from_template using test data based on sg_standard setup."""
@@ -186,6 +271,16 @@ class TestPathsFromTemplate(TankTestBase):
         self.assertIn(good_file_path, result)
         self.assertNotIn(bad_file_path, result)
 
+    def test_iter_limit(self):
+        """Test that the iterator stops once the requested number of paths has been found."""
+        fields = {"Sequence": "Seq_1", "Shot": "shot_1", "Step": "step_name", "name": "filename"}
+        result = list(self.tk.iter_paths_from_template(self.template, fields))
+        self.assertEquals(set([self.file_1, self.file_2]), set(result))
+        result = list(self.tk.iter_paths_from_template(self.template, fields, limit=1))
+        self.assertEquals(1, len(result))
+        self.assertIn(result[0], [self.file_1, self.file_2])
+        self.assertEquals([], list(self.tk.iter_paths_from_template(self.template, fields, limit=0)))
+
 
 class TestAbstractPathsFromTemplate(TankTestBase):
     """Tests Tank.abstract_paths_from_template method."""
@@ -306,9 +401,43 @@ class TestAbstractPathsFromTemplate(TankTestBase):
         result = self.tk.abstract_paths_from_template(self.template, {"name": "filename"})
         self.assertEquals(set(expected), set(result))
 
+    def test_sequences(self):
+        """Test that the frames found for each abstract path are returned."""
+        self.create_file(os.path.join(self.shot_a_path, "left", "filename.0007.exr"))
+        # files that don't fit the template shouldn't be grouped with the frames
+        self.create_file(os.path.join(self.shot_a_path, "left", "filename.0008.tif"))
+        self.create_file(os.path.join(self.shot_a_path, "left", "filename.0009b.exr"))
+        sequences = self.tk.sequences_from_template(self.template, {"name": "filename"})
+        self.assertEquals([os.path.join(self.shot_a_path, "%V", "filename.%04d.exr"),
+                           os.path.join(self.shot_b_path, "%V", "filename.%04d.exr")],
+                          [sequence.path for sequence in sequences])
+        self.assertEquals([1, 2, 3, 4, 7], sequences[0].frames)
+        self.assertEquals(1, sequences[0].first_frame)
+        self.assertEquals(7, sequences[0].last_frame)
+        self.assertEquals([5, 6], sequences[0].missing_frames)
+        self.assertEquals([1, 2, 3, 4], sequences[1].frames)
+        self.assertEquals([], sequences[1].missing_frames)
+
+    def test_sequences_parsed_once(self):
+        """Test that only one frame per sequence is parsed."""
+        template = TemplatePath(self.template.definition, self.template.keys, self.project_root, cache_size=0)
+        with patch.object(TemplatePath, "parse", autospec=True, side_effect=TemplatePath.parse) as mock_parse:
+            sequences = self.tk.sequences_from_template(template, {"Shot": "AAA"})
+        self.assertEquals(4, mock_parse.call_count)
+        self.assertEquals([[1, 2, 3, 4]] * 2, [sequence.frames for sequence in sequences])
+
+    def test_iter_limit(self):
+        expected = [os.path.join(self.shot_a_path, "%V", "filename.%04d.exr"),
+                    os.path.join(self.shot_b_path, "%V", "filename.%04d.exr")]
+        result = list(self.tk.iter_abstract_paths_from_template(self.template, {"name": "filename"}))
+        self.assertEquals(sorted(expected), sorted(result))
+        result = list(self.tk.iter_abstract_paths_from_template(self.template, {"name": "filename"}, limit=1))
+        self.assertEquals(1, len(result))
+        self.assertIn(result[0], expected)
+
 
 class TestPathsFromTemplateGlob(TankTestBase):
-    """Tests for Tank.paths_from_template method which check the string sent to glob.glob."""
+    """Tests for Tank.paths_from_template method which check the strings sent to parallel_glob.iglob."""
     def setUp(self):
         super(TestPathsFromTemplateGlob, self).setUp()
         keys = {"Shot": StringKey("Shot"),
@@ -317,7 +446,7 @@ class TestPathsFromTemplateGlob(TankTestBase):
 
         self.template = TemplatePath("{Shot}/{version}/filename.{seq_num}", keys, root_path=self.project_root)
 
-    @patch("tank.api.glob.iglob")
+    @patch("tank.api.parallel_glob.iglob")
     def assert_glob(self, fields, expected_glob, skip_keys, mock_glob):
         # want to ensure that value returned from glob is returned
         expected = [os.path.join(self.project_root, "shot_1","001","filename.00001")]
@@ -326,8 +455,8 @@ class TestPathsFromTemplateGlob(TankTestBase):
         self.assertEquals(expected, retval)
         # Check glob string
         expected_glob = os.path.join(self.project_root, expected_glob)
-        glob_actual = [x[0][0] for x in mock_glob.call_args_list][0]
-        self.assertEquals(expected_glob, glob_actual)
+        globs_actual = [x[0][0] for x in mock_glob.call_args_list][0]
+        self.assertEquals([expected_glob], globs_actual)
 
     def test_fully_qualified(self):
         """Test case where all field values are supplied."""
@@ -429,6 +558,109 @@ class TestApiProperties(TankTestBase):
 
 
 
+class TestCacheableCoreHooks(TankTestBase):
+    """
+    Tests the caching of the results of core hooks.
+    """
+    def setUp(self):
+        super(TestCacheableCoreHooks, self).setUp()
+        self.setup_fixtures()
+        pc = self.tk.pipeline_configuration
+        patcher = patch.object(pc, "execute_core_hook_internal", wraps=pc.execute_core_hook_internal)
+        self.execute_core_hook_internal = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(pc, "execute_core_hook_method_internal", wraps=pc.execute_core_hook_method_internal)
+        self.execute_core_hook_method_internal = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cacheable_method(self):
+        # use the hook which comes with the core, which declares its method cacheable
+        pc = self.tk.pipeline_configuration
+        pc._clear_cached_settings()
+        patcher = patch.object(pc, "get_core_hooks_location", return_value=self.tank_temp)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        result = self.tk.execute_core_hook("context_additional_entities")
+        self.assertEqual([], result["entity_types_in_path"])
+        self.assertEqual(1, self.execute_core_hook_internal.call_count)
+
+        # the cached result is returned and can't be modified by the caller
+        result["entity_types_in_path"].append("CustomEntity01")
+        result = self.tk.execute_core_hook("context_additional_entities")
+        self.assertEqual([], result["entity_types_in_path"])
+        self.assertEqual(1, self.execute_core_hook_internal.call_count)
+
+        # results are cached per API instance
+        Tank(pc).execute_core_hook("context_additional_entities")
+        self.assertEqual(3, self.execute_core_hook_internal.call_count)
+
+    def test_not_cacheable(self):
+        self.tk.execute_core_hook("tank_init")
+        self.tk.execute_core_hook("tank_init")
+        self.assertEqual(2, self.execute_core_hook_internal.call_count)
+
+        # the hook of the test configuration overrides the method of the core hook 
+        # without declaring it cacheable
+        self.tk.execute_core_hook("context_additional_entities")
+        self.tk.execute_core_hook("context_additional_entities")
+        self.assertEqual(4, self.execute_core_hook_internal.call_count)
+
+    @patch("tank.hook.time.time")
+    def test_cacheable_setting(self, time_mock):
+        time_mock.return_value = 100
+        with patch.object(self.tk.pipeline_configuration, 
+                          "get_cacheable_hooks", 
+                          return_value={"cache_location.path_cache": 10}):
+            # forget the hooks found not to be cacheable so far
+            self.tk.pipeline_configuration._clear_cached_settings()
+            for _ in range(2):
+                path = self.tk.execute_core_hook_method("cache_location", "path_cache", 
+                                                        project_id=1, pipeline_configuration_id=1)
+            self.assertEqual(1, self.execute_core_hook_method_internal.call_count)
+
+            # different arguments are a different result
+            self.tk.execute_core_hook_method("cache_location", "path_cache", 
+                                             project_id=2, pipeline_configuration_id=1)
+            self.assertEqual(2, self.execute_core_hook_method_internal.call_count)
+
+            # results expire
+            time_mock.return_value = 111
+            self.assertEqual(path, self.tk.execute_core_hook_method("cache_location", "path_cache", 
+                                                                    project_id=1, pipeline_configuration_id=1))
+            self.assertEqual(3, self.execute_core_hook_method_internal.call_count)
+
+    @patch("tank.hook.time.time")
+    def test_results_evicted(self, time_mock):
+        time_mock.return_value = 100
+        cache = HookResultsCache()
+        cache.set("a", 1, 10)
+        cache.set("b", 2)
+        self.assertEqual((True, 1), cache.get("a"))
+
+        # expired results are discarded when looked up
+        time_mock.return_value = 111
+        self.assertEqual((False, None), cache.get("a"))
+        self.assertEqual(1, len(cache._results))
+        self.assertEqual((True, 2), cache.get("b"))
+
+        # and the number of results is bounded
+        with patch("tank.platform.constants.HOOK_RESULTS_CACHE_SIZE", 2):
+            cache = HookResultsCache()
+        for key in range(3):
+            cache.set(key, key)
+        self.assertEqual(2, len(cache._results))
+        self.assertEqual((False, None), cache.get(0))
+        self.assertEqual((True, 2), cache.get(2))
+
+    def test_invalid_setting(self):
+        pc = self.tk.pipeline_configuration
+        for value in ["context_additional_entities", {"context_additional_entities": "forever"}]:
+            pc._clear_cached_settings()
+            with patch("tank.pipelineconfig_utils.get_metadata", return_value={"cacheable_hooks": value}):
+                self.assertRaises(TankError, pc.get_cacheable_hooks)
+
+
 class TestTankFromPath(TankTestBase):
 
     def setUp(self):
@@ -10,6 +10,7 @@
 
 import os
 import copy
+import pickle
 
 from tank_test.tank_test_base import *
 
@@ -272,6 +273,37 @@ class TestFromPath(TestContext):
         
         self.assertIsNone(result.task)
 
+    def test_cached(self):
+        """Check that the contexts resolved for the files in a directory are cached."""
+        file_path = os.path.join(self.step_path, "file.ma")
+        self.create_file(file_path)
+        other_file_path = os.path.join(self.step_path, "other_file.ma")
+        self.create_file(other_file_path)
+
+        with patch("tank.path_cache.PathCache.get_entities_for_ancestors",
+                   side_effect=tank.path_cache.PathCache.get_entities_for_ancestors,
+                   autospec=True) as get_entities_for_ancestors:
+            result = self.tk.context_from_path(file_path)
+            self.assertEquals(self.step["id"], result.step["id"])
+            self.assertEquals(1, get_entities_for_ancestors.call_count)
+
+            # other files in the same directory don't need to be resolved again
+            other_result = self.tk.context_from_path(other_file_path)
+            self.assertEquals(result, other_result)
+            self.assertEquals(1, get_entities_for_ancestors.call_count)
+            
+            # the cached data can't be modified through the contexts
+            other_result.step["name"] = "other_name"
+            self.assertEquals(self.step["name"], self.tk.context_from_path(file_path).step["name"])
+
+            # so does the directory itself
+            self.assertEquals(result, self.tk.context_from_path(self.step_path))
+            self.assertEquals(1, get_entities_for_ancestors.call_count)
+
+            # changes to the path cache invalidate the cache
+            self.add_production_path(os.path.join(self.project_root, "other_path"), self.seq)
+            self.assertEquals(result, self.tk.context_from_path(file_path))
+            self.assertEquals(2, get_entities_for_ancestors.call_count)
 
 
 class TestFromPathWithPrevious(TestContext):
@@ -451,6 +483,55 @@ class TestFromEntity(TestContext):
         self.assertTrue( (num_finds_after-num_finds_before) == 1 )
 
 
+    @patch("tank.util.login.get_current_user")
+    def test_tasks_from_sg(self, get_current_user):
+        """
+        Case that the data for several tasks is found with a single shotgun query
+        """
+        get_current_user.return_value = self.current_user
+        other_task = {"id": 2,
+                      "type": "Task",
+                      "content": "other_task_content",
+                      "project": self.project,
+                      "entity": self.shot,
+                      "step": self.step}
+        self.add_to_sg_mock_db(other_task)
+
+        num_finds_before = self.tk.shotgun.finds
+        results = self.tk.contexts_from_entities("Task", [self.task["id"], other_task["id"]])
+        self.assertEquals(1, self.tk.shotgun.finds - num_finds_before)
+
+        self.assertEquals([self.task["id"], other_task["id"]], sorted(results))
+        for task in [self.task, other_task]:
+            self.assertEquals(context.from_entity(self.tk, "Task", task["id"]), results[task["id"]])
+        self.assertEquals(other_task["content"], results[other_task["id"]].task["name"])
+
+        # all the tasks must exist
+        self.assertRaises(TankError, self.tk.contexts_from_entities, "Task", [self.task["id"], 42])
+
+    @patch("tank.util.login.get_current_user")
+    def test_entities_from_cache(self, get_current_user):
+        """
+        Case that the data for several entities is found in the path cache at once
+        """
+        get_current_user.return_value = self.current_user
+        other_shot = {"type": "Shot", "code": "other_shot", "id": 5, "project": self.project}
+        self.add_production_path(os.path.join(self.seq_path, "other_shot"), other_shot)
+
+        with patch("tank.path_cache.PathCache.get_entities_for_ancestors_of_paths",
+                   side_effect=tank.path_cache.PathCache.get_entities_for_ancestors_of_paths,
+                   autospec=True) as get_entities_for_ancestors_of_paths:
+            num_finds_before = self.tk.shotgun.finds
+            results = self.tk.contexts_from_entities("Shot", [self.shot["id"], other_shot["id"]])
+            self.assertEquals(0, self.tk.shotgun.finds - num_finds_before)
+            self.assertEquals(1, get_entities_for_ancestors_of_paths.call_count)
+
+        for shot in [self.shot, other_shot]:
+            result = results[shot["id"]]
+            self.assertEquals(context.from_entity(self.tk, "Shot", shot["id"]), result)
+            self.check_entity(self.project, result.project)
+            self.assertEquals(shot["code"], result.entity["name"])
+
     @patch("tank.util.login.get_current_user")
     def test_data_missing_non_task(self, get_current_user):
         """
@@ -742,6 +823,50 @@ class TestAsTemplateFields(TestContext):
         # Check that the shotgun method find_one was not used
         self.assertEqual(finds, self.tk.shotgun.finds)
 
+    def test_query_batched(self):
+        """
+        Test that the values of all the keys linked to the same entity are
+        fetched with a single query.
+        """
+        self.keys["shot_extra"] = StringKey("shot_extra", shotgun_entity_type="Shot", shotgun_field_name="extra_field")
+        self.keys["shot_seq"] = StringKey("shot_seq", shotgun_entity_type="Shot", shotgun_field_name="sg_sequence")
+        template_def = "/sequence/{Sequence}/{Shot}/{Step}/work/{shot_extra}.{shot_seq}.ext"
+        template = TemplatePath(template_def, self.keys, self.project_root)
+
+        finds = self.tk.shotgun.finds
+        result = self.ctx.as_template_fields(template)
+        self.assertEquals("extravalue", result["shot_extra"])
+        self.assertEquals("seq_name", result["shot_seq"])
+        self.assertEqual(finds + 1, self.tk.shotgun.finds)
+
+    def test_fields_memoised(self):
+        """
+        Test that the fields found in the path cache are memoised until the path cache changes.
+        """
+        expected_fields = {"Sequence": "Seq", "Shot": "shot_code", "Step": "step_short_name"}
+        with patch("tank.path_cache.PathCache.get_paths",
+                   side_effect=tank.path_cache.PathCache.get_paths,
+                   autospec=True) as get_paths:
+            self.assertEquals(expected_fields, self.ctx.as_template_fields(self.template))
+
+            # the paths of each entity are only looked up once
+            looked_up_entities = [call[0][1:3] for call in get_paths.call_args_list]
+            self.assertEquals(len(set(looked_up_entities)), len(looked_up_entities))
+
+            num_calls = get_paths.call_count
+            fields = self.ctx.as_template_fields(self.template)
+            self.assertEquals(expected_fields, fields)
+            self.assertEquals(num_calls, get_paths.call_count)
+
+            # modifying the returned fields doesn't affect the memoised ones
+            fields["Shot"] = "other_shot"
+            self.assertEquals(expected_fields, self.ctx.as_template_fields(self.template))
+
+            # changes to the path cache invalidate the memoised fields
+            self.add_production_path(os.path.join(self.project_root, "other_path"), self.seq)
+            self.assertEquals(expected_fields, self.ctx.as_template_fields(self.template))
+            self.assertTrue(get_paths.call_count > num_calls)
+
     def test_shot_step(self):
         expected_step_name = "step_short_name"
         expected_shot_name = "shot_code"
@@ -1004,3 +1129,40 @@ class TestSerailize(TestContext):
         serialized = tank.context.serialize(context_1)
         context_2 = tank.context.deserialize(serialized)
         self.assertTrue(context_1 == context_2)
+
+    def test_compact_format(self):
+        context_1 = context.Context(**self.kws)
+        serialized = tank.context.serialize(context_1)
+        self.assertTrue(serialized.startswith("{"))
+        self.assertFalse(" " in serialized)
+        context_2 = tank.context.deserialize(serialized)
+        self.assertEqual(context_1.entity, context_2.entity)
+        self.assertTrue(isinstance(context_2.entity["type"], str))
+
+    def test_legacy_format(self):
+        context_1 = context.Context(**self.kws)
+        data = dict(project=self.project, entity=self.shot, step=self.step,
+                    task=self.kws["task"], _pc_path=self.tk.pipeline_configuration.get_path())
+        context_2 = tank.context.deserialize(pickle.dumps(data))
+        self.assertTrue(context_1 == context_2)
+
+    def test_unsupported_format(self):
+        serialized = tank.context.serialize(context.Context(**self.kws))
+        serialized = serialized.replace('"_format_version":1', '"_format_version":999')
+        self.assertRaises(TankError, tank.context.deserialize, serialized)
+
+    def test_reuse_tank(self):
+        serialized = tank.context.serialize(context.Context(**self.kws))
+        with patch("tank.api.Tank") as tank_mock:
+            # an instance for the same pipeline configuration is used as is
+            self.assertTrue(tank.context.deserialize(serialized, tk=self.tk).tank is self.tk)
+            self.assertFalse(tank_mock.called)
+            # instances created from the cache are shared
+            self.addCleanup(tank.context.g_tank_instances.clear)
+            context_1 = tank.context.deserialize(serialized, use_tank_cache=True)
+            context_2 = tank.context.deserialize(serialized, use_tank_cache=True)
+            self.assertEqual(tank_mock.call_count, 1)
+            self.assertTrue(context_1.tank is context_2.tank)
+            # otherwise a new instance is created every time
+            tank.context.deserialize(serialized)
+            self.assertEqual(tank_mock.call_count, 2)
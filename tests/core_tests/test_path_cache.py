@@ -9,10 +9,15 @@
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
 import os
+import sys
 import StringIO
 import sqlite3
 import shutil
 import logging
+import threading
+import time
+
+from mock import patch
 
 from tank_test.tank_test_base import *
 
@@ -90,6 +95,120 @@ class TestInit(TestPathCache):
         column_names = [x[1] for x in ret.fetchall()]
         self.assertEquals(expected, column_names)
 
+    def test_upgrade_indices(self):
+        """Test that the indices used to look up folder trees are only added to existing dbs on demand"""
+        self.path_cache.close()
+        path_cache.g_path_cache_connections.close(self.path_cache_location)
+        connection = sqlite3.connect(self.path_cache_location)
+        try:
+            connection.executescript("DROP INDEX path_cache_subtree; DROP INDEX shotgun_status_shotgun_id;")
+        finally:
+            connection.close()
+
+        names = ["path_cache_subtree", "shotgun_status_shotgun_id"]
+        pc = path_cache.PathCache(self.tk)
+        try:
+            self.assertEqual(names, [name for (name, statement) in pc._get_missing_indexes(pc._connection)])
+            self.assertEqual(names, pc.create_missing_indexes())
+            self.assertEqual([], pc._get_missing_indexes(pc._connection))
+            self.assertEqual([], pc.create_missing_indexes())
+        finally:
+            pc.close()
+
+
+class TestConnectionPool(TestPathCache):
+
+    def test_reuse(self):
+        """Test connections are reused once closed but never used by two path caches at once."""
+        pc = path_cache.PathCache(self.tk)
+        connection = pc._connection
+        self.assertNotEqual(connection, self.path_cache._connection)
+        pc.close()
+        with patch.object(path_cache.PathCache, "_init_schema") as init_schema_mock:
+            pc = path_cache.PathCache(self.tk)
+            # the schema was already checked when the connection was opened
+            self.assertFalse(init_schema_mock.called)
+        self.assertEqual(connection, pc._connection)
+        pc.close()
+
+    def test_uncommitted_changes(self):
+        """Test changes which weren't committed are discarded when the path cache is closed."""
+        pc = path_cache.PathCache(self.tk)
+        rows = list(pc._connection.execute("SELECT * FROM event_log_sync"))
+        pc._connection.execute("INSERT INTO event_log_sync(last_id) VALUES(1234)")
+        pc.close()
+        pc = path_cache.PathCache(self.tk)
+        self.assertEqual(rows, list(pc._connection.execute("SELECT * FROM event_log_sync")))
+        pc.close()
+
+    def test_threads(self):
+        """Test connections aren't shared between threads."""
+        pc = path_cache.PathCache(self.tk)
+        connection = pc._connection
+        pc.close()
+        results = []
+        def use_path_cache():
+            pc = path_cache.PathCache(self.tk)
+            results.append(pc._connection)
+            results.append(pc.get_entity(self.project_root))
+            pc.close()
+            path_cache.g_path_cache_connections.close()
+        thread = threading.Thread(target=use_path_cache)
+        thread.start()
+        thread.join()
+        self.assertNotEqual(connection, results[0])
+        self.assertEqual(self.project["id"], results[1]["id"])
+
+    def test_file_replaced(self):
+        """Test connections to a database file which was deleted aren't reused."""
+        self.path_cache.close()
+        connection = path_cache.PathCache(self.tk)._connection
+        if sys.platform != "win32":
+            # the file can't be deleted while it is opened on windows
+            os.remove(self.path_cache_location)
+            self.path_cache = path_cache.PathCache(self.tk)
+            self.assertNotEqual(connection, self.path_cache._connection)
+            self.assertEqual([], list(self.path_cache._connection.execute("SELECT * FROM path_cache")))
+
+    def test_journal_mode(self):
+        """Test the journal mode of the database."""
+        self.path_cache.close()
+        pc = path_cache.PathCache(self.tk)
+        self.assertEqual("delete", pc._connection.execute("PRAGMA journal_mode").fetchone()[0])
+        pc.close()
+        with patch("tank.pipelineconfig.PipelineConfiguration.get_path_cache_journal_mode", 
+                   return_value="wal"):
+            pc = path_cache.PathCache(self.tk)
+            self.assertEqual("wal", pc._connection.execute("PRAGMA journal_mode").fetchone()[0])
+            pc.close()
+
+    def test_idle_timeout(self):
+        """Test connections which weren't used for a while are closed."""
+        pc = path_cache.PathCache(self.tk)
+        connection = pc._connection
+        with patch.object(constants, "PATH_CACHE_IDLE_CONNECTION_TIMEOUT", -1):
+            pc.close()
+            self.assertRaises(sqlite3.ProgrammingError, connection.execute, "SELECT 1")
+            pc = path_cache.PathCache(self.tk)
+            self.assertNotEqual(connection, pc._connection)
+            pc.close()
+
+    @patch("time.sleep")
+    def test_retry_if_locked(self, sleep_mock):
+        """Test operations are retried while the database is locked."""
+        errors = [sqlite3.OperationalError("database is locked")] * constants.PATH_CACHE_BUSY_RETRIES
+        def func():
+            if errors:
+                raise errors.pop()
+            return 1
+        self.assertEqual(1, path_cache._retry_if_locked(func))
+        self.assertEqual(constants.PATH_CACHE_BUSY_RETRIES, sleep_mock.call_count)
+
+        errors = [sqlite3.OperationalError("database is locked")] * (constants.PATH_CACHE_BUSY_RETRIES + 1)
+        self.assertRaises(sqlite3.OperationalError, path_cache._retry_if_locked, func)
+
+        errors = [sqlite3.OperationalError("no such table")]
+        self.assertRaises(sqlite3.OperationalError, path_cache._retry_if_locked, func)
 
 
 class TestAddMapping(TestPathCache):
@@ -194,6 +313,37 @@ class TestAddMapping(TestPathCache):
 
 
 
+    def test_batch(self):
+        """
+        Tests adding several mappings at once, including mappings which are 
+        repeated in the batch or already in the db.
+        """
+        shot_path = os.path.join(self.project_root, "shot")
+        step_path = os.path.join(shot_path, "step")
+        add_item_to_cache(self.path_cache, self.entity, shot_path)
+
+        other_entity = {"type": "EntityType", "id": 2, "name": "OtherName"}
+        data = [{"entity": self.entity, "path": shot_path, "primary": True, "metadata": {}},
+                {"entity": other_entity, "path": step_path, "primary": True, "metadata": {}},
+                {"entity": self.entity, "path": step_path, "primary": False, "metadata": {}},
+                {"entity": other_entity, "path": step_path, "primary": True, "metadata": {}},
+                {"entity": self.entity, "path": step_path, "primary": False, "metadata": {}}]
+        self.path_cache.add_mappings(data, "EntityType", [1, 2])
+
+        # only the new mappings were added and they know their row ids
+        self.assertEqual([False, True, True, False, False], ["path_cache_row_id" in d for d in data])
+        res = self.db_cursor.execute("SELECT rowid, entity_id, path, primary_entity FROM path_cache ORDER BY rowid")
+        rows = [row for row in res.fetchall() if row[2].startswith("/shot")]
+        self.assertEqual([(1, "/shot", 1), (2, "/shot/step", 1), (1, "/shot/step", 0)], [row[1:] for row in rows])
+        self.assertEqual([data[1]["path_cache_row_id"], data[2]["path_cache_row_id"]], [row[0] for row in rows[1:]])
+
+        # a conflicting mapping fails the whole batch
+        new_entity = {"type": "EntityType", "id": 3, "name": "NewName"}
+        data = [{"entity": new_entity, "path": os.path.join(shot_path, "new"), "primary": True, "metadata": {}},
+                {"entity": new_entity, "path": step_path, "primary": True, "metadata": {}}]
+        self.assertRaises(tank.TankError, self.path_cache.add_mappings, data, "EntityType", [3])
+        self.assertEqual([], self.path_cache.get_paths("EntityType", 3, primary_only=False))
+
     def test_non_primary_path(self):
         """
         Case path to add has alternate (non-primary) project as root.
@@ -284,6 +434,359 @@ class TestGetEntity(TestPathCache):
         self.assertIsNone(result)
 
 
+class TestIndex(TestPathCache):
+    """
+    Tests for the in-memory index used by get_entity and get_secondary_entities.
+    """
+    def setUp(self):
+        super(TestIndex, self).setUp()
+        self.shot_path = os.path.join(self.project_root, "seq", "shot_name")
+        self.shot = {"type": "Shot", "id": 1, "name": "shot_name"}
+        self.asset = {"type": "Asset", "id": 2, "name": "asset_name"}
+
+    def _execute_in_db(self, sql):
+        """Modifies the database directly, leaving the index untouched."""
+        connection = sqlite3.connect(self.path_cache_location)
+        try:
+            connection.execute(sql)
+            connection.commit()
+        finally:
+            connection.close()
+
+    def test_lookups_indexed(self):
+        add_item_to_cache(self.path_cache, self.shot, self.shot_path)
+        add_item_to_cache(self.path_cache, self.asset, self.shot_path, primary=False)
+        self.assertEqual(self.shot, self.path_cache.get_entity(self.shot_path))
+        self.assertEqual([self.asset], self.path_cache.get_secondary_entities(self.shot_path))
+
+        # other path caches reuse the index as long as the marker doesn't change
+        self.path_cache.close()
+        self._execute_in_db("UPDATE path_cache SET entity_name = 'renamed'")
+        pc = path_cache.PathCache(self.tk)
+        self.assertEqual(self.shot, pc.get_entity(self.shot_path))
+        self.assertEqual([self.asset], pc.get_secondary_entities(self.shot_path))
+        pc.close()
+
+        self._execute_in_db("UPDATE event_log_sync SET last_id = last_id + 1")
+        pc = path_cache.PathCache(self.tk)
+        self.assertEqual("renamed", pc.get_entity(self.shot_path)["name"])
+        self.assertEqual("renamed", pc.get_secondary_entities(self.shot_path)[0]["name"])
+        pc.close()
+
+    def test_add_mappings(self):
+        # paths which aren't in the path cache are indexed as well
+        self.assertIsNone(self.path_cache.get_entity(self.shot_path))
+        self.assertEqual([], self.path_cache.get_secondary_entities(self.shot_path))
+        add_item_to_cache(self.path_cache, self.shot, self.shot_path)
+        self.assertEqual(self.shot, self.path_cache.get_entity(self.shot_path))
+        pc = path_cache.PathCache(self.tk)
+        self.assertEqual(self.shot, pc.get_entity(self.shot_path))
+        pc.close()
+
+    def test_synchronize(self):
+        add_item_to_cache(self.path_cache, self.shot, self.shot_path)
+        self.assertEqual(self.shot, self.path_cache.get_entity(self.shot_path))
+        self._execute_in_db("UPDATE path_cache SET entity_name = 'renamed'")
+        # a full sync replays the path cache from shotgun
+        self.path_cache.synchronize(full_sync=True)
+        self.assertEqual(self.shot, self.path_cache.get_entity(self.shot_path))
+
+    def test_returned_entities_not_shared(self):
+        add_item_to_cache(self.path_cache, self.shot, self.shot_path)
+        self.path_cache.get_entity(self.shot_path)["name"] = "modified"
+        self.assertEqual(self.shot, self.path_cache.get_entity(self.shot_path))
+
+
+class TestGetEntitiesForAncestors(TestPathCache):
+    """
+    Tests for the lookup of the entities of a path and its parents used by the context.
+    """
+    def setUp(self):
+        super(TestGetEntitiesForAncestors, self).setUp()
+        self.seq_path = os.path.join(self.project_root, "seq")
+        self.shot_path = os.path.join(self.seq_path, "shot_name")
+        self.step_path = os.path.join(self.shot_path, "step_name")
+        self.seq = {"type": "Sequence", "id": 1, "name": "seq"}
+        self.shot = {"type": "Shot", "id": 2, "name": "shot_name"}
+        self.step = {"type": "Step", "id": 3, "name": "step_name"}
+        self.asset = {"type": "Asset", "id": 4, "name": "asset_name"}
+        add_item_to_cache(self.path_cache, self.seq, self.seq_path)
+        add_item_to_cache(self.path_cache, self.shot, self.shot_path)
+        add_item_to_cache(self.path_cache, self.asset, self.shot_path, primary=False)
+        add_item_to_cache(self.path_cache, self.step, self.step_path)
+
+    def _check_ancestors(self, pc):
+        file_path = os.path.join(self.step_path, "file.ma")
+        project = {"type": "Project", "id": self.project["id"], "name": self.project["name"]}
+        expected = [(file_path, None, []),
+                    (self.step_path, self.step, []),
+                    (self.shot_path, self.shot, [self.asset]),
+                    (self.seq_path, self.seq, []),
+                    (self.project_root, project, [])]
+        self.assertEqual(expected, pc.get_entities_for_ancestors(file_path))
+        # the results match the lookups of each path
+        for (path, entity, secondary_entities) in expected:
+            self.assertEqual(entity, pc.get_entity(path))
+            self.assertEqual(secondary_entities, pc.get_secondary_entities(path))
+
+    def test_ancestors(self):
+        self._check_ancestors(self.path_cache)
+        # twice, now that the paths are indexed
+        self._check_ancestors(self.path_cache)
+
+    def test_without_index(self):
+        self.path_cache._sync_with_sg = False
+        self._check_ancestors(self.path_cache)
+
+    def test_non_project_path(self):
+        self.assertEqual([], self.path_cache.get_entities_for_ancestors(self.tank_temp))
+        self.assertEqual([], self.path_cache.get_entities_for_ancestors(None))
+
+
+class TestMirror(TestPathCache):
+    """
+    Tests for the local-disk mirror of the path cache.
+    """
+    def setUp(self):
+        super(TestMirror, self).setUp()
+        self.mirror_location = os.path.join(self.tank_temp, "path_cache_mirror_%s" % id(self))
+        patcher = patch.object(self.tk.pipeline_configuration, 
+                               "get_path_cache_mirror_location", 
+                               return_value=self.mirror_location)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        path_cache.g_path_cache_mirrors.stop()
+        path_cache.g_path_cache_connections.close()
+        super(TestMirror, self).tearDown()
+
+    def test_mirror_created(self):
+        shot = {"type": "Shot", "id": 1, "name": "shot_name"}
+        shot_path = os.path.join(self.project_root, "shot_name")
+        add_item_to_cache(self.path_cache, shot, shot_path)
+        self.path_cache.close()
+        
+        # the mirror is a copy of the path cache
+        pc = path_cache.PathCache(self.tk)
+        try:
+            self.assertEqual(self.mirror_location, os.path.dirname(pc._path_cache_file))
+            self.assertEqual(shot, pc.get_entity(shot_path))
+        
+            # changes to the mirror don't affect the path cache
+            other_shot_path = os.path.join(self.project_root, "other_shot")
+            add_item_to_cache(pc, {"type": "Shot", "id": 2, "name": "other_shot"}, other_shot_path)
+        finally:
+            pc.close()
+        
+        pc = path_cache.PathCache(self.tk)
+        try:
+            self.assertEqual(2, pc.get_entity(other_shot_path)["id"])
+        finally:
+            pc.close()
+        connection = sqlite3.connect(self.path_cache_location)
+        try:
+            self.assertEqual([], list(connection.execute("SELECT * FROM path_cache WHERE entity_id = 2")))
+        finally:
+            connection.close()
+
+    @patch("tank.platform.constants.PATH_CACHE_MIRROR_REFRESH_INTERVAL", 0.01)
+    def test_refresh(self):
+        synchronized = threading.Event()
+        def synchronize(*args, **kwargs):
+            synchronized.set()
+            return []
+        
+        with patch.object(path_cache.PathCache, "synchronize", side_effect=synchronize):
+            pc = path_cache.PathCache(self.tk)
+            pc.close()
+            synchronized.wait(5)
+            self.assertTrue(synchronized.isSet())
+            path_cache.g_path_cache_mirrors.stop()
+
+    @patch("tank.platform.constants.PATH_CACHE_MIRROR_REFRESH_INTERVAL", 0.01)
+    def test_refresh_once_per_host(self):
+        """Test a mirror isn't refreshed while another process holds the lock."""
+        pc = path_cache.PathCache(self.tk)
+        mirror_path = pc._path_cache_file
+        pc.close()
+        path_cache.g_path_cache_mirrors.stop()
+
+        with patch.object(path_cache.PathCache, "synchronize", return_value=[]) as synchronize_mock:
+            lock_path = "%s.lock" % mirror_path
+            self.assertTrue(path_cache._acquire_lock_file(lock_path, 60))
+            self.assertFalse(path_cache._acquire_lock_file(lock_path, 60))
+            try:
+                pc = path_cache.PathCache(self.tk)
+                pc.close()
+                time.sleep(0.1)
+                path_cache.g_path_cache_mirrors.stop()
+                self.assertFalse(synchronize_mock.called)
+            finally:
+                path_cache._release_lock_file(lock_path)
+
+            # a stale lock is taken over
+            self.assertTrue(path_cache._acquire_lock_file(lock_path, 60))
+            self.assertTrue(path_cache._acquire_lock_file(lock_path, -1))
+            path_cache._release_lock_file(lock_path)
+
+    @patch("tank.platform.constants.PATH_CACHE_MIRROR_REFRESH_INTERVAL", 0.01)
+    def test_refresh_failure_logged(self):
+        """Test failures to refresh a mirror are logged."""
+        failed = threading.Event()
+        def warning(*args, **kwargs):
+            failed.set()
+
+        with patch.object(path_cache.PathCache, "synchronize", side_effect=Exception("sync failed")):
+            with patch.object(path_cache.logger, "warning", side_effect=warning):
+                pc = path_cache.PathCache(self.tk)
+                pc.close()
+                failed.wait(5)
+                self.assertTrue(failed.isSet())
+                path_cache.g_path_cache_mirrors.stop()
+
+
+class TestStats(TestPathCache):
+    """
+    Tests for the statistics of the path cache operations.
+    """
+    def setUp(self):
+        super(TestStats, self).setUp()
+        patcher = patch.object(path_cache, "g_path_cache_stats", path_cache.PathCacheStats())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # statistics may have been left behind by previous runs
+        self.path_cache.reset_saved_stats()
+
+    def test_record(self):
+        shot = {"type": "Shot", "id": 1, "name": "shot_name"}
+        shot_path = os.path.join(self.project_root, "shot_name")
+        add_item_to_cache(self.path_cache, shot, shot_path)
+        self.path_cache.get_entity(shot_path)
+        self.path_cache.get_entity(shot_path)
+        self.path_cache.get_paths("Shot", 1, False)
+
+        stats = self.path_cache.get_stats()
+        self.assertEqual(2, stats["get_entity"]["calls"])
+        self.assertEqual(2, stats["get_entity"]["rows"])
+        self.assertEqual(1, stats["get_paths"]["calls"])
+        self.assertEqual(1, stats["get_paths"]["rows"])
+        self.assertEqual(1, stats["add_mappings"]["calls"])
+        self.assertTrue(stats["commit"]["calls"] >= 1)
+
+    def test_lock_wait(self):
+        """
+        Tests the time spent waiting for another connection to release its write lock 
+        is recorded.
+        """
+        pcl = self.path_cache._get_path_cache_location()
+        other_connection = sqlite3.connect(pcl, check_same_thread=False)
+        other_connection.isolation_level = None
+        other_connection.execute("BEGIN IMMEDIATE")
+        release = threading.Timer(0.5, other_connection.execute, ["ROLLBACK"])
+        release.start()
+        try:
+            shot = {"type": "Shot", "id": 1, "name": "shot_name"}
+            add_item_to_cache(self.path_cache, shot, os.path.join(self.project_root, "shot_name"))
+        finally:
+            release.join()
+            other_connection.close()
+
+        stats = self.path_cache.get_stats()
+        self.assertTrue(stats["lock_wait"]["time"] >= 0.4)
+        self.assertEqual(1, stats["add_mappings"]["calls"])
+
+    def test_save(self):
+        stats_file = os.path.join(self.tank_temp, "path_cache_stats_%s.json" % id(self))
+        stats = path_cache.g_path_cache_stats
+        stats.record("get_entity", 0.5, 1)
+        stats.save(stats_file, force=True)
+        stats.record("get_entity", 0.25, 0)
+        stats.record("get_paths", 0.1, 3)
+        
+        # saves are throttled unless forced
+        stats.save(stats_file)
+        self.assertEqual({"get_entity": {"calls": 1, "time": 0.5, "rows": 1}}, 
+                         path_cache._load_stats(stats_file))
+
+        # statistics already saved aren't saved again
+        stats.save(stats_file, force=True)
+        self.assertEqual({"get_entity": {"calls": 2, "time": 0.75, "rows": 1},
+                          "get_paths": {"calls": 1, "time": 0.1, "rows": 3}}, 
+                         path_cache._load_stats(stats_file))
+
+    def test_saved_on_close(self):
+        self.path_cache.get_entity(os.path.join(self.project_root, "shot_name"))
+        with patch.object(self.tk.pipeline_configuration, "get_path_cache_stats_enabled", return_value=True):
+            with patch("tank.platform.constants.PATH_CACHE_STATS_SAVE_INTERVAL", 0):
+                self.path_cache.close()
+
+        pc = path_cache.PathCache(self.tk)
+        try:
+            self.assertEqual(1, pc.get_saved_stats()["get_entity"]["calls"])
+            pc.reset_saved_stats()
+            self.assertEqual({}, pc.get_saved_stats())
+        finally:
+            pc.close()
+
+    def test_saved_per_process(self):
+        pc = path_cache.PathCache(self.tk)
+        try:
+            stats_file = pc._get_stats_file()
+            stats = path_cache.g_path_cache_stats
+            stats.record("get_entity", 0.5, 1)
+            stats.save(stats_file, force=True)
+
+            # another process saves its own statistics to another file
+            with patch("os.getpid", return_value=os.getpid() + 1):
+                other_stats_file = pc._get_stats_file()
+            self.assertNotEqual(stats_file, other_stats_file)
+            other_stats = path_cache.PathCacheStats()
+            other_stats.record("get_entity", 0.25, 2)
+            other_stats.save(other_stats_file, force=True)
+
+            # corrupt files are ignored
+            corrupt_file = os.path.join(os.path.dirname(stats_file), constants.PATH_CACHE_STATS_FILE)
+            open(corrupt_file, "w").write("{")
+
+            self.assertEqual({"calls": 2, "time": 0.75, "rows": 3}, pc.get_saved_stats()["get_entity"])
+            pc.reset_saved_stats()
+            self.assertFalse(os.path.exists(stats_file))
+            self.assertFalse(os.path.exists(other_stats_file))
+            self.assertFalse(os.path.exists(corrupt_file))
+        finally:
+            pc.close()
+
+
+class TestGetFolderTree(TestPathCache):
+    """
+    Tests for the lookup of the folders below a folder.
+    """
+    def test_subtree(self):
+        shot_path = os.path.join(self.project_root, "seq", "shot_010")
+        paths = [shot_path,
+                 os.path.join(shot_path, "step"),
+                 os.path.join(shot_path, "step", "task"),
+                 # siblings which only share a prefix
+                 os.path.join(self.project_root, "seq", "shot_0100"),
+                 os.path.join(self.project_root, "seq", "shotX010"),
+                 os.path.join(self.project_root, "seq", "shotX010", "step")]
+        for (idx, path) in enumerate(paths):
+            add_item_to_cache(self.path_cache, {"type": "Shot", "id": idx + 1, "name": os.path.basename(path)}, path)
+
+        sg_id = self.path_cache.get_shotgun_id_from_path(shot_path)
+        tree = self.path_cache.get_folder_tree_from_sg_id(sg_id)
+        self.assertEqual(sorted(paths[:3]), sorted(x["path"] for x in tree))
+        self.assertEqual(sorted(self.path_cache.get_shotgun_id_from_path(x) for x in paths[:3]), 
+                         sorted(x["sg_id"] for x in tree))
+
+        self.assertEqual([], self.path_cache.get_folder_tree_from_sg_id(sg_id + 1000))
+
+        # databases without the index give the same results
+        self.path_cache._connection.execute("DROP INDEX path_cache_subtree")
+        self.assertEqual(sorted(tree), sorted(self.path_cache.get_folder_tree_from_sg_id(sg_id)))
+
+
 class TestGetPaths(TestPathCache):
     def test_add_and_find_shot(self):
         # add two paths to cache for a shot
@@ -400,6 +903,8 @@ class TestShotgunSync(TankTestBase):
         self.assertEqual( len(self._get_path_cache()), 2)
 
         # make a copy of the path cache at this point
+        # close the pooled connections so that the database file is complete and can be replaced
+        tank.path_cache.g_path_cache_connections.close(pcl)
         shutil.copy(pcl, "%s.snap1" % pcl) 
 
         # now insert a new path in Shotgun
@@ -415,6 +920,8 @@ class TestShotgunSync(TankTestBase):
         path_cache_contents_1 = self._get_path_cache()
         
         # now replace our path cache with snap1
+        # close the pooled connections so that the database file is complete and can be replaced
+        tank.path_cache.g_path_cache_connections.close(pcl)
         shutil.copy(pcl, "%s.snap2" % pcl) 
         shutil.copy("%s.snap1" % pcl, pcl)
         
@@ -449,6 +956,138 @@ class TestShotgunSync(TankTestBase):
         
         
         
+    @patch("tank.platform.constants.PATH_CACHE_SYNC_PAGE_SIZE", 1)
+    def test_paged_full_sync(self):
+        """Tests that a full sync downloads and commits the folders page by page."""
+        folder.process_filesystem_structure(self.tk, 
+                                            self.task["type"], 
+                                            self.task["id"], 
+                                            preview=False,
+                                            engine=None)        
+        path_cache_contents = self._get_path_cache()
+        self.assertEqual(len(path_cache_contents), 4)
+
+        progress = []
+        pc = path_cache.PathCache(self.tk)
+        try:
+            pc.synchronize(full_sync=True, progress_callback=progress.append)
+        finally:
+            pc.close()
+        
+        # one page per folder and a last empty page
+        self.assertEqual(progress, [1, 2, 3, 4, 4])
+        self.assertEqual(self._get_path_cache(), path_cache_contents)
+
+    @patch("tank.platform.constants.PATH_CACHE_SYNC_PAGE_SIZE", 1)
+    def test_resume_full_sync(self):
+        """Tests that an interrupted full sync is resumed from the last page committed."""
+        folder.process_filesystem_structure(self.tk, 
+                                            self.task["type"], 
+                                            self.task["id"], 
+                                            preview=False,
+                                            engine=None)        
+        path_cache_contents = self._get_path_cache()
+
+        def interrupt(num_records):
+            if num_records == 2:
+                raise KeyboardInterrupt()
+
+        pc = path_cache.PathCache(self.tk)
+        try:
+            self.assertRaises(KeyboardInterrupt, pc.synchronize, full_sync=True, progress_callback=interrupt)
+        finally:
+            pc.close()
+        
+        # the first two pages were committed to the staging tables, the path cache
+        # itself is left as it was
+        self.assertEqual(self._get_path_cache(), path_cache_contents)
+        pc = path_cache.PathCache(self.tk)
+        try:
+            staged = pc._connection.execute("SELECT count(*) FROM full_sync_path_cache").fetchone()[0]
+        finally:
+            pc.close()
+        self.assertEqual(2, staged)
+
+        log = sync_path_cache(self.tk)
+        self.assertTrue("Resuming the complete Shotgun folder sync" in log)
+        self.assertEqual(self._get_path_cache(), path_cache_contents)
+        
+        # the sync is complete so the next sync is an incremental one
+        log = sync_path_cache(self.tk)
+        self.assertTrue("Path cache syncing not necessary" in log)
+
+    def _get_upload_data(self, num_paths):
+        data = []
+        for idx in range(num_paths):
+            data.append({"entity": {"type": "Shot", "id": idx + 10, "name": "shot_%d" % idx},
+                         "primary": True,
+                         "metadata": {},
+                         "path": os.path.join(self.project_root, "shot_%d" % idx),
+                         "path_cache_row_id": idx + 100})
+        return data
+
+    def test_chunked_upload(self):
+        """Tests that folders are uploaded to Shotgun in several batches in parallel."""
+        data = self._get_upload_data(5)
+        
+        lock = threading.Lock()
+        batch = self.tk.shotgun.batch
+        batch_sizes = []
+        def locked_batch(requests):
+            # mockgun isn't thread-safe
+            lock.acquire()
+            try:
+                batch_sizes.append(len(requests))
+                return batch(requests)
+            finally:
+                lock.release()
+        
+        pc = path_cache.PathCache(self.tk)
+        try:
+            with patch.object(self.mockgun, "batch", side_effect=locked_batch):
+                (event_log_id, sg_id_lookup) = pc._upload_cache_data_to_shotgun(data, 
+                                                                                "test", 
+                                                                                chunk_size=2, 
+                                                                                max_workers=2)
+        finally:
+            pc.close()
+        
+        self.assertEqual(sorted(batch_sizes), [1, 2, 2])
+        
+        # the created entities are associated with the right path cache rows
+        for d in data:
+            sg_obj = self.tk.shotgun.find_one(path_cache.SHOTGUN_ENTITY, 
+                                              [["id", "is", sg_id_lookup[d["path_cache_row_id"]]]], 
+                                              [path_cache.SG_PATH_FIELD])
+            self.assertEqual(sg_obj[path_cache.SG_PATH_FIELD]["local_path"], d["path"])
+        
+        event = self.tk.shotgun.find_one("EventLogEntry", [["id", "is", event_log_id]], ["meta"])
+        self.assertEqual(sorted(event["meta"]["sg_folder_ids"]), sorted(sg_id_lookup.values()))
+
+    def test_failed_chunked_upload(self):
+        """Tests that Shotgun is left untouched when a batch fails."""
+        num_folders = len(self.tk.shotgun.find(path_cache.SHOTGUN_ENTITY, []))
+        
+        batch = self.tk.shotgun.batch
+        def failing_batch(requests):
+            if len(requests) == 1:
+                raise Exception("failed batch")
+            return batch(requests)
+        
+        pc = path_cache.PathCache(self.tk)
+        try:
+            with patch.object(self.mockgun, "batch", side_effect=failing_batch):
+                self.assertRaises(tank.TankError, 
+                                  pc._upload_cache_data_to_shotgun, 
+                                  self._get_upload_data(5), 
+                                  "test", 
+                                  chunk_size=2, 
+                                  max_workers=1)
+        finally:
+            pc.close()
+        
+        self.assertEqual(len(self.tk.shotgun.find(path_cache.SHOTGUN_ENTITY, [])), num_folders)
+
     def test_no_new_folders_created(self):
         """
         Test the case when folder creation is running for an already existing path 
@@ -503,6 +1142,8 @@ class TestShotgunSync(TankTestBase):
         self.assertEqual( len(self._get_path_cache()), 2)
                 
         # make a copy of the path cache at this point
+        # close the pooled connections so that the database file is complete and can be replaced
+        tank.path_cache.g_path_cache_connections.close(pcl)
         shutil.copy(pcl, "%s.snap1" % pcl) 
 
         # now create folders down to task level 
@@ -518,6 +1159,8 @@ class TestShotgunSync(TankTestBase):
         
         # now replace our path cache file with with snap1
         # so that we have a not-yet-up to date path cache file. 
+        # close the pooled connections so that the database file is complete and can be replaced
+        tank.path_cache.g_path_cache_connections.close(pcl)
         shutil.copy("%s.snap1" % pcl, pcl)
         self.assertEqual( len(self._get_path_cache()), 2)
         
@@ -529,6 +1172,111 @@ class TestShotgunSync(TankTestBase):
         self.assertEqual( len(self._get_path_cache()), 4)
 
 
+    def test_watermark_sync(self):
+        """Tests the incremental sync based on the highest folder id synchronized."""
+        with patch.object(self.tk.pipeline_configuration, "get_path_cache_sync_mode", return_value="watermark"):
+            
+            # the first sync records the watermark
+            sync_path_cache(self.tk, force_full_sync=True)
+            
+            path_cache = tank.path_cache.PathCache(self.tk)
+            pcl = path_cache._get_path_cache_location()
+            path_cache.close()
+            
+            folder.process_filesystem_structure(self.tk, 
+                                                self.seq["type"], 
+                                                self.seq["id"], 
+                                                preview=False,
+                                                engine=None)        
+            tank.path_cache.g_path_cache_connections.close(pcl)
+            shutil.copy(pcl, "%s.snap1" % pcl) 
+    
+            folder.process_filesystem_structure(self.tk, 
+                                                self.task["type"], 
+                                                self.task["id"], 
+                                                preview=False,
+                                                engine=None)        
+            path_cache_contents = self._get_path_cache()
+            self.assertEqual(len(path_cache_contents), 4)
+            
+            # go back to a path cache which isn't up to date
+            tank.path_cache.g_path_cache_connections.close(pcl)
+            shutil.copy("%s.snap1" % pcl, pcl)
+            self.assertEqual(len(self._get_path_cache()), 2)
+            
+            log = sync_path_cache(self.tk)
+            self.assertTrue("Fetching the folders created after id" in log)
+            self.assertFalse("Doing an incremental sync" in log)
+            self.assertEqual(self._get_path_cache(), path_cache_contents)
+            
+            log = sync_path_cache(self.tk)
+            self.assertTrue("Path cache syncing not necessary" in log)
+            
+            # deletions are detected using the event log
+            self.tk.shotgun.create("EventLogEntry", {"event_type": "Toolkit_Folders_Delete", 
+                                                     "project": self.project})
+            log = sync_path_cache(self.tk)
+            self.assertTrue("Deletions detected, doing full sync" in log)
+            self.assertEqual(self._get_path_cache(), path_cache_contents)
+
+    def test_watermark_sync_out_of_order(self):
+        """
+        Tests the watermark sync picks up folders committed after folders with greater 
+        ids were synchronized.
+        """
+        with patch.object(self.tk.pipeline_configuration, "get_path_cache_sync_mode", return_value="watermark"):
+            
+            sync_path_cache(self.tk, force_full_sync=True)
+            
+            path_cache = tank.path_cache.PathCache(self.tk)
+            pcl = path_cache._get_path_cache_location()
+            path_cache.close()
+            
+            folder.process_filesystem_structure(self.tk, 
+                                                self.seq["type"], 
+                                                self.seq["id"], 
+                                                preview=False,
+                                                engine=None)        
+            tank.path_cache.g_path_cache_connections.close(pcl)
+            shutil.copy(pcl, "%s.snap1" % pcl) 
+    
+            folder.process_filesystem_structure(self.tk, 
+                                                self.task["type"], 
+                                                self.task["id"], 
+                                                preview=False,
+                                                engine=None)        
+            path_cache_contents = self._get_path_cache()
+            self.assertEqual(len(path_cache_contents), 4)
+            
+            events = self.tk.shotgun.find("EventLogEntry", 
+                                          [["event_type", "is", "Toolkit_Folders_Create"]],
+                                          ["id", "meta"],
+                                          [{"field_name": "id", "direction": "asc"}])
+            task_folder_ids = events[-1]["meta"]["sg_folder_ids"]
+            
+            # go back to a path cache where the watermark moved past the task folders 
+            # without them being synchronized, as happens when they are committed after 
+            # folders with greater ids
+            tank.path_cache.g_path_cache_connections.close(pcl)
+            shutil.copy("%s.snap1" % pcl, pcl)
+            conn = sqlite3.connect(pcl)
+            try:
+                conn.execute("DELETE FROM sync_watermark")
+                conn.execute("INSERT INTO sync_watermark(last_shotgun_id) VALUES(?)", (max(task_folder_ids), ))
+                conn.execute("DELETE FROM event_log_sync")
+                conn.execute("INSERT INTO event_log_sync(last_id) VALUES(?)", (events[-2]["id"], ))
+                conn.commit()
+            finally:
+                conn.close()
+            self.assertEqual(len(self._get_path_cache()), 2)
+            
+            log = sync_path_cache(self.tk)
+            self.assertTrue("Fetching the folders committed out of order" in log)
+            self.assertEqual(self._get_path_cache(), path_cache_contents)
+            
+            log = sync_path_cache(self.tk)
+            self.assertTrue("Path cache syncing not necessary" in log)
+
     def test_missing_roots_mapping(self):
         """
         Tests that invalid roots.yml lookups result in ignored records 
@@ -11,10 +11,15 @@
 import copy
 import sys
 import os
+import stat
 import time
+import shutil
+
+from mock import patch
 
 import tank
 from tank import TankError
+from tank import template_cache
 from tank_test.tank_test_base import *
 from tank.template import Template, TemplatePath, TemplateString
 from tank.template import make_template_paths, make_template_strings, read_templates
@@ -276,6 +281,96 @@ class TestReadTemplates(TankTestBase):
             self.assertIn(key_name, houdini_asset_publish.keys)
 
 
+class TestTemplatesCache(TankTestBase):
+    def setUp(self):
+        super(TestTemplatesCache, self).setUp()
+        self.setup_fixtures()
+        self.templates = read_templates(self.pipeline_configuration)
+
+    @patch("tank.pipelineconfig.PipelineConfiguration.get_templates_config")
+    def test_cached(self, get_templates_config_mock):
+        """
+        Test templates are read from the cache when the templates file didn't change.
+        """
+        templates = read_templates(self.pipeline_configuration)
+        self.assertFalse(get_templates_config_mock.called)
+        self.assertEquals(set(self.templates), set(templates))
+        for name, template in self.templates.items():
+            self.assertEquals(template.definition, templates[name].definition)
+            self.assertEquals(template.keys.keys(), templates[name].keys.keys())
+        # the cached templates can be used straight away:
+        houdini_asset_publish = templates["houdini_asset_publish"]
+        path = houdini_asset_publish.apply_fields({"sg_asset_type": "Character",
+                                                   "Asset": "Tom",
+                                                   "Step": "rig",
+                                                   "name": "main",
+                                                   "version": 3})
+        self.assertEquals(3, houdini_asset_publish.get_fields(path)["version"])
+
+    def test_cache_invalidated(self):
+        """
+        Test the cache isn't used once the templates file was modified.
+        """
+        templates_file = self.pipeline_configuration.get_templates_file()
+        fh = open(templates_file, "a")
+        try:
+            fh.write("\n# a comment\n")
+        finally:
+            fh.close()
+        with patch("tank.template.make_template_paths", wraps=make_template_paths) as make_template_paths_mock:
+            templates = read_templates(self.pipeline_configuration)
+            self.assertTrue(make_template_paths_mock.called)
+        self.assertEquals(set(self.templates), set(templates))
+        # and the templates are cached again:
+        with patch("tank.template.make_template_paths") as make_template_paths_mock:
+            read_templates(self.pipeline_configuration)
+            self.assertFalse(make_template_paths_mock.called)
+
+    def test_other_platform_ignored(self):
+        """
+        Test a cache written on another platform isn't used, since its templates
+        use the other platform's roots.
+        """
+        roots = self.pipeline_configuration.get_all_platform_data_roots()
+        other_platform = "linux2" if sys.platform == "win32" else "win32"
+        cache_file = template_cache._get_cache_location(self.pipeline_configuration)
+        with patch("sys.platform", other_platform):
+            other_cache_file = template_cache._get_cache_location(self.pipeline_configuration)
+            template_cache.save_templates(self.pipeline_configuration, roots, [], self.templates)
+        # each platform has its own cache file
+        self.assertNotEquals(cache_file, other_cache_file)
+        self.assertTrue(os.path.exists(other_cache_file))
+        self.assertNotEquals(None, template_cache.load_templates(self.pipeline_configuration, roots))
+        # and a cache written for another platform is rejected even if found under
+        # this platform's name
+        shutil.copy(other_cache_file, cache_file)
+        self.assertEquals(None, template_cache.load_templates(self.pipeline_configuration, roots))
+        with patch("tank.template.make_template_paths", wraps=make_template_paths) as make_template_paths_mock:
+            templates = read_templates(self.pipeline_configuration)
+            self.assertTrue(make_template_paths_mock.called)
+        self.assertEquals(self.project_root,
+                          templates["houdini_asset_publish"].root_path)
+
+    def test_untrusted_cache_ignored(self):
+        """
+        Test a cache which could have been written by another user is never unpickled.
+        """
+        if sys.platform == "win32":
+            # file ownership isn't checked on windows
+            return
+        roots = self.pipeline_configuration.get_all_platform_data_roots()
+        cache_file = template_cache._get_cache_location(self.pipeline_configuration)
+        # the cache is written with the default permissions
+        self.assertFalse(os.stat(cache_file).st_mode & (stat.S_IWGRP | stat.S_IWOTH))
+        self.assertNotEquals(None, template_cache.load_templates(self.pipeline_configuration, roots))
+        # owned by another user
+        with patch("os.getuid", return_value=os.getuid() + 1):
+            self.assertEquals(None, template_cache.load_templates(self.pipeline_configuration, roots))
+        # writable by other users
+        os.chmod(cache_file, 0666)
+        self.assertEquals(None, template_cache.load_templates(self.pipeline_configuration, roots))
+
+
 class TestMakeTemplatePaths(TankTestBase):
     def setUp(self):
         super(TestMakeTemplatePaths, self).setUp()
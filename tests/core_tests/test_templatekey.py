@@ -18,6 +18,8 @@ from tank import TankError
 import copy
 import datetime
 import time
+import cPickle as pickle
+import threading
 from mock import patch
 from tank_test.tank_test_base import *
 from tank.templatekey import TemplateKey, StringKey, IntegerKey, SequenceKey, TimestampKey, make_keys
@@ -58,6 +60,19 @@ class TestStringKey(TankTestBase):
         self.assertFalse(template_field.validate("a"))
         self.assertFalse(template_field.validate("b"))
 
+    def test_last_error_per_thread(self):
+        """Errors reported by validate in one thread should not be visible from other threads."""
+        self.assertFalse(self.choice_field.validate("c"))
+        errors = []
+        def worker():
+            self.assertFalse(self.choice_field.validate("d"))
+            errors.append(self.choice_field._last_error)
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        self.assertIn("'d'", errors[0])
+        self.assertIn("'c'", self.choice_field._last_error)
+
     def test_illegal_choice_alphanumic(self):
         choices_value = ["@", "b"]
         self.assertRaises(TankError,
@@ -1017,6 +1032,17 @@ class TestTimestampKey(TankTestBase):
         # Convert to a string and compare the result.
         self.assertEqual(key.str_from_value(None), self._datetime_string)
 
+    @patch("tank.templatekey.TimestampKey._TimestampKey__get_current_time")
+    def test_pickle_now_default_value(self, _get_time_mock):
+        """
+        Makes sure that the now default value survives pickling.
+        """
+        _get_time_mock.return_value = self._datetime
+        key = pickle.loads(pickle.dumps(TimestampKey("datetime", default="now"), pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(key.str_from_value(None), self._datetime_string)
+        self.assertFalse(key.validate(1))
+        self.assertTrue(key._last_error.startswith("Invalid type"))
+
     def test_string_default_value(self):
         """
         Makes sure that a default value is proprely generated when a string default
@@ -11,11 +11,15 @@
 
 import sys
 import os
+import re
+import random
+import threading
 
 import tank
 from tank import TankError
+from tank.platform import constants
 
-from tank.template import TemplatePath
+from tank.template import TemplatePath, TemplateString
 from tank_test.tank_test_base import *
 from tank.templatekey import (TemplateKey, StringKey, IntegerKey, 
                                 SequenceKey)
@@ -589,6 +593,83 @@ class TestApplyFields(TestTemplatePath):
         self.assertEquals(expected, template.apply_fields(fields))
 
 
+class TestApplyFieldsBatch(TestTemplatePath):
+
+    def setUp(self):
+        super(TestApplyFieldsBatch, self).setUp()
+        definition = "shots/{Shot}[.{branch}].v{version}.{frame}.ext"
+        self.template = TemplatePath(definition, self.keys, self.project_root)
+        self.fields = {"Shot": "s1", "branch": "loon", "version": 3}
+
+    def test_batch(self):
+        fields_list = []
+        for frame in range(1, 4):
+            fields_list.append(dict(self.fields, frame=frame))
+        fields_list.append({"version": 1, "frame": 1})
+        fields_list.append({"Shot": "s2", "branch": None, "version": 2, "frame": "FORMAT:#"})
+        expected = [self.template.apply_fields(fields) for fields in fields_list]
+        self.assertEquals(expected, self.template.apply_fields_batch(fields_list))
+        self.assertEquals(os.path.join(self.project_root, "shots", "s1.v001.0001.ext"), expected[3])
+
+    def test_batch_platform(self):
+        fields_list = [dict(self.fields, frame=1), dict(self.fields, frame=2)]
+        expected = [self.template_path.apply_fields(dict(fields, Sequence="seq_1", Step="Anm", snapshot=2), 
+                                                    "win32") for fields in fields_list]
+        fields_list = [dict(fields, Sequence="seq_1", Step="Anm", snapshot=2) for fields in fields_list]
+        self.assertEquals(expected, self.template_path.apply_fields_batch(fields_list, "win32"))
+
+    def test_batch_invalid(self):
+        fields_list = [dict(self.fields, frame=1), dict(self.fields, frame="x")]
+        self.assertRaises(TankError, self.template.apply_fields_batch, fields_list)
+        self.assertRaises(TankError, self.template.apply_fields_batch, [{"frame": 1}])
+
+    def test_product(self):
+        varying = {"frame": range(1, 4), "version": [1, 2]}
+        expected = []
+        # keys are combined in alphabetical order
+        for frame in range(1, 4):
+            for version in [1, 2]:
+                expected.append(self.template.apply_fields(dict(self.fields, frame=frame, version=version)))
+        self.assertEquals(expected, self.template.apply_fields_product(self.fields, varying))
+
+    def test_product_optional(self):
+        # the optional key is left out for all the paths
+        base_fields = {"Shot": "s1", "version": 3}
+        expected = [os.path.join(self.project_root, "shots", "s1.v003.%04d.ext" % frame) for frame in [1, 2]]
+        self.assertEquals(expected, self.template.apply_fields_product(base_fields, {"frame": [1, 2]}))
+        # or only for some of them
+        expected = [self.template.apply_fields(dict(base_fields, frame=1, branch=branch)) 
+                    for branch in ["a", None]]
+        self.assertEquals(expected, self.template.apply_fields_product(dict(base_fields, frame=1), 
+                                                                       {"branch": ["a", None]}))
+
+    def test_product_empty(self):
+        self.assertEquals([], self.template.apply_fields_product(self.fields, {"frame": []}))
+        self.assertEquals([self.template.apply_fields(dict(self.fields, frame=2))], 
+                          self.template.apply_fields_product(dict(self.fields, frame=2), {}))
+
+    def test_product_invalid(self):
+        self.assertRaises(TankError, self.template.apply_fields_product, self.fields, {"frame": [1, "x"]})
+        self.assertRaises(TankError, self.template.apply_fields_product, {"branch": "a"}, {"frame": [1]})
+
+    def test_product_repeated_keys(self):
+        keys = dict(self.keys, Shot=StringKey("Shot"))
+        template = TemplatePath("shots/{Shot}/{Shot}.v{version}.{frame}.ext", keys, self.project_root)
+        varying = {"Shot": ["s1", "s%2"], "frame": [1, "FORMAT:#"]}
+        expected = []
+        for shot in varying["Shot"]:
+            for frame in varying["frame"]:
+                expected.append(template.apply_fields({"Shot": shot, "version": 3, "frame": frame}))
+        self.assertEquals(expected, template.apply_fields_product({"version": 3}, varying))
+
+    def test_product_validated(self):
+        keys = dict(self.keys, version=IntegerKey("version", format_spec="03", choices=[1, 2]))
+        template = TemplatePath("shots/{Shot}.v{version}.ext", keys, self.project_root)
+        self.assertEquals([os.path.join(self.project_root, "shots", "s1.v002.ext")],
+                          template.apply_fields_product({"Shot": "s1"}, {"version": [2]}))
+        self.assertRaises(TankError, template.apply_fields_product, {"Shot": "s1"}, {"version": [1, 3]})
+
+
 class Test_ApplyFields(TestTemplatePath):
     """Tests for private TemplatePath._apply_fields"""
     def test_skip_enum(self):
@@ -958,6 +1039,276 @@ class TestGetFields(TestTemplatePath):
         self.assertRaises(TankError, template.get_fields, input_path)
 
 
+class TestGetFieldsBatch(TestTemplatePath):
+    """Tests for TemplatePath.get_fields_batch"""
+    def setUp(self):
+        super(TestGetFieldsBatch, self).setUp()
+        work_dir = os.path.join(self.project_root, "shots", "seq_1", "shot_1", "Anm", "work")
+        self.paths = [os.path.join(work_dir, "shot_1.mmm.v001.002.ma"),
+                      os.path.join(work_dir, "shot_1.mmm.v002.002.ma"),
+                      os.path.join(work_dir, "shot_2.mmm.v002.002.ma"),
+                      os.path.join(work_dir, "shot_1.mmm.v002.002.nk"),
+                      os.path.join(work_dir, "shot_1.mmm.v003.###.ma"),
+                      os.path.join(work_dir + os.path.sep, "shot_1.nnn.v004.003.ma"),
+                      os.path.join(self.project_root, "shots", "seq_2", "shot_1", "Anm", "work", "shot_1.mmm.v001.002.ma"),
+                      os.path.join(self.project_root, "shots", "seq_1", "shot_1", "Anm", "publish", "shot_1.mmm.v001.002.ma"),
+                      work_dir]
+
+    def _get_fields(self, template, path, skip_keys=None):
+        try:
+            return template.get_fields(path, skip_keys=skip_keys)
+        except TankError:
+            return None
+
+    def test_same_as_get_fields(self):
+        result = self.template_path.get_fields_batch(self.paths)
+        self.assertEqual(set(self.paths), set(result))
+        for path in self.paths:
+            self.assertEqual(self._get_fields(self.template_path, path), result[path])
+        self.assertEqual(4, len([f for f in result.values() if f is not None]))
+
+    def test_skip_keys(self):
+        result = self.template_path.get_fields_batch(self.paths, skip_keys=["snapshot"])
+        for path in self.paths:
+            self.assertEqual(self._get_fields(self.template_path, path, skip_keys=["snapshot"]), result[path])
+
+    def test_sequence(self):
+        paths = [os.path.join("path", "to", "seq.%04d.ext" % frame) for frame in range(1, 100)]
+        paths.append(os.path.join("path", "to", "seq.0001.other"))
+        result = self.sequence.get_fields_batch(paths)
+        for frame, path in enumerate(paths[:-1]):
+            self.assertEqual({"frame": frame + 1}, result[path])
+        self.assertIsNone(result[paths[-1]])
+
+    def test_template_string(self):
+        template = TemplateString("{Shot}.{branch}", self.keys)
+        result = template.get_fields_batch(["shot_1.main", "shot_1", "shot_1.ma_in"])
+        self.assertEqual({"Shot": "shot_1", "branch": "main"}, result["shot_1.main"])
+        self.assertIsNone(result["shot_1"])
+        self.assertIsNone(result["shot_1.ma_in"])
+
+
+class TestCompiledParser(TestTemplatePath):
+    """Differential tests checking that the compiled parser behaves like the backtracking parser"""
+    def setUp(self):
+        super(TestCompiledParser, self).setUp()
+        self.keys.update({"alpha": StringKey("alpha", filter_by="alpha"),
+                          "number": IntegerKey("number"),
+                          "padded": IntegerKey("padded", format_spec="04", strict_matching=False),
+                          "udim": SequenceKey("udim", format_spec="04"),
+                          "eye": StringKey("eye", choices=["left", "right"]),
+                          "fixed": StringKey("fixed", filter_by="alphanumeric", length=3)})
+        self.definitions = [self.definition,
+                            "shots/{Sequence}/{Shot}/{Step}/work",
+                            "shots/{branch}_{alpha}/v{version}/{name}.{frame}.exr",
+                            "shots/{Shot}/{name}_v{version}.{seq_num}.{ext}",
+                            "assets/{alpha}_{number}/{branch}-{padded}.{udim}.tif",
+                            "images/{eye}/{fixed}.{version}[.{frame}].exr",
+                            "{Shot}/{Step}/{name}.ma",
+                            "sequences/{Sequence}/{Shot}_{Step}/v{version}"]
+
+    def _random_value(self, rnd):
+        chars = ["a", "B", "3", "0", "_", ".", "-", "v", "#", "%", "d", " ", "@", "$", "F", os.path.sep]
+        values = ["shot_1", "s1", "left", "abc", "Anm", "001", "1001", "0001", "%04d", "####",
+                  "$F4", "<UDIM>", "[1001-1100]", "ma", "exr", "v001", "1", " 12"]
+        if rnd.random() < 0.6:
+            return rnd.choice(values)
+        return "".join(rnd.choice(chars) for _ in range(rnd.randint(1, 6)))
+
+    def _random_paths(self, template, rnd, count):
+        paths = []
+        for _ in range(count):
+            definition = rnd.choice(template._definitions)
+            parts = re.split("{(%s)}" % constants.TEMPLATE_KEY_NAME_REGEX, definition)
+            path = ""
+            for index, part in enumerate(parts):
+                if index % 2:
+                    path += self._random_value(rnd)
+                elif rnd.random() < 0.05:
+                    path += part.upper()
+                else:
+                    path += part
+            if rnd.random() < 0.1:
+                path = path[:rnd.randint(0, len(path))]
+            paths.append(os.path.join(self.project_root, path))
+        return paths
+
+    def _parse(self, template, path, skip_keys=None):
+        try:
+            return template.get_fields(path, skip_keys=skip_keys)
+        except TankError:
+            return None
+
+    def test_differential(self):
+        rnd = random.Random(1234)
+        num_compiled = 0
+        for definition in self.definitions:
+            backtracking = TemplatePath(definition, self.keys, self.project_root)
+            compiled = TemplatePath(definition, self.keys, self.project_root, parser="compiled")
+            paths = self._random_paths(backtracking, rnd, 300)
+            # include some valid paths:
+            for _ in range(20):
+                fields = dict((name, key.default) for name, key in backtracking.keys.items())
+                fields.update({"Sequence": "seq_%d" % rnd.randint(0, 9), "Step": "Anm", "branch": "main", 
+                               "name": rnd.choice(["foo", "foo_bar", "foo.bar"]), "version": rnd.randint(0, 1000), 
+                               "snapshot": 2, "alpha": "abc", "number": rnd.randint(0, 100), 
+                               "padded": rnd.randint(0, 100), "eye": "left", "fixed": "a1b", "ext": "ma",
+                               "frame": rnd.randint(0, 2000), "seq_num": rnd.randint(0, 2000),
+                               "udim": rnd.randint(1001, 1010)})
+                paths.append(backtracking.apply_fields(fields))
+
+            num_matches = 0
+            for path in paths:
+                expected = self._parse(backtracking, path)
+                self.assertEqual(expected, self._parse(compiled, path), "%s: %s" % (definition, path))
+                self.assertEqual(self._parse(backtracking, path, ["version"]), 
+                                 self._parse(compiled, path, ["version"]))
+                if expected is not None:
+                    num_matches += 1
+            self.assertTrue(num_matches >= 20)
+            num_compiled += len([p for p in compiled._compiled_patterns if p])
+
+        # make sure the compiled parser was actually used for most definitions:
+        self.assertTrue(num_compiled >= 4)
+
+    def test_ambiguous_not_compiled(self):
+        template = TemplatePath("{Sequence}_{name}/{Step}", self.keys, self.project_root, parser="compiled")
+        path = os.path.join(self.project_root, "seq_1_foo", "Anm")
+        self.assertRaises(TankError, template.get_fields, path)
+        self.assertEqual([False], template._compiled_patterns)
+
+    def test_unknown_parser(self):
+        self.assertRaises(TankError, TemplatePath, self.definition, self.keys, self.project_root, parser="foo")
+
+    def test_parent_parser(self):
+        template = TemplatePath(self.definition, self.keys, self.project_root, parser="compiled")
+        self.assertEqual("compiled", template.parent._parser)
+
+
+class TestFieldsCache(TestTemplatePath):
+    """Tests for the cache of fields extracted from paths."""
+    def setUp(self):
+        super(TestFieldsCache, self).setUp()
+        relative_path = os.path.join("shots", "seq_1", "s1", "Anm", "work", "s1.mmm.v003.002.ma")
+        self.valid_path = os.path.join(self.project_root, relative_path)
+
+    def test_hits(self):
+        expected = self.template_path.get_fields(self.valid_path)
+        self.assertTrue(self.template_path.validate(self.valid_path))
+        self.assertEqual(expected, self.template_path.get_fields(self.valid_path))
+        cache_info = self.template_path.cache_info
+        self.assertEqual(1, cache_info["misses"])
+        self.assertEqual(2, cache_info["hits"])
+        self.assertEqual(1, cache_info["size"])
+
+    def test_copy(self):
+        fields = self.template_path.get_fields(self.valid_path)
+        fields["Shot"] = "modified"
+        self.assertEqual("s1", self.template_path.get_fields(self.valid_path)["Shot"])
+
+    def test_skip_keys(self):
+        self.template_path.get_fields(self.valid_path)
+        fields = self.template_path.get_fields(self.valid_path, skip_keys=["Shot"])
+        self.assertNotIn("Shot", fields)
+        self.assertEqual(2, self.template_path.cache_info["misses"])
+
+    def test_failure(self):
+        bad_path = os.path.join(self.project_root, "shots", "seq_1")
+        self.assertRaises(TankError, self.template_path.get_fields, bad_path)
+        self.assertRaises(TankError, self.template_path.get_fields, bad_path)
+        self.assertEqual(1, self.template_path.cache_info["hits"])
+
+    def test_eviction(self):
+        template = TemplatePath(self.definition, self.keys, self.project_root, cache_size=2)
+        paths = [self.valid_path.replace("v003", "v%03d" % v) for v in range(3)]
+        for path in paths:
+            template.get_fields(path)
+        template.get_fields(paths[0])
+        self.assertEqual(2, template.cache_info["size"])
+        self.assertEqual(0, template.cache_info["hits"])
+        template.get_fields(paths[2])
+        self.assertEqual(1, template.cache_info["hits"])
+
+    def test_disabled(self):
+        template = TemplatePath(self.definition, self.keys, self.project_root, cache_size=0)
+        template.get_fields(self.valid_path)
+        template.get_fields(self.valid_path)
+        self.assertEqual(0, template.cache_info["size"])
+        self.assertEqual(0, template.cache_info["hits"])
+
+    def test_invalid_size(self):
+        self.assertRaises(TankError, TemplatePath, self.definition, self.keys, self.project_root, cache_size=-1)
+        self.assertRaises(TankError, TemplatePath, self.definition, self.keys, self.project_root, cache_size="big")
+
+    def test_clear(self):
+        self.template_path.get_fields(self.valid_path)
+        self.template_path.clear_cache()
+        self.assertEqual(0, self.template_path.cache_info["size"])
+        self.assertEqual(0, self.template_path.cache_info["misses"])
+
+
+class TestParse(TestTemplatePath):
+    """Tests for the parse method which returns the fields or the error found."""
+    def test_valid(self):
+        relative_path = os.path.join("shots", "seq_1", "s1", "Anm", "work", "s1.mmm.v003.002.ma")
+        valid_path = os.path.join(self.project_root, relative_path)
+        result = self.template_path.parse(valid_path)
+        self.assertTrue(result)
+        self.assertIsNone(result.error)
+        self.assertEqual(self.template_path.get_fields(valid_path), result.fields)
+
+    def test_invalid(self):
+        invalid_path = os.path.join(self.project_root, "shots", "seq_1", "s1", "Anm", "work", "s1.mmm.v003.ma")
+        result = self.template_path.parse(invalid_path)
+        self.assertFalse(result)
+        self.assertIsNone(result.fields)
+        self.assertIn(invalid_path, result.error)
+
+    def test_threads(self):
+        """Errors reported when parsing concurrently should belong to the path being parsed."""
+        template = TemplatePath("{Shot}/work/v{version}", self.keys, self.project_root, cache_size=0)
+        failures = []
+        def worker(shot, version):
+            path = os.path.join(self.project_root, shot, "work", "v%s" % version)
+            for _ in range(200):
+                result = template.parse(path)
+                if shot in self.keys["Shot"].choices:
+                    if result.fields != {"Shot": shot, "version": int(version)}:
+                        failures.append((path, result))
+                elif result or shot not in result.error:
+                    failures.append((path, result))
+        threads = [threading.Thread(target=worker, args=args) 
+                   for args in [("s1", "001"), ("s2", "002"), ("bad_a", "003"), ("bad_b", "004")]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], failures)
+
+
+class TestValidatePathComponent(TestTemplatePath):
+    """Tests for the validation of path components used to prune file system searches."""
+    def test_single_key(self):
+        template = TemplatePath("{Shot}/v{version}/{name}.ma", self.keys, self.project_root)
+        self.assertTrue(template._validate_path_component(os.path.join(self.project_root, "s1")))
+        self.assertFalse(template._validate_path_component(os.path.join(self.project_root, "s3")))
+        self.assertTrue(template._validate_path_component(os.path.join(self.project_root, "s1", "V001")))
+        self.assertFalse(template._validate_path_component(os.path.join(self.project_root, "s1", "v0a1")))
+        self.assertFalse(template._validate_path_component(os.path.join(self.project_root, "s1", "001")))
+        self.assertFalse(template._validate_path_component(os.path.join(self.project_root, "s1", "v")))
+        self.assertTrue(template._validate_path_component(os.path.join(self.project_root, "s1", "v001", "x.MA")))
+        self.assertFalse(template._validate_path_component(os.path.join(self.project_root, "s1", "v001", "x.mb")))
+        # deeper paths and paths outside the root aren't checked:
+        self.assertTrue(template._validate_path_component(os.path.join(self.project_root, "s1", "v001", "a", "b")))
+        self.assertTrue(template._validate_path_component(os.path.join(self.project_root + "_other", "s3")))
+
+    def test_optional_folder(self):
+        """Components which depend on the optional keys used shouldn't be checked."""
+        template = TemplatePath("[{Sequence}/]{Shot}/v{version}", self.keys, self.project_root)
+        self.assertTrue(template._validate_path_component(os.path.join(self.project_root, "s3")))
+        self.assertTrue(template._validate_path_component(os.path.join(self.project_root, "s1", "v0a1")))
+
+
 class TestGetKeysSepInValue(TestTemplatePath):
     """Tests for cases where seperator used between keys is used in value for keys."""
     def setUp(self):
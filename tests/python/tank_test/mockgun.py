@@ -464,6 +464,14 @@ class Shotgun(object):
             
         results = [row for row in self._db[entity_type].values() if self._row_matches_filters(entity_type, row, resolved_filters_2, filter_operator, retired_only)]
         
+        # sort on the last order field first so that the first field takes precedence
+        for o in reversed(order or []):
+            results.sort(key=lambda row: self._get_field_from_row(entity_type, row, o["field_name"]),
+                         reverse=(o.get("direction") == "desc"))
+        
+        if limit:
+            results = results[:limit]
+        
         if fields is None:
             fields = set(["type", "id"])
         else:
@@ -262,6 +262,8 @@ class TankTestBase(unittest.TestCase):
         pc = path_cache.PathCache(self.tk)
         path_cache_file = pc._get_path_cache_location()
         pc.close()
+        # pooled connections keep the file open
+        path_cache.g_path_cache_connections.close(path_cache_file)
         if os.path.exists(path_cache_file):
             os.remove(path_cache_file)
             
@@ -0,0 +1,94 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+# 
+# CONFIDENTIAL AND PROPRIETARY
+# 
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit 
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your 
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights 
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import threading
+
+from sgtk.util.lru_cache import LRUCache
+from tank_test.tank_test_base import *
+
+class TestLRUCache(TankTestBase):
+    """
+    Tests to ensure that the LRUCache behaves correctly
+    """
+
+    def test_eviction(self):
+        """
+        Test that the least recently used item is evicted when the cache is full
+        """
+        cache = LRUCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        # a is now more recently used than b:
+        self.assertEquals(1, cache.get("a"))
+        cache.set("c", 3)
+        self.assertEquals(2, len(cache))
+        self.assertEquals(None, cache.get("b"))
+        self.assertEquals(1, cache.get("a"))
+        self.assertEquals(3, cache.get("c"))
+        self.assertEquals(3, cache.hits)
+        self.assertEquals(1, cache.misses)
+
+    def test_disabled(self):
+        """
+        Test that nothing is stored in a cache of size 0
+        """
+        cache = LRUCache(0)
+        cache.set("a", 1)
+        self.assertEquals(0, len(cache))
+        self.assertEquals("default", cache.get("a", "default"))
+
+    def test_threads(self):
+        """
+        Test that the cache never grows past its maximum size when used from
+        several threads
+        """
+        cache = LRUCache(10)
+        def worker(offset):
+            for i in range(1000):
+                cache.set(offset + i % 20, i)
+                cache.get(offset + (i + 1) % 20)
+        threads = [threading.Thread(target=worker, args=(t * 100,)) for t in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(10, len(cache))
+        self.assertEquals(4000, cache.hits + cache.misses)
+
+    def test_update(self):
+        """
+        Test that updating an item marks it as the most recently used
+        """
+        cache = LRUCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.set("a", 10)
+        cache.set("c", 3)
+        self.assertEquals(None, cache.get("b"))
+        self.assertEquals(10, cache.get("a"))
+        cache.clear()
+        self.assertEquals(0, len(cache))
+        cache.set("d", 4)
+        self.assertEquals(4, cache.get("d"))
+
+    def test_remove(self):
+        """
+        Test that removed items are gone and don't count towards the size of the cache
+        """
+        cache = LRUCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.remove("a")
+        cache.remove("missing")
+        self.assertEquals(1, len(cache))
+        self.assertEquals(None, cache.get("a"))
+        cache.set("c", 3)
+        self.assertEquals(2, cache.get("b"))
+        self.assertEquals(3, cache.get("c"))
@@ -0,0 +1,92 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+# 
+# CONFIDENTIAL AND PROPRIETARY
+# 
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit 
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your 
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights 
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import glob
+import tempfile
+
+from sgtk.util import parallel_glob
+from tank_test.tank_test_base import *
+
+class TestParallelGlob(TankTestBase):
+    """
+    Tests to ensure that parallel_glob finds the same paths as glob
+    """
+
+    def setUp(self):
+        super(TestParallelGlob, self).setUp()
+        self.root = tempfile.mkdtemp(dir=self.tank_temp)
+        for shot in ["shot_010", "shot_020", ".hidden", "other"]:
+            for version in ["v001", "v002", "work"]:
+                folder = os.path.join(self.root, shot, version)
+                for frame in range(3):
+                    self.create_file(os.path.join(folder, "%s.%04d.exr" % (shot, frame)))
+        self.create_file(os.path.join(self.root, "shot_030"))
+
+    def assert_same_as_glob(self, patterns, **kwargs):
+        expected = set()
+        for pattern in patterns:
+            expected.update(glob.iglob(pattern))
+        result = list(parallel_glob.iglob(patterns, **kwargs))
+        self.assertEquals(len(result), len(set(result)))
+        self.assertEquals(expected, set(result))
+        return result
+
+    def test_patterns(self):
+        """
+        Test that each pattern finds the same paths as glob, from the calling thread
+        and from worker threads
+        """
+        patterns = [os.path.join(self.root, "*", "*", "*.exr"),
+                    os.path.join(self.root, "shot_*", "v00[12]", "*.0001.exr"),
+                    os.path.join(self.root, ".*", "work", "*"),
+                    os.path.join(self.root, "*", "v001", "shot_010.0000.exr"),
+                    os.path.join(self.root, "shot_0?0", "*"),
+                    os.path.join(self.root, "shot_*", ""),
+                    os.path.join(self.root, "shot_010", "v001"),
+                    os.path.join(self.root, "missing", "*"),
+                    os.path.join(self.root, "shot_030", "*")]
+        for pattern in patterns:
+            for max_workers in [1, 4]:
+                self.assert_same_as_glob([pattern], max_workers=max_workers)
+
+    def test_shared_walk(self):
+        """
+        Test that overlapping patterns only return each path once
+        """
+        patterns = [os.path.join(self.root, "*", "v001", "*"),
+                    os.path.join(self.root, "shot_010", "*", "*"),
+                    os.path.join(self.root, "shot_010", "v001", "*")]
+        result = self.assert_same_as_glob(patterns, max_workers=4)
+        self.assertEquals(15, len(result))
+
+    def test_accept(self):
+        """
+        Test that paths rejected by the accept callable are pruned from the walk
+        """
+        checked = []
+        def accept(path):
+            checked.append(path)
+            return os.path.basename(path) != "shot_020"
+        pattern = os.path.join(self.root, "*", "*", "*")
+        result = list(parallel_glob.iglob([pattern], accept=accept, max_workers=4))
+        self.assertEquals(set(glob.glob(pattern.replace("*", "[!s]*", 1)) + 
+                              glob.glob(os.path.join(self.root, "shot_010", "*", "*"))), 
+                          set(result))
+        self.assertNotIn(os.path.join(self.root, "shot_020", "v001"), checked)
+
+    def test_early_stop(self):
+        """
+        Test that iteration can be stopped before the walk is complete
+        """
+        paths = parallel_glob.iglob([os.path.join(self.root, "*", "*", "*")], max_workers=4)
+        first_path = paths.next()
+        paths.close()
+        self.assertTrue(os.path.exists(first_path))